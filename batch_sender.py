@@ -0,0 +1,58 @@
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from throttle import AsyncRateLimiter
+
+# Сколько раз повторять вызов, на который Telegram ответил RetryAfter
+BATCH_RETRY_LIMIT = 3
+
+ProgressCallback = Callable[[Dict[str, int]], Awaitable[None]]
+
+async def send_batch(items: Iterable[Any], action: Callable[[Any], Awaitable[Any]],
+                     limiter: AsyncRateLimiter, on_progress: Optional[ProgressCallback] = None,
+                     progress_interval: float = 3.0) -> Dict[str, int]:
+    """Выполняет action для каждого элемента с ограничением частоты
+
+    RetryAfter притормаживает весь ограничитель и повторяет вызов; сообщения,
+    которые уже нельзя изменить (BadRequest/Forbidden), считаются пропущенными.
+    on_progress вызывается не чаще раза в progress_interval секунд и в конце;
+    получает счетчики done/skipped/failed/total.
+    """
+    items = list(items)
+    progress = {'done': 0, 'skipped': 0, 'failed': 0, 'total': len(items)}
+    reported_at = time.monotonic()
+
+    for item in items:
+        for _ in range(BATCH_RETRY_LIMIT):
+            await limiter.acquire()
+            try:
+                await action(item)
+                progress['done'] += 1
+            except TelegramRetryAfter as e:
+                limiter.pause(e.retry_after)
+                continue
+            except (TelegramBadRequest, TelegramForbiddenError):
+                progress['skipped'] += 1
+            except Exception as e:
+                logging.warning(f"Ошибка пакетной операции: {e}")
+                progress['failed'] += 1
+            break
+        else:
+            progress['failed'] += 1
+
+        if on_progress is not None and time.monotonic() - reported_at >= progress_interval:
+            reported_at = time.monotonic()
+            await _report(on_progress, progress)
+
+    if on_progress is not None:
+        await _report(on_progress, progress)
+    return progress
+
+async def _report(on_progress: ProgressCallback, progress: Dict[str, int]):
+    try:
+        await on_progress(dict(progress))
+    except Exception as e:
+        logging.warning(f"Не удалось обновить прогресс пакетной операции: {e}")
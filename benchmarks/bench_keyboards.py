@@ -0,0 +1,66 @@
+"""Микробенчмарк клавиатур: построение на каждый ответ против кэша
+
+Запуск из корня проекта: python benchmarks/bench_keyboards.py
+"""
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import keyboards
+
+N = 20000
+
+def allocated_per_call(func, calls: int = 1000) -> float:
+    """Средний объем памяти, выделяемой за один вызов"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    keep = [func() for _ in range(calls)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    del keep
+    return sum(stat.size_diff for stat in after.compare_to(before, 'filename')) / calls
+
+def report(name: str, fresh, cached):
+    fresh_time = timeit.timeit(fresh, number=N) / N * 1e6
+    cached_time = timeit.timeit(cached, number=N) / N * 1e6
+    print(f"{name}")
+    print(f"  построение:  {fresh_time:8.2f} мкс, {allocated_per_call(fresh):9.0f} Б/вызов")
+    print(f"  из кэша:     {cached_time:8.2f} мкс, {allocated_per_call(cached):9.0f} Б/вызов")
+
+def main():
+    report(
+        "get_admin_keyboard",
+        keyboards._build_admin_keyboard,
+        keyboards.get_admin_keyboard
+    )
+    report(
+        "get_user_keyboard",
+        keyboards._build_user_keyboard,
+        keyboards.get_user_keyboard
+    )
+    report(
+        "get_payment_confirmation_keyboard",
+        lambda: keyboards.get_payment_confirmation_keyboard.__wrapped__(123456789),
+        lambda: keyboards.get_payment_confirmation_keyboard(123456789)
+    )
+    report(
+        "get_admin_payment_confirmation_keyboard",
+        lambda: keyboards.get_admin_payment_confirmation_keyboard.__wrapped__(987654321),
+        lambda: keyboards.get_admin_payment_confirmation_keyboard(987654321)
+    )
+
+    # Сериализация: aiogram выполняет ее при каждой отправке
+    markup = keyboards.get_admin_keyboard()
+    serialize_time = timeit.timeit(lambda: markup.model_dump_json(exclude_none=True), number=N) / N * 1e6
+    build_and_serialize = timeit.timeit(
+        lambda: keyboards._build_admin_keyboard().model_dump_json(exclude_none=True), number=N
+    ) / N * 1e6
+    print("Сериализация get_admin_keyboard")
+    print(f"  построение + сериализация: {build_and_serialize:8.2f} мкс")
+    print(f"  кэш + сериализация:        {serialize_time:8.2f} мкс")
+
+if __name__ == "__main__":
+    main()
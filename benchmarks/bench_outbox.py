@@ -0,0 +1,101 @@
+"""Бенчмарк очереди исходящих сообщений на поддельном API с отказами
+
+Поддельный Telegram отвечает с задержкой, случайно теряет часть запросов и
+периодически «падает» целиком. Сравниваются прямая отправка по одному
+сообщению (как раньше в send_payment_reminder) и разбор outbox пачками с
+повторами. Запуск из корня проекта: python benchmarks/bench_outbox.py
+"""
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import outbox
+import queries
+from throttle import AsyncRateLimiter
+
+MESSAGES = 2000
+LATENCY = 0.02
+FAILURE_RATE = 0.1
+# Каждые OUTAGE_PERIOD секунд API недоступен OUTAGE_LENGTH секунд
+OUTAGE_PERIOD = 2.0
+OUTAGE_LENGTH = 0.5
+
+class FakeMessage:
+    def __init__(self, message_id):
+        self.message_id = message_id
+
+class FakeBot:
+    """Поддельный API: задержка, случайные отказы и периодические простои"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.calls = 0
+        self.delivered = set()
+
+    async def send_message(self, chat_id, text, reply_markup=None, parse_mode=None):
+        self.calls += 1
+        await asyncio.sleep(LATENCY)
+        elapsed = time.monotonic() - self.started
+        if elapsed % OUTAGE_PERIOD < OUTAGE_LENGTH:
+            raise ConnectionError("API недоступен")
+        if random.random() < FAILURE_RATE:
+            raise ConnectionError("Соединение сброшено")
+        self.delivered.add(chat_id)
+        return FakeMessage(self.calls)
+
+async def direct(count):
+    """Старый способ: по одному сообщению, без повторов"""
+    bot = FakeBot()
+    started = time.perf_counter()
+    for chat_id in range(count):
+        try:
+            await bot.send_message(chat_id, "Напоминание")
+        except ConnectionError:
+            pass
+    return time.perf_counter() - started, len(bot.delivered), bot.calls
+
+async def drained(count):
+    """Новый способ: outbox, пачки и экспоненциальные повторы"""
+    conn = queries.get_db_connection()
+    cursor = conn.cursor()
+    outbox.create_tables(cursor)
+    cursor.execute('DELETE FROM outbox')
+    cursor.execute('DELETE FROM outbox_dead')
+    for chat_id in range(count):
+        outbox.enqueue(cursor, 'reminder', chat_id, "Напоминание")
+    conn.commit()
+    conn.close()
+
+    bot = FakeBot()
+    started = time.perf_counter()
+    while outbox.get_outbox_stats()['queued']:
+        if not await outbox.drain_once(bot):
+            await asyncio.sleep(0.01)
+    return time.perf_counter() - started, len(bot.delivered), bot.calls
+
+def main():
+    random.seed(1)
+    queries.DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench_outbox.db')
+
+    # Масштаб бенчмарка: частота не ограничена лимитом Telegram, повторы быстрые
+    outbox._limiter = AsyncRateLimiter(2000)
+    outbox.OUTBOX_BACKOFF_BASE = 0.05
+    outbox.OUTBOX_BACKOFF_MAX = 1.0
+    outbox.OUTBOX_MAX_ATTEMPTS = 20
+
+    for name, runner in (('прямая отправка', direct), ('outbox', drained)):
+        elapsed, delivered, calls = asyncio.run(runner(MESSAGES))
+        print(f"{name}:")
+        print(f"  доставлено: {delivered}/{MESSAGES} за {elapsed:.2f} с "
+              f"({delivered / elapsed:.0f} сообщений/с), запросов к API: {calls}")
+
+    stats = outbox.get_outbox_stats()
+    print(f"  пачек: {stats['batches']}, повторов: {stats['retried']}, в outbox_dead: {stats['dead_total']}")
+
+if __name__ == "__main__":
+    main()
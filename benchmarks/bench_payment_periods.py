@@ -0,0 +1,163 @@
+"""Стресс-тест переходов оплаты при одновременных нажатиях
+
+Много потоков с отдельными соединениями одновременно жмут «Оплатил» за один и
+тот же период, затем — «Подтвердить». Сравниваются старая схема «проверили,
+потом вставили» и условные UPSERT/UPDATE из payment_periods: у новой должен
+получиться ровно один переход на каждом шаге.
+Запуск из корня проекта: python benchmarks/bench_payment_periods.py
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import payment_periods
+import queries
+import revenue
+from queries import execute, fetch_one
+
+TAPS = 1000
+WORKERS = 32
+USER_ID = 1001
+ADMIN_ID = 1
+PERIOD = '2024-05'
+
+def prepare():
+    conn = queries.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('DROP TABLE IF EXISTS payments')
+    cursor.execute('DROP TABLE IF EXISTS payment_periods')
+    cursor.execute('DROP TABLE IF EXISTS payment_ledger')
+    cursor.execute('DROP TABLE IF EXISTS revenue_rollups')
+    # Таблица старой схемы — для сравнения с legacy_claim
+    cursor.execute('''
+        CREATE TABLE payments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            admin_id INTEGER NOT NULL,
+            payment_date DATE NOT NULL,
+            confirmed BOOLEAN DEFAULT FALSE,
+            amount REAL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('DROP TABLE IF EXISTS user_admin_links')
+    # Заявка берет сумму из привязки
+    cursor.execute('''
+        CREATE TABLE user_admin_links (
+            user_id INTEGER NOT NULL,
+            admin_id INTEGER NOT NULL,
+            expected_amount REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('INSERT INTO user_admin_links VALUES (?, ?, 500)', (USER_ID, ADMIN_ID))
+    payment_periods.create_tables(cursor)
+    revenue.create_tables(cursor)
+    payment_periods.mark_reminded(cursor, USER_ID, ADMIN_ID, PERIOD, int(time.time()))
+    conn.commit()
+    conn.close()
+
+def legacy_claim(start) -> bool:
+    """Как раньше в payment_confirmation: SELECT COUNT(*), затем INSERT"""
+    conn = connect()
+    cursor = conn.cursor()
+    start.wait()
+    exists = fetch_one(cursor, 'legacy_claim_exists', '''
+        SELECT COUNT(*) FROM payments
+        WHERE user_id = ? AND admin_id = ? AND DATE(payment_date) = DATE('now') AND confirmed = FALSE
+    ''', (USER_ID, ADMIN_ID))[0]
+    # Между проверкой и вставкой другой обработчик успевает сделать то же самое
+    time.sleep(0)
+    if exists:
+        conn.close()
+        return False
+    execute(cursor, 'legacy_claim_insert', '''
+        INSERT INTO payments (user_id, admin_id, payment_date, confirmed) VALUES (?, ?, DATE('now'), FALSE)
+    ''', (USER_ID, ADMIN_ID))
+    conn.commit()
+    conn.close()
+    return True
+
+def atomic_claim(start) -> bool:
+    conn = connect()
+    cursor = conn.cursor()
+    start.wait()
+    period_id = payment_periods.claim(cursor, USER_ID, ADMIN_ID, PERIOD)
+    conn.commit()
+    conn.close()
+    return period_id is not None
+
+def atomic_confirm(start) -> bool:
+    conn = connect()
+    cursor = conn.cursor()
+    start.wait()
+    resolved = payment_periods.resolve(cursor, USER_ID, ADMIN_ID, PERIOD, confirmed=True)
+    conn.commit()
+    conn.close()
+    return resolved is not None
+
+def connect():
+    conn = queries.get_db_connection()
+    # Писатели ждут блокировку, а не падают с «database is locked»
+    conn.execute('PRAGMA busy_timeout = 30000')
+    return conn
+
+def storm(func):
+    """TAPS нажатий, по WORKERS одновременно; число успешных переходов и время"""
+    start = threading.Event()
+    with ThreadPoolExecutor(WORKERS) as pool:
+        futures = [pool.submit(func, start) for _ in range(TAPS)]
+        started = time.perf_counter()
+        start.set()
+        results = [future.result() for future in futures]
+    return sum(results), time.perf_counter() - started
+
+def count_payments():
+    """Записи старой таблицы payments"""
+    conn = queries.get_db_connection()
+    cursor = conn.cursor()
+    total = fetch_one(cursor, 'count_payments', 'SELECT COUNT(*) FROM payments')[0]
+    conn.close()
+    return total
+
+def count_ledger(status):
+    """Записи журнала payment_ledger с данным статусом"""
+    conn = queries.get_db_connection()
+    cursor = conn.cursor()
+    total = fetch_one(cursor, 'count_ledger', 'SELECT COUNT(*) FROM payment_ledger WHERE status = ?', (status,))[0]
+    conn.close()
+    return total
+
+def main():
+    queries.DB_PATH = os.path.join(tempfile.mkdtemp(), 'bench_payment_periods.db')
+    # Ожидание блокировки под нагрузкой — ожидаемо, не засоряем вывод
+    queries.SLOW_QUERY_MS = float('inf')
+
+    prepare()
+    transitions, elapsed = storm(legacy_claim)
+    total = count_payments()
+    print("проверка + вставка:")
+    print(f"  {TAPS} нажатий «Оплатил» за {elapsed:.2f} с: переходов {transitions}, записей в payments {total}")
+
+    prepare()
+    transitions, elapsed = storm(atomic_claim)
+    total = count_ledger(payment_periods.PaymentState.CLAIMED)
+    print("payment_periods:")
+    print(f"  {TAPS} нажатий «Оплатил» за {elapsed:.2f} с: переходов {transitions}, заявок в журнале {total}")
+
+    transitions, elapsed = storm(atomic_confirm)
+    confirmed = count_ledger(payment_periods.PaymentState.CONFIRMED)
+    print(f"  {TAPS} нажатий «Подтвердить» за {elapsed:.2f} с: переходов {transitions}, "
+          f"подтверждений в журнале {confirmed}")
+
+    conn = queries.get_db_connection()
+    payments, amount = revenue.get_month(conn.cursor(), ADMIN_ID, PERIOD)
+    conn.close()
+    print(f"  итоги за {PERIOD}: платежей {payments}, сумма {amount:.2f}")
+
+if __name__ == "__main__":
+    main()
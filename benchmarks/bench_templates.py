@@ -0,0 +1,75 @@
+"""Бенчмарк сборки текстов сообщений
+
+Сравнивает построение списка пользователей через text += f"..." с
+шаблонами templates.py: тексты должны совпадать, а длинный список — уходить
+в меньшее число сообщений не длиннее лимита Telegram. Запуск из корня проекта: python benchmarks/bench_templates.py
+"""
+import html
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from keyboards import EMOJI
+import templates
+
+N = 20
+USERS = 2000
+
+def make_users(count):
+    return [
+        (100000000 + i, f"Пользователь <{i}> & Co", f"user_{i}", i % 28 + 1, f"{i % 24:02d}:00")
+        for i in range(count)
+    ]
+
+def concat(users):
+    """Старый способ: конкатенация строк и разрез по 3500 символов"""
+    messages = []
+    text = f"{EMOJI['list']} <b>Ваши пользователи ({len(users)}):</b>\n"
+    text += f"{'━' * 20}\n\n"
+
+    for i, (user_id, full_name, username, day, time) in enumerate(users, 1):
+        text += f"<b>{i}. {html.escape(str(full_name))}</b>\n"
+        text += f"   @{html.escape(str(username))} | ID: <code>{user_id}</code>\n"
+        text += f"   {EMOJI['calendar']} {day} число, {EMOJI['clock']} {time}\n\n"
+
+        if len(text) > 3500:
+            messages.append(text)
+            text = ""
+
+    if text:
+        messages.append(text)
+    return messages
+
+def render(users):
+    """Новый способ: шаблоны и упаковка фрагментов в сообщения"""
+    blocks = [templates.USER_LIST_HEADER.render(count=len(users))]
+    for i, (user_id, full_name, username, day, time) in enumerate(users, 1):
+        blocks.append(templates.USER_LIST_ITEM.render(
+            index=i,
+            full_name=full_name,
+            username=username,
+            user_id=user_id,
+            day=day,
+            time=time
+        ))
+    return templates.split_messages(blocks)
+
+def main():
+    users = make_users(USERS)
+
+    old = concat(users)
+    new = render(users)
+    assert ''.join(old) == ''.join(new), "тексты не совпадают"
+    assert all(len(text) <= templates.MESSAGE_LIMIT for text in new)
+
+    concat_time = timeit.timeit(lambda: concat(users), number=N) / N * 1000
+    render_time = timeit.timeit(lambda: render(users), number=N) / N * 1000
+
+    print(f"Список из {USERS} пользователей:")
+    print(f"  конкатенация: {concat_time:7.2f} мс, сообщений: {len(old)}")
+    print(f"  шаблоны:      {render_time:7.2f} мс, сообщений: {len(new)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Бенчмарк маршрутизации нажатий reply-кнопок
+
+Сравнивает последовательную проверку фильтров F.text == ... (как aiogram
+перебирает обработчики по порядку регистрации) с одним обращением к словарю
+TextRouter. Запуск из корня проекта: python benchmarks/bench_text_dispatch.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import F
+
+from keyboards import BUTTONS
+from text_router import TextRouter
+
+N = 100000
+
+# Порядок, в котором обработчики кнопок были зарегистрированы в main.py
+HANDLER_ORDER = [
+    'admin_panel', 'my_status', 'contact_admin', 'back', 'admin_settings', 'active_chats',
+    'add_user', 'list_users', 'payment_stats', 'remove_user', 'unpaid', 'overdue',
+    'confirm_payments', 'cancel'
+]
+
+def main():
+    labels = [BUTTONS[key] for key in HANDLER_ORDER]
+    filters = [F.text == label for label in labels]
+
+    router = TextRouter()
+    for label in labels:
+        router.route(label)(lambda message, **kwargs: None)
+    route_filter = F.text.func(router.can_handle)
+
+    class FakeMessage:
+        def __init__(self, text):
+            self.text = text
+
+    cases = {
+        'первая кнопка': FakeMessage(labels[0]),
+        'последняя кнопка': FakeMessage(labels[-1]),
+        'обычный текст': FakeMessage("Привет, когда оплата?")
+    }
+
+    for name, message in cases.items():
+        def linear():
+            for magic in filters:
+                if magic.resolve(message):
+                    return True
+            return False
+
+        def routed():
+            return route_filter.resolve(message)
+
+        linear_time = timeit.timeit(linear, number=N) / N * 1e6
+        routed_time = timeit.timeit(routed, number=N) / N * 1e6
+        print(f"{name}:")
+        print(f"  цепочка фильтров: {linear_time:7.2f} мкс")
+        print(f"  TextRouter:       {routed_time:7.2f} мкс ({linear_time / routed_time:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,400 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+import deliveries
+import queries
+from outbox import classify_chat_error, describe_error, is_permanent
+from payment_periods import PaymentState
+from queries import execute, fetch_all, fetch_one
+from throttle import AsyncRateLimiter
+
+# Сообщений в секунду на рассылки (вместе с outbox — в пределах лимита Telegram)
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "5"))
+# Сколько получателей выбирается за проход
+BROADCAST_BATCH_SIZE = int(os.getenv("BROADCAST_BATCH_SIZE", "50"))
+# Попыток на получателя при временных ошибках
+BROADCAST_MAX_ATTEMPTS = int(os.getenv("BROADCAST_MAX_ATTEMPTS", "3"))
+# Не чаще, чем раз в столько секунд, обновляется сообщение с прогрессом
+BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "3"))
+# Интервал проверки незавершенных рассылок (сек)
+BROADCAST_POLL_INTERVAL = float(os.getenv("BROADCAST_POLL_INTERVAL", "60"))
+
+STATUS_SENDING = 'sending'
+STATUS_DONE = 'done'
+STATUS_CANCELLED = 'cancelled'
+# Админ удалил исходное сообщение — копировать больше нечего
+STATUS_SOURCE_LOST = 'source_lost'
+
+# Ответы Telegram, когда недоступно исходное сообщение, а не получатель
+_SOURCE_ERRORS = ('message to copy not found', 'message_id_invalid')
+
+# Состояние получателя
+RECIPIENT_PENDING = 0
+RECIPIENT_SENT = 1
+RECIPIENT_FAILED = 2
+
+# Сегменты: 'all', 'unpaid', 'overdue', 'd<день оплаты>'
+SEGMENT_ALL = 'all'
+SEGMENT_UNPAID = 'unpaid'
+SEGMENT_OVERDUE = 'overdue'
+
+SEGMENT_TITLES = {
+    SEGMENT_ALL: 'Всем',
+    SEGMENT_UNPAID: 'Неоплатившим',
+    SEGMENT_OVERDUE: 'Просрочившим'
+}
+
+ProgressHandler = Callable[[Dict], Awaitable[None]]
+DeadChatHandler = Callable[[int, str], None]
+
+_stats = {'sent': 0, 'failed': 0, 'retried': 0}
+
+_limiter = AsyncRateLimiter(BROADCAST_RATE)
+_wakeup: Optional[asyncio.Event] = None
+_broadcast_task: Optional[asyncio.Task] = None
+_progress_handler: Optional[ProgressHandler] = None
+_dead_chat_handler: Optional[DeadChatHandler] = None
+# Отмененные во время отправки: проверяются перед каждым сообщением
+_cancelled = set()
+
+def create_tables(cursor: sqlite3.Cursor):
+    """Создает рассылки и их получателей
+
+    Получатели фиксируются при создании рассылки, каждый отмечается после
+    отправки отдельным commit — после перезапуска рассылка продолжается
+    с неотправленных. Сообщение не хранится: рассылается копия исходного
+    сообщения админа (copy_message), вместе с форматированием и вложениями.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            admin_id INTEGER NOT NULL,
+            source_chat_id INTEGER NOT NULL,
+            source_message_id INTEGER NOT NULL,
+            segment TEXT NOT NULL,
+            status TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            status_chat_id INTEGER,
+            status_message_id INTEGER,
+            created_at INTEGER NOT NULL,
+            finished_at INTEGER
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_broadcasts_admin ON broadcasts(admin_id, id)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS broadcast_recipients (
+            broadcast_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            state INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            sent_at INTEGER,
+            PRIMARY KEY (broadcast_id, user_id)
+        ) WITHOUT ROWID
+    ''')
+    # Очередь отправки — только еще не отправленные
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_broadcast_recipients_pending
+        ON broadcast_recipients(broadcast_id) WHERE state = 0
+    ''')
+
+def _segment_filter(segment: str) -> Tuple[str, Dict]:
+    """Условие на привязку l для сегмента и его параметры"""
+    if segment == SEGMENT_ALL:
+        return 'TRUE', {}
+    if segment == SEGMENT_UNPAID:
+        return '''NOT EXISTS (
+            SELECT 1 FROM payment_periods p
+            WHERE p.user_id = l.user_id AND p.admin_id = l.admin_id
+              AND p.period = :period AND p.state = :confirmed
+        )''', {'period': deliveries.get_period(), 'confirmed': PaymentState.CONFIRMED}
+    if segment == SEGMENT_OVERDUE:
+        return '''EXISTS (
+            SELECT 1 FROM payment_periods p
+            WHERE p.user_id = l.user_id AND p.admin_id = l.admin_id AND p.due_at <= :now
+        )''', {'now': int(time.time())}
+    if segment.startswith('d') and segment[1:].isdigit():
+        return 'l.payment_day = :day', {'day': int(segment[1:])}
+    raise ValueError(f"Неизвестный сегмент рассылки: {segment}")
+
+def segment_title(segment: str) -> str:
+    if segment in SEGMENT_TITLES:
+        return SEGMENT_TITLES[segment]
+    return f"Оплата {segment[1:]} числа"
+
+def count_segments(cursor: sqlite3.Cursor, admin_id: int) -> Dict[str, int]:
+    """Размер каждого сегмента (дни оплаты — 'd<день>') среди доступных пользователей"""
+    counts = {}
+    for segment in (SEGMENT_ALL, SEGMENT_UNPAID, SEGMENT_OVERDUE):
+        condition, params = _segment_filter(segment)
+        counts[segment] = fetch_one(cursor, f'broadcast_count_{segment}', f'''
+            SELECT COUNT(*) FROM user_admin_links l
+            WHERE l.admin_id = :admin_id AND l.delivery_status = 'active' AND {condition}
+        ''', {'admin_id': admin_id, **params})[0]
+
+    for day, count in fetch_all(cursor, 'broadcast_count_days', '''
+        SELECT payment_day, COUNT(*) FROM user_admin_links
+        WHERE admin_id = ? AND delivery_status = 'active'
+        GROUP BY payment_day ORDER BY payment_day
+    ''', (admin_id,)):
+        counts[f'd{day}'] = count
+    return counts
+
+def create(cursor: sqlite3.Cursor, admin_id: int, source_chat_id: int, source_message_id: int,
+           segment: str) -> Tuple[int, int]:
+    """Создает рассылку с получателями сегмента в транзакции вызывающего кода
+
+    Возвращает (id рассылки, число получателей). После commit стоит вызвать wake().
+    """
+    condition, params = _segment_filter(segment)
+    execute(cursor, 'broadcast_create', '''
+        INSERT INTO broadcasts (admin_id, source_chat_id, source_message_id, segment, status, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (admin_id, source_chat_id, source_message_id, segment, STATUS_SENDING, int(time.time())))
+    broadcast_id = cursor.lastrowid
+
+    execute(cursor, 'broadcast_recipients_snapshot', f'''
+        INSERT INTO broadcast_recipients (broadcast_id, user_id)
+        SELECT :broadcast_id, l.user_id FROM user_admin_links l
+        WHERE l.admin_id = :admin_id AND l.delivery_status = 'active' AND {condition}
+    ''', {'broadcast_id': broadcast_id, 'admin_id': admin_id, **params})
+    total = cursor.rowcount
+
+    execute(cursor, 'broadcast_set_total', 'UPDATE broadcasts SET total = ? WHERE id = ?',
+            (total, broadcast_id))
+    return broadcast_id, total
+
+def set_status_message(cursor: sqlite3.Cursor, broadcast_id: int, chat_id: int, message_id: int):
+    """Запоминает сообщение, в котором показывается прогресс рассылки"""
+    execute(cursor, 'broadcast_set_status_message', '''
+        UPDATE broadcasts SET status_chat_id = ?, status_message_id = ? WHERE id = ?
+    ''', (chat_id, message_id, broadcast_id))
+
+def cancel(broadcast_id: int, admin_id: int) -> Optional[Dict]:
+    """Отменяет рассылку админа; уже отправленные сообщения остаются
+
+    Возвращает рассылку после отмены или None, если она уже завершена.
+    """
+    conn = queries.get_db_connection()
+    cursor = conn.cursor()
+    row = fetch_one(cursor, 'broadcast_cancel', '''
+        UPDATE broadcasts SET status = ?, finished_at = ?
+        WHERE id = ? AND admin_id = ? AND status = ?
+        RETURNING id
+    ''', (STATUS_CANCELLED, int(time.time()), broadcast_id, admin_id, STATUS_SENDING))
+    conn.commit()
+    broadcast = _get(cursor, broadcast_id) if row is not None else None
+    conn.close()
+
+    if broadcast is not None:
+        _cancelled.add(broadcast_id)
+    return broadcast
+
+def get_recent(cursor: sqlite3.Cursor, admin_id: int, limit: int = 5) -> List[tuple]:
+    """Последние рассылки: (id, segment, status, total, sent, failed, created_at)"""
+    return fetch_all(cursor, 'broadcast_recent', '''
+        SELECT id, segment, status, total, sent, failed, created_at FROM broadcasts
+        WHERE admin_id = ? ORDER BY id DESC LIMIT ?
+    ''', (admin_id, limit))
+
+def _get(cursor: sqlite3.Cursor, broadcast_id: int) -> Dict:
+    row = fetch_one(cursor, 'broadcast_get', '''
+        SELECT id, admin_id, segment, status, total, sent, failed, status_chat_id, status_message_id
+        FROM broadcasts WHERE id = ?
+    ''', (broadcast_id,))
+    keys = ('id', 'admin_id', 'segment', 'status', 'total', 'sent', 'failed',
+            'status_chat_id', 'status_message_id')
+    return dict(zip(keys, row))
+
+def on_progress(handler: ProgressHandler):
+    """Декоратор: корутина handler(broadcast) при изменении прогресса и по завершении
+
+    broadcast — словарь с полями рассылки (status, total, sent, failed, status_chat_id...).
+    """
+    global _progress_handler
+    _progress_handler = handler
+    return handler
+
+def on_dead_chat(handler: DeadChatHandler):
+    """Декоратор: функция handler(user_id, reason) для чата, недоступного навсегда"""
+    global _dead_chat_handler
+    _dead_chat_handler = handler
+    return handler
+
+def wake():
+    """Будит рассылку, не дожидаясь очередного опроса"""
+    if _wakeup is not None:
+        _wakeup.set()
+
+async def _report(cursor: sqlite3.Cursor, broadcast_id: int):
+    if _progress_handler is None:
+        return
+    try:
+        await _progress_handler(_get(cursor, broadcast_id))
+    except Exception as e:
+        logging.warning(f"Не удалось обновить прогресс рассылки {broadcast_id}: {e}")
+
+def _source_missing(error: Exception) -> bool:
+    text = str(error).lower()
+    return isinstance(error, TelegramBadRequest) and any(reason in text for reason in _SOURCE_ERRORS)
+
+def _stop_source_lost(cursor: sqlite3.Cursor, broadcast_id: int, error: Exception):
+    """Останавливает рассылку; получатели остаются неотправленными, а не ошибочными"""
+    execute(cursor, 'broadcast_source_lost', '''
+        UPDATE broadcasts SET status = ?, finished_at = ? WHERE id = ? AND status = ?
+    ''', (STATUS_SOURCE_LOST, int(time.time()), broadcast_id, STATUS_SENDING))
+    cursor.connection.commit()
+    logging.warning(f"Рассылка {broadcast_id} остановлена: исходное сообщение недоступно ({describe_error(error)})")
+
+async def _send(bot, cursor: sqlite3.Cursor, broadcast: tuple, user_id: int, attempts: int) -> bool:
+    """Отправляет копию сообщения одному получателю и фиксирует результат
+
+    False — исходное сообщение недоступно и рассылка остановлена.
+    """
+    broadcast_id, _, source_chat_id, source_message_id = broadcast
+    await _limiter.acquire()
+    now = int(time.time())
+    try:
+        await bot.copy_message(user_id, source_chat_id, source_message_id)
+    except TelegramRetryAfter as e:
+        # Не считаем попыткой — получатель останется в очереди
+        _limiter.pause(e.retry_after)
+        _stats['retried'] += 1
+        return True
+    except Exception as e:
+        if _source_missing(e):
+            _stop_source_lost(cursor, broadcast_id, e)
+            return False
+
+        if not is_permanent(e) and attempts + 1 < BROADCAST_MAX_ATTEMPTS:
+            execute(cursor, 'broadcast_recipient_retry', '''
+                UPDATE broadcast_recipients SET attempts = attempts + 1, last_error = ?
+                WHERE broadcast_id = ? AND user_id = ?
+            ''', (describe_error(e), broadcast_id, user_id))
+            cursor.connection.commit()
+            _stats['retried'] += 1
+            return True
+
+        execute(cursor, 'broadcast_recipient_failed', '''
+            UPDATE broadcast_recipients SET state = ?, attempts = attempts + 1, last_error = ?
+            WHERE broadcast_id = ? AND user_id = ?
+        ''', (RECIPIENT_FAILED, describe_error(e), broadcast_id, user_id))
+        execute(cursor, 'broadcast_count_failed', 'UPDATE broadcasts SET failed = failed + 1 WHERE id = ?',
+                (broadcast_id,))
+        cursor.connection.commit()
+        _stats['failed'] += 1
+
+        reason = classify_chat_error(e)
+        if reason and _dead_chat_handler is not None:
+            _dead_chat_handler(user_id, reason)
+        return True
+
+    execute(cursor, 'broadcast_recipient_sent', '''
+        UPDATE broadcast_recipients SET state = ?, sent_at = ? WHERE broadcast_id = ? AND user_id = ?
+    ''', (RECIPIENT_SENT, now, broadcast_id, user_id))
+    execute(cursor, 'broadcast_count_sent', 'UPDATE broadcasts SET sent = sent + 1 WHERE id = ?',
+            (broadcast_id,))
+    # Отметка сразу после отправки: после перезапуска этому получателю не придет дубль
+    cursor.connection.commit()
+    _stats['sent'] += 1
+    return True
+
+async def drain_once(bot) -> int:
+    """Отправляет очередную пачку самой старой активной рассылки, возвращает ее размер"""
+    # Отмены прошлых проходов уже видны в базе по статусу
+    _cancelled.clear()
+    conn = queries.get_db_connection()
+    try:
+        cursor = conn.cursor()
+        broadcast = fetch_one(cursor, 'broadcast_active', '''
+            SELECT id, admin_id, source_chat_id, source_message_id FROM broadcasts
+            WHERE status = ? ORDER BY id LIMIT 1
+        ''', (STATUS_SENDING,))
+
+        if broadcast is None:
+            return 0
+
+        broadcast_id = broadcast[0]
+        recipients = fetch_all(cursor, 'broadcast_pending', '''
+            SELECT user_id, attempts FROM broadcast_recipients
+            WHERE broadcast_id = ? AND state = ? LIMIT ?
+        ''', (broadcast_id, RECIPIENT_PENDING, BROADCAST_BATCH_SIZE))
+
+        reported_at = time.monotonic()
+        for user_id, attempts in recipients:
+            if broadcast_id in _cancelled:
+                break
+            if not await _send(bot, cursor, broadcast, user_id, attempts):
+                break
+            if time.monotonic() - reported_at >= BROADCAST_PROGRESS_INTERVAL:
+                reported_at = time.monotonic()
+                await _report(cursor, broadcast_id)
+
+        if not recipients:
+            execute(cursor, 'broadcast_finish', '''
+                UPDATE broadcasts SET status = ?, finished_at = ? WHERE id = ? AND status = ?
+            ''', (STATUS_DONE, int(time.time()), broadcast_id, STATUS_SENDING))
+            conn.commit()
+            logging.info(f"Рассылка {broadcast_id} завершена")
+        await _report(cursor, broadcast_id)
+    finally:
+        conn.close()
+
+    # Пустая пачка закрыла рассылку — следующая может ждать своей очереди
+    return len(recipients) or 1
+
+async def _broadcast_loop(bot):
+    """Фоновая отправка рассылок по одной, в порядке создания"""
+    while True:
+        try:
+            processed = await drain_once(bot)
+        except Exception as e:
+            logging.error(f"Ошибка отправки рассылки: {e}")
+            processed = 0
+
+        if processed:
+            continue
+
+        _wakeup.clear()
+        try:
+            await asyncio.wait_for(_wakeup.wait(), BROADCAST_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+def start(bot):
+    """Запускает фоновую отправку рассылок; незавершенные продолжатся с места остановки"""
+    global _broadcast_task, _wakeup
+
+    if _broadcast_task is not None:
+        return
+
+    _wakeup = asyncio.Event()
+    _broadcast_task = asyncio.get_running_loop().create_task(_broadcast_loop(bot))
+
+def stop():
+    """Останавливает фоновую отправку рассылок"""
+    global _broadcast_task
+
+    if _broadcast_task is not None:
+        _broadcast_task.cancel()
+        _broadcast_task = None
+
+def get_broadcast_stats() -> Dict[str, int]:
+    """Счетчики отправки и число активных рассылок"""
+    conn = queries.get_db_connection()
+    cursor = conn.cursor()
+    active = fetch_one(cursor, 'broadcast_active_count', 'SELECT COUNT(*) FROM broadcasts WHERE status = ?',
+                       (STATUS_SENDING,))[0]
+    conn.close()
+
+    stats = dict(_stats)
+    stats['active'] = active
+    return stats
@@ -0,0 +1,145 @@
+import csv
+import io
+import json
+import math
+import os
+import sqlite3
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Tuple
+
+from queries import execute_many, fetch_all
+
+# Ограничения загружаемого файла
+IMPORT_MAX_BYTES = int(os.getenv("IMPORT_MAX_BYTES", str(1024 * 1024)))
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", "5000"))
+
+# Столбцы файла по порядку; message и amount можно не заполнять
+COLUMNS = ('user_id', 'day', 'time', 'message', 'amount')
+
+MESSAGE_MIN_LENGTH = 5
+MESSAGE_MAX_LENGTH = 500
+
+class ImportRow(NamedTuple):
+    line: int
+    user_id: int
+    day: int
+    time: str
+    message: str
+    amount: float
+
+def decode(data: bytes) -> str:
+    """Текст файла: UTF-8 (с BOM или без), иначе cp1251 — так сохраняет Excel"""
+    try:
+        return data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        return data.decode('cp1251')
+
+def _reader(text: str):
+    """csv.reader с разделителем из первой строки: табуляция, ';' или ','"""
+    first_line = text.split('\n', 1)[0]
+    delimiter = max('\t;,', key=first_line.count)
+    return csv.reader(io.StringIO(text), delimiter=delimiter)
+
+def _parse_row(values: List[str], line: int, default_message: str) -> ImportRow:
+    """Разбирает строку по тем же правилам, что и пошаговое добавление"""
+    values = [value.strip() for value in values] + [''] * (len(COLUMNS) - len(values))
+    user_id, day, time_str, message, amount = values[:len(COLUMNS)]
+
+    if not user_id.isdigit():
+        raise ValueError(f"неверный ID «{user_id}»")
+    if not day.isdigit() or not 1 <= int(day) <= 31:
+        raise ValueError(f"день должен быть от 1 до 31, а не «{day}»")
+    try:
+        parsed_time = datetime.strptime(time_str, "%H:%M")
+    except ValueError:
+        raise ValueError(f"время должно быть в формате ЧЧ:ММ, а не «{time_str}»")
+
+    message = message or default_message
+    if len(message) < MESSAGE_MIN_LENGTH:
+        raise ValueError(f"сообщение короче {MESSAGE_MIN_LENGTH} символов")
+    if len(message) > MESSAGE_MAX_LENGTH:
+        raise ValueError(f"сообщение длиннее {MESSAGE_MAX_LENGTH} символов")
+
+    if amount:
+        try:
+            parsed_amount = float(amount.replace('₽', '').replace(' ', '').replace(',', '.'))
+        except ValueError:
+            parsed_amount = -1
+        if not math.isfinite(parsed_amount) or parsed_amount < 0:
+            raise ValueError(f"неверная сумма «{amount}»")
+    else:
+        parsed_amount = 0.0
+
+    return ImportRow(line, int(user_id), int(day), parsed_time.strftime("%H:%M"),
+                     message, round(parsed_amount, 2))
+
+def parse(text: str, default_message: str) -> Tuple[List[ImportRow], List[Tuple[int, str]]]:
+    """Разбирает файл целиком: (корректные строки, [(номер строки, причина)])
+
+    Первая строка пропускается, если это заголовок. Повтор ID в файле — ошибка.
+    """
+    rows: List[ImportRow] = []
+    errors: List[Tuple[int, str]] = []
+    seen: Dict[int, int] = {}
+
+    for line, values in enumerate(_reader(text), 1):
+        if not any(value.strip() for value in values):
+            continue
+        if line == 1 and not values[0].strip().isdigit():
+            continue
+        if len(rows) + len(errors) >= IMPORT_MAX_ROWS:
+            errors.append((line, f"превышен лимит {IMPORT_MAX_ROWS} строк, остаток файла пропущен"))
+            break
+        try:
+            row = _parse_row(values, line, default_message)
+        except ValueError as e:
+            errors.append((line, str(e)))
+            continue
+        if row.user_id in seen:
+            errors.append((line, f"ID {row.user_id} уже был в строке {seen[row.user_id]}"))
+            continue
+        seen[row.user_id] = line
+        rows.append(row)
+
+    return rows, errors
+
+def check_links(cursor: sqlite3.Cursor, admin_id: int,
+                rows: List[ImportRow]) -> Tuple[List[ImportRow], List[ImportRow], List[Tuple[int, str]]]:
+    """Сверяет строки с привязками одним запросом: (новые, уже свои, ошибки)"""
+    linked = dict(fetch_all(cursor, 'import_existing_links', '''
+        SELECT user_id, MIN(admin_id) FROM user_admin_links
+        WHERE user_id IN (SELECT value FROM json_each(?))
+        GROUP BY user_id
+    ''', (json.dumps([row.user_id for row in rows]),)))
+
+    new, existing, errors = [], [], []
+    for row in rows:
+        owner = linked.get(row.user_id)
+        if row.user_id == admin_id:
+            errors.append((row.line, "нельзя добавить самого себя"))
+        elif owner is None:
+            new.append(row)
+        elif owner == admin_id:
+            existing.append(row)
+        else:
+            errors.append((row.line, f"ID {row.user_id} привязан к другому администратору"))
+    return new, existing, errors
+
+def apply(cursor: sqlite3.Cursor, admin_id: int, rows: List[ImportRow]):
+    """Записывает привязки одним executemany в транзакции вызывающего кода
+
+    Уже существующие привязки админа обновляются на месте — статус доставки
+    и прочие поля строки сохраняются.
+    """
+    execute_many(cursor, 'import_links', '''
+        INSERT INTO user_admin_links
+        (user_id, admin_id, payment_day, payment_time, payment_message, expected_amount)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, admin_id) DO UPDATE
+        SET payment_day = excluded.payment_day, payment_time = excluded.payment_time,
+            payment_message = excluded.payment_message, expected_amount = excluded.expected_amount
+    ''', [(row.user_id, admin_id, row.day, row.time, row.message, row.amount) for row in rows])
+
+def render_report(errors: List[Tuple[int, str]]) -> str:
+    """Построчный отчет об ошибках"""
+    return '\n'.join(f"Строка {line}: {reason}" for line, reason in sorted(errors))
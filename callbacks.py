@@ -0,0 +1,216 @@
+import re
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Union
+
+# Ограничение Telegram на длину callback_data (в байтах)
+CALLBACK_DATA_LIMIT = 64
+SEPARATOR = ':'
+
+# Старый формат: имя_число_число (paid_123, history_page_123_2)
+_LEGACY_PATTERN = re.compile(r'^([a-z_]+?)((?:_\d+)*)$')
+
+def _encode_int(value: int) -> str:
+    """Число в base36 — короче десятичной записи"""
+    if value < 0:
+        return '-' + _encode_int(-value)
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    if value < 36:
+        return digits[value]
+    result = ''
+    while value:
+        value, rest = divmod(value, 36)
+        result = digits[rest] + result
+    return result
+
+def _decode_int(value: str) -> int:
+    return int(value, 36)
+
+def _encode_period(value: str) -> str:
+    """Расчетный период 'YYYY-MM' кодируется номером месяца"""
+    year, month = map(int, value.split('-'))
+    return _encode_int(year * 12 + month - 1)
+
+def _decode_period(value: str) -> str:
+    year, month = divmod(_decode_int(value), 12)
+    return f"{year:04d}-{month + 1:02d}"
+
+def _encode_str(value: str) -> str:
+    if SEPARATOR in value:
+        raise ValueError(f"Символ '{SEPARATOR}' недопустим в значении callback_data")
+    return value
+
+_CODECS = {
+    int: (_encode_int, _decode_int),
+    str: (_encode_str, str),
+    'period': (_encode_period, _decode_period)
+}
+
+class CallbackAction:
+    """Тип callback_data: короткий префикс и типизированные поля
+
+    Поля кодируются позиционно через ':'. Поля из optional (только хвостовые)
+    можно не передавать — при разборе они будут равны None.
+    """
+
+    def __init__(self, prefix: str, *fields: Tuple[str, Any], optional: Tuple[str, ...] = (),
+                 legacy: Optional[str] = None):
+        self.prefix = prefix
+        self.fields = fields
+        self.required = sum(1 for name, _ in fields if name not in optional)
+        self.legacy = legacy
+
+    def pack(self, **values) -> str:
+        parts = [self.prefix]
+        for i, (name, kind) in enumerate(self.fields):
+            value = values.get(name)
+            if value is None:
+                if i < self.required:
+                    raise ValueError(f"Не передано обязательное поле callback_data: {name}")
+                break
+            parts.append(_CODECS[kind][0](value))
+
+        data = SEPARATOR.join(parts)
+        if len(data.encode('utf-8')) > CALLBACK_DATA_LIMIT:
+            raise ValueError(f"callback_data длиннее {CALLBACK_DATA_LIMIT} байт: {data}")
+        return data
+
+    def unpack(self, parts) -> Dict[str, Any]:
+        if len(parts) < self.required or len(parts) > len(self.fields):
+            raise ValueError(f"Неверное число полей callback_data для '{self.prefix}'")
+        values = {}
+        for i, (name, kind) in enumerate(self.fields):
+            values[name] = _CODECS[kind][1](parts[i]) if i < len(parts) else None
+        return values
+
+    def unpack_legacy(self, numbers) -> Dict[str, Any]:
+        if len(numbers) < self.required:
+            raise ValueError(f"Неверное число полей callback_data для '{self.legacy}'")
+        values = {}
+        for i, (name, kind) in enumerate(self.fields):
+            values[name] = int(numbers[i]) if i < len(numbers) and kind is int else None
+        return values
+
+# Реестр действий: префикс -> действие
+ACTIONS: Dict[str, CallbackAction] = {}
+# Имя в старом формате -> действие (для кнопок в уже отправленных сообщениях)
+LEGACY_ACTIONS: Dict[str, CallbackAction] = {}
+
+def action(prefix: str, *fields: Tuple[str, Any], optional: Tuple[str, ...] = (),
+           legacy: Optional[str] = None) -> CallbackAction:
+    """Регистрирует новый тип callback_data"""
+    if prefix in ACTIONS:
+        raise ValueError(f"Префикс callback_data уже занят: {prefix}")
+    item = CallbackAction(prefix, *fields, optional=optional, legacy=legacy)
+    ACTIONS[prefix] = item
+    if legacy:
+        LEGACY_ACTIONS[legacy] = item
+    return item
+
+def decode(data: Optional[str]) -> Optional[Tuple[CallbackAction, Dict[str, Any]]]:
+    """Разбирает callback_data; None, если формат неизвестен"""
+    if not data:
+        return None
+
+    parts = data.split(SEPARATOR)
+    item = ACTIONS.get(parts[0])
+    if item is not None:
+        try:
+            return item, item.unpack(parts[1:])
+        except (ValueError, IndexError):
+            return None
+
+    match = _LEGACY_PATTERN.match(data)
+    if match:
+        item = LEGACY_ACTIONS.get(match.group(1))
+        if item is not None:
+            numbers = [n for n in match.group(2).split('_') if n]
+            try:
+                return item, item.unpack_legacy(numbers)
+            except ValueError:
+                return None
+
+    return None
+
+# Платежи
+PAID = action('p', ('admin_id', int), ('period', 'period'), optional=('period',), legacy='paid')
+CONTACT_ADMIN = action('ca', ('admin_id', int), legacy='contact_admin')
+CONFIRM_PAYMENT = action('pc', ('user_id', int), ('period', 'period'), optional=('period',), legacy='confirm')
+REJECT_PAYMENT = action('pr', ('user_id', int), ('period', 'period'), optional=('period',), legacy='reject')
+# until — claimed_at самой свежей заявки на экране: более поздние кнопка не подтверждает
+CONFIRM_ALL_PAYMENTS = action('pa', ('until', int), ('period', 'period'), optional=('period',))
+
+# Чеки об оплате
+SKIP_RECEIPT = action('rs')
+OPEN_RECEIPTS = action('ro')
+RECEIPT_NEXT = action('rn', ('receipt_id', int))
+RECEIPT_PREV = action('rv', ('receipt_id', int))
+
+# Выгрузки
+EXPORT = action('ex', ('dataset', str), ('fmt', str))
+
+# Рассылки
+BROADCAST_SEGMENT = action('bg', ('segment', str))
+BROADCAST_CANCEL = action('bx', ('broadcast_id', int))
+
+# Чаты и пользователи
+START_CHAT = action('sc', ('user_id', int), legacy='start_chat')
+ADD_NEW_USER = action('nu', ('user_id', int), legacy='add_new_user')
+SELECT_USER = action('su', ('user_id', int), legacy='select_user')
+CANCEL_SELECTION = action('cs', legacy='cancel_selection')
+CHAT_INFO = action('ci', ('user_id', int), legacy='chat_info')
+CHAT_STATS = action('ct', ('user_id', int), legacy='chat_stats')
+PAYMENT_HISTORY = action('ph', ('user_id', int), legacy='payment_history')
+HISTORY_PAGE = action('hp', ('user_id', int), ('page', int), legacy='history_page')
+HISTORY_CURRENT_PAGE = action('hc', legacy='history_current_page')
+CLOSE_HISTORY = action('hx', legacy='close_history')
+SEND_REMINDER = action('sr', ('user_id', int), legacy='send_reminder')
+SEND_REMINDER_NOW = action('sn', ('user_id', int), legacy='send_reminder_now')
+USER_PAYMENT_STATS = action('us', ('user_id', int), legacy='user_payment_stats')
+EDIT_USER_SETTINGS = action('ue', ('user_id', int), legacy='edit_user_settings')
+DELETE_USER = action('ud', ('user_id', int), legacy='delete_user')
+
+# Настройки администратора
+CHANGE_ALIAS = action('al', legacy='change_alias')
+CHANGE_DEFAULT_MESSAGE = action('dm', legacy='change_default_message')
+TOGGLE_NOTIFICATIONS = action('tn', legacy='toggle_notifications')
+NOTIFICATION_SETTINGS = action('ns', legacy='notification_settings')
+BACK_TO_ADMIN = action('ba', legacy='back_to_admin')
+BACK_TO_SETTINGS = action('bs', legacy='back_to_settings')
+
+# Добавление пользователя
+ENTER_CUSTOM_MSG = action('em', legacy='enter_custom_msg')
+USE_DEFAULT_MSG = action('md', legacy='use_default_msg')
+
+# Универсальное подтверждение действия
+CONFIRM_ACTION = action('ok', ('action', str), ('data', str))
+CANCEL_ACTION = action('no', ('action', str))
+
+class CallbackRouter:
+    """Маршрутизация callback-запросов по префиксу за одно обращение к словарю"""
+
+    def __init__(self):
+        self._handlers: Dict[CallbackAction, Callable[..., Awaitable[Any]]] = {}
+
+    def route(self, item: CallbackAction):
+        """Декоратор: обработчик получает поля callback_data именованными аргументами"""
+        def decorator(handler):
+            if item in self._handlers:
+                raise ValueError(f"Для '{item.prefix}' уже зарегистрирован обработчик")
+            self._handlers[item] = handler
+            return handler
+        return decorator
+
+    def match(self, callback) -> Union[bool, Dict[str, Any]]:
+        """Фильтр aiogram: разобранные данные уходят в обработчик как callback_action
+
+        callback_data разбирается один раз — dispatch получает готовый результат.
+        """
+        decoded = decode(callback.data)
+        if decoded is None or decoded[0] not in self._handlers:
+            return False
+        return {'callback_action': decoded}
+
+    async def dispatch(self, callback, callback_action: Tuple[CallbackAction, Dict[str, Any]], **kwargs):
+        item, values = callback_action
+        return await self._handlers[item](callback, **kwargs, **values)
+
+callback_router = CallbackRouter()
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+import queries
+from queries import execute_many, fetch_all, fetch_one
+from throttle import AsyncRateLimiter
+
+# Telegram удаляет не больше 100 сообщений за вызов deleteMessages
+CLEANUP_CHUNK_SIZE = 100
+# Сколько записей очереди разбирается за проход
+CLEANUP_BATCH_SIZE = int(os.getenv("CLEANUP_BATCH_SIZE", "1000"))
+# Вызовов API в секунду на очистку (уступаем место основной отправке)
+CLEANUP_RATE = float(os.getenv("CLEANUP_RATE", "5"))
+# Интервал проверки очереди очистки (сек)
+CLEANUP_POLL_INTERVAL = float(os.getenv("CLEANUP_POLL_INTERVAL", "30"))
+# Бот может удалять сообщения не старше 48 часов; более старые только правятся
+DELETE_WINDOW = 47 * 3600
+
+_stats = {'deleted': 0, 'edited': 0, 'skipped': 0, 'calls': 0}
+
+_limiter = AsyncRateLimiter(CLEANUP_RATE)
+_wakeup: Optional[asyncio.Event] = None
+_cleanup_task: Optional[asyncio.Task] = None
+
+def create_tables(cursor: sqlite3.Cursor):
+    """Создает очередь устаревших сообщений с напоминаниями"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS message_cleanup (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            sent_at REAL NOT NULL
+        )
+    ''')
+
+def retire_pending(cursor: sqlite3.Cursor, user_id: int, admin_id: int):
+    """Снимает висящие напоминания привязки в транзакции вызывающего кода
+
+    Отправленные напоминания уходят в очередь очистки, еще не отправленные
+    отменяются в outbox, а у периодов сбрасываются message_id и срок оплаты.
+    """
+    retire_pending_many(cursor, [(user_id, admin_id)])
+
+def retire_pending_many(cursor: sqlite3.Cursor, links: List[Tuple[int, int]]):
+    """То же для набора привязок (user_id, admin_id) — по одному executemany на шаг"""
+    execute_many(cursor, 'cleanup_queue_pending', '''
+        INSERT INTO message_cleanup (chat_id, message_id, sent_at)
+        SELECT user_id, message_id, reminded_at
+        FROM payment_periods
+        WHERE user_id = ? AND admin_id = ? AND message_id > 0
+    ''', links)
+    execute_many(cursor, 'cleanup_cancel_unsent', '''
+        DELETE FROM outbox WHERE kind = 'reminder' AND ref_id IN (
+            SELECT id FROM payment_periods
+            WHERE user_id = ? AND admin_id = ? AND message_id = 0
+        )
+    ''', links)
+    execute_many(cursor, 'cleanup_release_pending', '''
+        UPDATE payment_periods SET message_id = NULL, due_at = NULL
+        WHERE user_id = ? AND admin_id = ? AND message_id IS NOT NULL
+    ''', links)
+
+def wake():
+    """Будит очистку, не дожидаясь очередного опроса"""
+    if _wakeup is not None:
+        _wakeup.set()
+
+def _chunks(items: List, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+async def _call(request) -> Optional[bool]:
+    """Вызов API с ограничением частоты
+
+    True — готово, False — сообщение уже не изменить (считаем готовым),
+    None — временная ошибка, запись остается в очереди.
+    """
+    await _limiter.acquire()
+    _stats['calls'] += 1
+    try:
+        await request
+        return True
+    except TelegramRetryAfter as e:
+        _limiter.pause(e.retry_after)
+        return None
+    except (TelegramBadRequest, TelegramForbiddenError):
+        # Сообщение уже удалено, без кнопок или чат недоступен
+        return False
+    except Exception as e:
+        logging.warning(f"Ошибка очистки сообщений: {e}")
+        return None
+
+async def drain_once(bot) -> int:
+    """Удаляет или правит одну пачку устаревших напоминаний, возвращает ее размер"""
+    conn = queries.get_db_connection()
+    cursor = conn.cursor()
+    rows = fetch_all(cursor, 'cleanup_due', '''
+        SELECT id, chat_id, message_id, sent_at FROM message_cleanup ORDER BY id LIMIT ?
+    ''', (CLEANUP_BATCH_SIZE,))
+
+    if not rows:
+        conn.close()
+        return 0
+
+    deletable: Dict[int, List[tuple]] = {}
+    editable = []
+    threshold = time.time() - DELETE_WINDOW
+    for row in rows:
+        if row[3] >= threshold:
+            deletable.setdefault(row[1], []).append(row)
+        else:
+            editable.append(row)
+
+    done = []
+
+    # Свежие сообщения удаляются пачками до 100 на чат
+    for chat_id, chat_rows in deletable.items():
+        for chunk in _chunks(chat_rows, CLEANUP_CHUNK_SIZE):
+            result = await _call(bot.delete_messages(chat_id, [row[2] for row in chunk]))
+            if result is None:
+                continue
+            _stats['deleted' if result else 'skipped'] += len(chunk)
+            done.extend(row[0] for row in chunk)
+
+    # У старых можно только убрать кнопку «Оплачено»
+    for row_id, chat_id, message_id, _ in editable:
+        result = await _call(bot.edit_message_reply_markup(chat_id=chat_id, message_id=message_id))
+        if result is None:
+            continue
+        _stats['edited' if result else 'skipped'] += 1
+        done.append(row_id)
+
+    if done:
+        execute_many(cursor, 'cleanup_done', 'DELETE FROM message_cleanup WHERE id = ?',
+                     [(row_id,) for row_id in done])
+        conn.commit()
+    conn.close()
+
+    return len(rows)
+
+async def _cleanup_loop(bot):
+    """Фоновая очистка устаревших напоминаний"""
+    while True:
+        try:
+            processed = await drain_once(bot)
+        except Exception as e:
+            logging.error(f"Ошибка очистки устаревших напоминаний: {e}")
+            processed = 0
+
+        if processed >= CLEANUP_BATCH_SIZE:
+            continue
+
+        _wakeup.clear()
+        try:
+            await asyncio.wait_for(_wakeup.wait(), CLEANUP_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+def start(bot):
+    """Запускает фоновую очистку"""
+    global _cleanup_task, _wakeup
+
+    if _cleanup_task is not None:
+        return
+
+    _wakeup = asyncio.Event()
+    _cleanup_task = asyncio.get_running_loop().create_task(_cleanup_loop(bot))
+
+def stop():
+    """Останавливает фоновую очистку"""
+    global _cleanup_task
+
+    if _cleanup_task is not None:
+        _cleanup_task.cancel()
+        _cleanup_task = None
+
+def get_cleanup_stats() -> Dict:
+    """Счетчики очистки и размер очереди"""
+    conn = queries.get_db_connection()
+    cursor = conn.cursor()
+    queued = fetch_one(cursor, 'cleanup_size', 'SELECT COUNT(*) FROM message_cleanup')[0]
+    conn.close()
+
+    stats = dict(_stats)
+    stats['queued'] = queued
+    return stats
@@ -0,0 +1,103 @@
+import calendar
+import sqlite3
+import time
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from queries import execute, fetch_all, fetch_one
+
+# Сколько прошедших месяцев проверять при догоняющей отправке
+CATCHUP_MAX_MONTHS = 3
+
+def create_tables(cursor: sqlite3.Cursor):
+    """Создает журнал отправленных напоминаний и служебные отметки бота"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reminder_deliveries (
+            user_id INTEGER NOT NULL,
+            admin_id INTEGER NOT NULL,
+            period TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (user_id, admin_id, period)
+        ) WITHOUT ROWID
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS bot_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    ''')
+
+def get_period(date: Optional[datetime] = None) -> str:
+    """Расчетный период 'YYYY-MM' для даты"""
+    return (date or datetime.now()).strftime('%Y-%m')
+
+def claim_delivery(cursor: sqlite3.Cursor, user_id: int, admin_id: int, period: str) -> bool:
+    """Отмечает напоминание за период отправленным в транзакции вызывающего кода
+
+    Возвращает False, если напоминание за этот период уже было — повторный
+    запуск задачи (misfire, догоняющая отправка) ничего не отправит.
+    """
+    execute(cursor, 'claim_reminder_delivery', '''
+        INSERT OR IGNORE INTO reminder_deliveries (user_id, admin_id, period, created_at)
+        VALUES (?, ?, ?, ?)
+    ''', (user_id, admin_id, period, time.time()))
+    return cursor.rowcount > 0
+
+def get_last_run(cursor: sqlite3.Cursor) -> Optional[datetime]:
+    """Когда бот в последний раз отмечался работающим"""
+    row = fetch_one(cursor, 'get_last_run', "SELECT value FROM bot_meta WHERE key = 'last_run'")
+    return datetime.fromtimestamp(float(row[0])) if row else None
+
+def touch_last_run(cursor: sqlite3.Cursor, date: Optional[datetime] = None):
+    """Отмечает, что бот работал в момент date"""
+    execute(cursor, 'touch_last_run', '''
+        INSERT OR REPLACE INTO bot_meta (key, value) VALUES ('last_run', ?)
+    ''', (str((date or datetime.now()).timestamp()),))
+
+def _periods_between(since: datetime, until: datetime) -> List[Tuple[str, int]]:
+    """Периоды от since до until (не больше CATCHUP_MAX_MONTHS) с числом дней в месяце"""
+    periods = []
+    year, month = until.year, until.month
+    while len(periods) < CATCHUP_MAX_MONTHS and (year, month) >= (since.year, since.month):
+        periods.append((f"{year:04d}-{month:02d}", calendar.monthrange(year, month)[1]))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return periods
+
+def find_missed_reminders(cursor: sqlite3.Cursor, since: datetime,
+                          until: datetime) -> List[Tuple[int, int, str, str]]:
+    """Напоминания, срок которых наступил в (since, until], но которые не отправлены
+
+    Один запрос: привязки x периоды простоя без записи в журнале. Для каждой
+    привязки берется только последний пропущенный период. Как и CronTrigger,
+    день, которого нет в месяце (31 февраля), пропускается.
+    Возвращает (user_id, admin_id, payment_message, period).
+    """
+    periods = _periods_between(since, until)
+    if not periods:
+        return []
+
+    values = ', '.join(['(?, ?)'] * len(periods))
+    params = [item for period in periods for item in period]
+    params += [since.strftime('%Y-%m-%d %H:%M'), until.strftime('%Y-%m-%d %H:%M')]
+
+    return fetch_all(cursor, 'find_missed_reminders', f'''
+        WITH periods(period, days_in_month) AS (VALUES {values}),
+        due AS (
+            SELECT l.user_id, l.admin_id, l.payment_message, p.period,
+                   printf('%s-%02d %02d:%02d', p.period, l.payment_day,
+                          CAST(substr(l.payment_time, 1, instr(l.payment_time, ':') - 1) AS INTEGER),
+                          CAST(substr(l.payment_time, instr(l.payment_time, ':') + 1) AS INTEGER)) AS due_at
+            FROM user_admin_links l
+            JOIN periods p ON l.payment_day <= p.days_in_month
+            WHERE l.delivery_status = 'active'
+        )
+        SELECT user_id, admin_id, payment_message, MAX(period)
+        FROM due
+        WHERE due_at > ? AND due_at <= ?
+          AND NOT EXISTS (
+              SELECT 1 FROM reminder_deliveries d
+              WHERE d.user_id = due.user_id AND d.admin_id = due.admin_id AND d.period = due.period
+          )
+        GROUP BY user_id, admin_id
+    ''', params)
@@ -0,0 +1,172 @@
+import csv
+import gzip
+import io
+import itertools
+import os
+import sqlite3
+import tempfile
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, Optional, Sequence, Tuple
+
+import queries
+from payment_periods import PaymentState
+from queries import execute
+
+try:
+    from openpyxl import Workbook
+except ImportError:
+    Workbook = None
+
+# Сколько строк читать из курсора за раз
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "500"))
+
+FORMAT_CSV = 'csv'
+FORMAT_XLSX = 'xlsx'
+
+_STATUS_NAMES = {
+    PaymentState.REMINDED: 'напоминание',
+    PaymentState.CLAIMED: 'заявлен',
+    PaymentState.CONFIRMED: 'подтвержден',
+    PaymentState.REJECTED: 'отклонен'
+}
+
+# Первые символы, с которых Excel и LibreOffice начинают формулу
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+def _timestamp(value) -> str:
+    return datetime.fromtimestamp(value).strftime('%Y-%m-%d %H:%M:%S') if value else ''
+
+def _payment_row(row: tuple) -> tuple:
+    created_at, user_id, period, status, amount = row
+    return _timestamp(created_at), user_id, period, _STATUS_NAMES.get(status, status), amount
+
+def _safe_cell(value):
+    """Экранирует текст, который табличный редактор выполнил бы как формулу"""
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+def _safe_row(row: tuple) -> tuple:
+    return tuple(_safe_cell(value) for value in row)
+
+class Dataset:
+    """Выгружаемая таблица: заголовок, запрос по admin_id и обработка строки"""
+    __slots__ = ('title', 'header', 'sql', 'params', 'convert')
+
+    def __init__(self, title: str, header: Sequence[str], sql: str, params: int = 1,
+                 convert: Optional[Callable[[tuple], tuple]] = None):
+        self.title = title
+        self.header = header
+        self.sql = sql
+        self.params = params
+        self.convert = convert
+
+DATASETS: Dict[str, Dataset] = {
+    'users': Dataset(
+        'Пользователи',
+        ('user_id', 'день', 'время', 'сумма', 'доставка', 'привязан', 'текст напоминания'),
+        '''
+            SELECT user_id, payment_day, payment_time, expected_amount, delivery_status,
+                   created_at, payment_message
+            FROM user_admin_links WHERE admin_id = ?
+            ORDER BY user_id
+        '''
+    ),
+    'payments': Dataset(
+        'История платежей',
+        ('время', 'user_id', 'период', 'статус', 'сумма'),
+        '''
+            SELECT created_at, user_id, period, status, amount
+            FROM payment_ledger WHERE admin_id = ?
+            ORDER BY id
+        ''',
+        convert=_payment_row
+    ),
+    'messages': Dataset(
+        'Переписка',
+        ('время', 'от', 'кому', 'тип', 'текст'),
+        '''
+            SELECT created_at, from_user_id, to_user_id, message_type, message_content
+            FROM message_history WHERE from_user_id = ? OR to_user_id = ?
+            ORDER BY id
+        ''',
+        params=2
+    )
+}
+
+def get_formats() -> Tuple[str, ...]:
+    """Доступные форматы: XLSX — только если установлен openpyxl"""
+    return (FORMAT_CSV, FORMAT_XLSX) if Workbook is not None else (FORMAT_CSV,)
+
+def iter_rows(cursor: sqlite3.Cursor, name: str, dataset: Dataset, admin_id: int) -> Iterator[tuple]:
+    """Строки выгрузки порциями по EXPORT_CHUNK_ROWS — в памяти не больше одной порции
+
+    Текстовые ячейки уже экранированы от формул — годятся для любого формата.
+    """
+    execute(cursor, f'export_{name}', dataset.sql, (admin_id,) * dataset.params)
+    while True:
+        chunk = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+        if not chunk:
+            return
+        if dataset.convert is not None:
+            chunk = map(dataset.convert, chunk)
+        yield from map(_safe_row, chunk)
+
+def iter_csv(header: Sequence[str], rows: Iterable[tuple]) -> Iterator[str]:
+    """CSV построчно через один переиспользуемый буфер"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in itertools.chain((header,), rows):
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+def _write_csv(path: str, header: Sequence[str], rows: Iterable[tuple]) -> int:
+    """Пишет CSV, сжимая на лету gzip; возвращает число строк"""
+    count = -1  # без заголовка
+    # utf-8-sig — чтобы Excel открыл кириллицу без выбора кодировки
+    with gzip.open(path, 'wt', encoding='utf-8-sig', newline='') as file:
+        for line in iter_csv(header, rows):
+            file.write(line)
+            count += 1
+    return count
+
+def _write_xlsx(path: str, title: str, header: Sequence[str], rows: Iterable[tuple]) -> int:
+    """Пишет XLSX в потоковом режиме openpyxl (write_only не держит лист в памяти)"""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append(header)
+    count = 0
+    for row in rows:
+        sheet.append(row)
+        count += 1
+    workbook.save(path)
+    return count
+
+def build(name: str, admin_id: int, fmt: str = FORMAT_CSV) -> Tuple[str, str, int]:
+    """Собирает выгрузку во временный файл (блокирующе — вызывать в потоке)
+
+    Возвращает (путь, имя файла для отправки, число строк). Файл удаляет вызывающий код.
+    """
+    dataset = DATASETS[name]
+    if fmt not in get_formats():
+        raise ValueError(f"Формат выгрузки недоступен: {fmt}")
+
+    filename = f"{name}_{datetime.now():%Y%m%d_%H%M%S}." + ('csv.gz' if fmt == FORMAT_CSV else 'xlsx')
+    descriptor, path = tempfile.mkstemp(suffix='_' + filename)
+    os.close(descriptor)
+
+    conn = queries.get_db_connection()
+    try:
+        rows = iter_rows(conn.cursor(), name, dataset, admin_id)
+        if fmt == FORMAT_CSV:
+            count = _write_csv(path, dataset.header, rows)
+        else:
+            count = _write_xlsx(path, dataset.title, dataset.header, rows)
+    except Exception:
+        os.remove(path)
+        raise
+    finally:
+        conn.close()
+    return path, filename, count
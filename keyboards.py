@@ -1,5 +1,20 @@
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
-import datetime
+from functools import lru_cache
+from typing import Dict, Optional, Tuple, Union
+
+from callbacks import (
+    PAID, CONTACT_ADMIN, CONFIRM_PAYMENT, REJECT_PAYMENT, CONFIRM_ALL_PAYMENTS, START_CHAT, ADD_NEW_USER,
+    SKIP_RECEIPT, OPEN_RECEIPTS, RECEIPT_NEXT, RECEIPT_PREV, EXPORT,
+    BROADCAST_SEGMENT, BROADCAST_CANCEL,
+    SELECT_USER, CANCEL_SELECTION, CHAT_INFO, CHAT_STATS, PAYMENT_HISTORY, HISTORY_PAGE,
+    HISTORY_CURRENT_PAGE, CLOSE_HISTORY, SEND_REMINDER, SEND_REMINDER_NOW, USER_PAYMENT_STATS,
+    EDIT_USER_SETTINGS, DELETE_USER, CHANGE_ALIAS, CHANGE_DEFAULT_MESSAGE, TOGGLE_NOTIFICATIONS,
+    NOTIFICATION_SETTINGS, BACK_TO_ADMIN, BACK_TO_SETTINGS, ENTER_CUSTOM_MSG, USE_DEFAULT_MSG,
+    CONFIRM_ACTION, CANCEL_ACTION
+)
+
+# Размер LRU-кэша параметризованных клавиатур
+KEYBOARD_CACHE_SIZE = 4096
 
 # Эмодзи для консистентности с main.py
 EMOJI = {
@@ -26,16 +41,41 @@ EMOJI = {
     'bell': '🔔',
     'check': '✔️',
     'loading': '⏳',
-    'rocket': '🚀'
+    'rocket': '🚀',
+    'broadcast': '📢'
 }
 
-def get_user_keyboard() -> ReplyKeyboardMarkup:
+# Подписи кнопок reply-клавиатур. Те же строки используются для маршрутизации
+# текстовых сообщений в main.py, поэтому менять их нужно только здесь.
+BUTTONS = {
+    'my_status': f"{EMOJI['stats']} Мой статус",
+    'contact_admin': f"{EMOJI['chat']} Связь с админом",
+    'list_users': f"{EMOJI['list']} Список пользователей",
+    'payment_stats': f"{EMOJI['stats']} Статистика оплат",
+    'add_user': f"{EMOJI['add']} Добавить пользователя",
+    'remove_user': f"{EMOJI['remove']} Удалить пользователя",
+    'unpaid': f"{EMOJI['search']} Неоплатившие",
+    'overdue': f"{EMOJI['alert']} Просроченные",
+    'confirm_payments': f"{EMOJI['check']} Подтвердить оплаты",
+    'active_chats': f"{EMOJI['chat']} Активные чаты",
+    'admin_settings': f"{EMOJI['settings']} Настройки админа",
+    'broadcast': f"{EMOJI['broadcast']} Рассылка",
+    'admin_panel': f"{EMOJI['settings']} Админ-панель",
+    'back': f"{EMOJI['back']} Назад",
+    'cancel': f"{EMOJI['cancel']} Отмена",
+    'remind_all': f"{EMOJI['bell']} Напомнить всем",
+    'quick_stats': f"{EMOJI['stats']} Быстрая статистика",
+    'check_payments': f"{EMOJI['search']} Проверить оплаты",
+    'main_menu': f"{EMOJI['back']} Главное меню"
+}
+
+def _build_user_keyboard() -> ReplyKeyboardMarkup:
     """Клавиатура для обычных пользователей"""
     keyboard = ReplyKeyboardMarkup(
         keyboard=[
             [
-                KeyboardButton(text=f"{EMOJI['stats']} Мой статус"), 
-                KeyboardButton(text=f"{EMOJI['chat']} Связь с админом")
+                KeyboardButton(text=BUTTONS['my_status']), 
+                KeyboardButton(text=BUTTONS['contact_admin'])
             ]
         ],
         resize_keyboard=True,
@@ -44,28 +84,29 @@ def get_user_keyboard() -> ReplyKeyboardMarkup:
     )
     return keyboard
 
-def get_admin_keyboard() -> ReplyKeyboardMarkup:
+def _build_admin_keyboard() -> ReplyKeyboardMarkup:
     """Клавиатура для администраторов"""
     keyboard = ReplyKeyboardMarkup(
         keyboard=[
             [
-                KeyboardButton(text=f"{EMOJI['list']} Список пользователей"), 
-                KeyboardButton(text=f"{EMOJI['stats']} Статистика оплат")
+                KeyboardButton(text=BUTTONS['list_users']), 
+                KeyboardButton(text=BUTTONS['payment_stats'])
             ],
             [
-                KeyboardButton(text=f"{EMOJI['add']} Добавить пользователя"), 
-                KeyboardButton(text=f"{EMOJI['remove']} Удалить пользователя")
+                KeyboardButton(text=BUTTONS['add_user']), 
+                KeyboardButton(text=BUTTONS['remove_user'])
             ],
             [
-                KeyboardButton(text=f"{EMOJI['search']} Неоплатившие"), 
-                KeyboardButton(text=f"{EMOJI['alert']} Просроченные")
+                KeyboardButton(text=BUTTONS['unpaid']), 
+                KeyboardButton(text=BUTTONS['overdue'])
             ],
             [
-                KeyboardButton(text=f"{EMOJI['check']} Подтвердить оплаты"), 
-                KeyboardButton(text=f"{EMOJI['chat']} Активные чаты")
+                KeyboardButton(text=BUTTONS['confirm_payments']), 
+                KeyboardButton(text=BUTTONS['active_chats'])
             ],
             [
-                KeyboardButton(text=f"{EMOJI['settings']} Настройки админа")
+                KeyboardButton(text=BUTTONS['broadcast']),
+                KeyboardButton(text=BUTTONS['admin_settings'])
             ]
         ],
         resize_keyboard=True,
@@ -74,68 +115,174 @@ def get_admin_keyboard() -> ReplyKeyboardMarkup:
     )
     return keyboard
 
-def get_mixed_keyboard(is_admin: bool) -> ReplyKeyboardMarkup:
-    """Смешанная клавиатура (админ может переключаться между режимами)"""
-    if is_admin:
-        keyboard = ReplyKeyboardMarkup(
-            keyboard=[
-                [
-                    KeyboardButton(text=f"{EMOJI['settings']} Админ-панель")
-                ]
-            ],
-            resize_keyboard=True,
-            one_time_keyboard=False,
-            input_field_placeholder="Выберите действие..."
-        )
-    else:
-        return get_user_keyboard()
-    
+def _build_admin_panel_keyboard() -> ReplyKeyboardMarkup:
+    """Клавиатура админа в пользовательском режиме (переход в админ-панель)"""
+    keyboard = ReplyKeyboardMarkup(
+        keyboard=[
+            [
+                KeyboardButton(text=BUTTONS['admin_panel'])
+            ]
+        ],
+        resize_keyboard=True,
+        one_time_keyboard=False,
+        input_field_placeholder="Выберите действие..."
+    )
     return keyboard
 
-def get_payment_confirmation_keyboard(admin_id: int) -> InlineKeyboardMarkup:
-    """Клавиатура для подтверждения оплаты пользователем"""
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def get_payment_confirmation_keyboard(admin_id: int, period: Optional[str] = None) -> InlineKeyboardMarkup:
+    """Клавиатура для подтверждения оплаты пользователем (period — 'YYYY-MM')"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(
             text=f"{EMOJI['success']} Оплатил", 
-            callback_data=f"paid_{admin_id}"
+            callback_data=PAID.pack(admin_id=admin_id, period=period)
         )],
         [InlineKeyboardButton(
             text=f"{EMOJI['chat']} Связаться с админом", 
-            callback_data=f"contact_admin_{admin_id}"
+            callback_data=CONTACT_ADMIN.pack(admin_id=admin_id)
         )]
     ])
     return keyboard
 
-def get_admin_payment_confirmation_keyboard(user_id: int) -> InlineKeyboardMarkup:
-    """Клавиатура для админа для подтверждения/отклонения оплаты"""
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def get_admin_payment_confirmation_keyboard(user_id: int, period: Optional[str] = None) -> InlineKeyboardMarkup:
+    """Клавиатура для админа для подтверждения/отклонения оплаты (period — 'YYYY-MM')"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [
             InlineKeyboardButton(
                 text=f"{EMOJI['success']} Подтвердить", 
-                callback_data=f"confirm_{user_id}"
+                callback_data=CONFIRM_PAYMENT.pack(user_id=user_id, period=period)
             ),
             InlineKeyboardButton(
                 text=f"{EMOJI['error']} Отклонить", 
-                callback_data=f"reject_{user_id}"
+                callback_data=REJECT_PAYMENT.pack(user_id=user_id, period=period)
             )
         ],
         [InlineKeyboardButton(
             text=f"{EMOJI['chat']} Начать чат", 
-            callback_data=f"start_chat_{user_id}"
+            callback_data=START_CHAT.pack(user_id=user_id)
         )]
     ])
     return keyboard
 
-def get_message_choice_keyboard() -> InlineKeyboardMarkup:
+def get_bulk_confirmation_keyboard(total: int, period: str, period_count: int, until: int) -> InlineKeyboardMarkup:
+    """Клавиатура массового подтверждения: все заявки или только за period, поданные до until"""
+    rows = [[InlineKeyboardButton(
+        text=f"{EMOJI['success']} Подтвердить все ({total})",
+        callback_data=CONFIRM_ALL_PAYMENTS.pack(until=until)
+    )]]
+    if 0 < period_count < total:
+        rows.append([InlineKeyboardButton(
+            text=f"{EMOJI['calendar']} Только за {period} ({period_count})",
+            callback_data=CONFIRM_ALL_PAYMENTS.pack(until=until, period=period)
+        )])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def get_export_keyboard(datasets: Tuple[Tuple[str, str], ...], formats: Tuple[str, ...]) -> InlineKeyboardMarkup:
+    """Выбор выгрузки: строка на таблицу (name, title), кнопка на формат"""
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(
+            text=f"{title} · {fmt.upper()}",
+            callback_data=EXPORT.pack(dataset=name, fmt=fmt)
+        ) for fmt in formats]
+        for name, title in datasets
+    ])
+    return keyboard
+
+def get_broadcast_segments_keyboard(segments) -> InlineKeyboardMarkup:
+    """Выбор получателей рассылки: (сегмент, подпись, число получателей)
+
+    Основные сегменты — по одному в строке, дни оплаты — по четыре.
+    """
+    rows = []
+    days = []
+    for segment, title, count in segments:
+        button = InlineKeyboardButton(
+            text=f"{title} ({count})",
+            callback_data=BROADCAST_SEGMENT.pack(segment=segment)
+        )
+        if segment.startswith('d'):
+            days.append(button)
+        else:
+            rows.append([button])
+    rows.extend(days[i:i + 4] for i in range(0, len(days), 4))
+    rows.append([InlineKeyboardButton(
+        text=f"{EMOJI['cancel']} Отмена",
+        callback_data=CANCEL_ACTION.pack(action='broadcast')
+    )])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def get_broadcast_cancel_keyboard(broadcast_id: int) -> InlineKeyboardMarkup:
+    """Кнопка остановки рассылки под сообщением с прогрессом"""
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(
+            text=f"{EMOJI['cancel']} Остановить рассылку",
+            callback_data=BROADCAST_CANCEL.pack(broadcast_id=broadcast_id)
+        )]
+    ])
+    return keyboard
+
+def _build_skip_receipt_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура запроса чека у пользователя"""
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(
+            text=f"{EMOJI['cancel']} Без чека",
+            callback_data=SKIP_RECEIPT.pack()
+        )]
+    ])
+    return keyboard
+
+def _build_open_receipts_keyboard() -> InlineKeyboardMarkup:
+    """Кнопка перехода к очереди чеков из уведомления админу"""
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(
+            text=f"{EMOJI['search']} Открыть чеки",
+            callback_data=OPEN_RECEIPTS.pack()
+        )]
+    ])
+    return keyboard
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def get_receipt_review_keyboard(receipt_id: int, user_id: int, period: str) -> InlineKeyboardMarkup:
+    """Клавиатура очереди проверки чеков: решение по заявке и листание"""
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(
+                text=f"{EMOJI['success']} Подтвердить",
+                callback_data=CONFIRM_PAYMENT.pack(user_id=user_id, period=period)
+            ),
+            InlineKeyboardButton(
+                text=f"{EMOJI['error']} Отклонить",
+                callback_data=REJECT_PAYMENT.pack(user_id=user_id, period=period)
+            )
+        ],
+        get_receipt_paging_keyboard(receipt_id).inline_keyboard[0]
+    ])
+    return keyboard
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def get_receipt_paging_keyboard(receipt_id: int) -> InlineKeyboardMarkup:
+    """Листание очереди чеков — остается на карточке после решения по заявке"""
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text="◀️", callback_data=RECEIPT_PREV.pack(receipt_id=receipt_id)),
+            InlineKeyboardButton(text="▶️", callback_data=RECEIPT_NEXT.pack(receipt_id=receipt_id))
+        ]
+    ])
+    return keyboard
+
+def _build_message_choice_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура для выбора типа сообщения при добавлении пользователя"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(
             text=f"{EMOJI['chat']} Ввести своё сообщение", 
-            callback_data="enter_custom_msg"
+            callback_data=ENTER_CUSTOM_MSG.pack()
         )],
         [InlineKeyboardButton(
             text=f"{EMOJI['success']} Использовать сообщение по умолчанию", 
-            callback_data="use_default_msg"
+            callback_data=USE_DEFAULT_MSG.pack()
         )]
     ])
     return keyboard
@@ -152,23 +299,23 @@ def get_user_selection_keyboard(users: list[tuple]) -> InlineKeyboardMarkup:
         
         buttons.append([InlineKeyboardButton(
             text=button_text,
-            callback_data=f"select_user_{user_id}"
+            callback_data=SELECT_USER.pack(user_id=user_id)
         )])
     
     # Добавляем кнопку отмены
     buttons.append([InlineKeyboardButton(
         text=f"{EMOJI['cancel']} Отмена",
-        callback_data="cancel_selection"
+        callback_data=CANCEL_SELECTION.pack()
     )])
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
     return keyboard
 
-def get_back_keyboard() -> ReplyKeyboardMarkup:
+def _build_back_keyboard() -> ReplyKeyboardMarkup:
     """Клавиатура с кнопкой назад"""
     keyboard = ReplyKeyboardMarkup(
         keyboard=[
-            [KeyboardButton(text=f"{EMOJI['back']} Назад")]
+            [KeyboardButton(text=BUTTONS['back'])]
         ],
         resize_keyboard=True,
         one_time_keyboard=False,
@@ -176,11 +323,11 @@ def get_back_keyboard() -> ReplyKeyboardMarkup:
     )
     return keyboard
 
-def get_cancel_keyboard() -> ReplyKeyboardMarkup:
+def _build_cancel_keyboard() -> ReplyKeyboardMarkup:
     """Клавиатура для отмены операции"""
     keyboard = ReplyKeyboardMarkup(
         keyboard=[
-            [KeyboardButton(text=f"{EMOJI['cancel']} Отмена")]
+            [KeyboardButton(text=BUTTONS['cancel'])]
         ],
         resize_keyboard=True,
         one_time_keyboard=False,
@@ -188,28 +335,29 @@ def get_cancel_keyboard() -> ReplyKeyboardMarkup:
     )
     return keyboard
 
-def get_settings_keyboard() -> InlineKeyboardMarkup:
+def _build_settings_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура настроек администратора"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(
             text=f"{EMOJI['user']} Изменить псевдоним",
-            callback_data="change_alias"
+            callback_data=CHANGE_ALIAS.pack()
         )],
         [InlineKeyboardButton(
             text=f"{EMOJI['chat']} Изменить сообщение по умолчанию",
-            callback_data="change_default_message"
+            callback_data=CHANGE_DEFAULT_MESSAGE.pack()
         )],
         [InlineKeyboardButton(
             text=f"{EMOJI['bell']} Настройки уведомлений",
-            callback_data="notification_settings"
+            callback_data=NOTIFICATION_SETTINGS.pack()
         )],
         [InlineKeyboardButton(
             text=f"{EMOJI['back']} Назад",
-            callback_data="back_to_admin"
+            callback_data=BACK_TO_ADMIN.pack()
         )]
     ])
     return keyboard
 
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
 def get_notification_settings_keyboard(current_status: bool) -> InlineKeyboardMarkup:
     """Клавиатура настроек уведомлений"""
     status_text = "Выключить" if current_status else "Включить"
@@ -218,39 +366,41 @@ def get_notification_settings_keyboard(current_status: bool) -> InlineKeyboardMa
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(
             text=f"{status_emoji} {status_text} уведомления",
-            callback_data="toggle_notifications"
+            callback_data=TOGGLE_NOTIFICATIONS.pack()
         )],
         [InlineKeyboardButton(
             text=f"{EMOJI['back']} Назад",
-            callback_data="back_to_settings"
+            callback_data=BACK_TO_SETTINGS.pack()
         )]
     ])
     return keyboard
 
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
 def get_chat_actions_keyboard(user_id: int) -> InlineKeyboardMarkup:
     """Клавиатура действий в чате"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [
             InlineKeyboardButton(
                 text=f"{EMOJI['info']} Информация",
-                callback_data=f"chat_info_{user_id}"
+                callback_data=CHAT_INFO.pack(user_id=user_id)
             ),
             InlineKeyboardButton(
                 text=f"{EMOJI['stats']} Статистика",
-                callback_data=f"chat_stats_{user_id}"
+                callback_data=CHAT_STATS.pack(user_id=user_id)
             )
         ],
         [InlineKeyboardButton(
             text=f"{EMOJI['calendar']} История платежей",
-            callback_data=f"payment_history_{user_id}"
+            callback_data=PAYMENT_HISTORY.pack(user_id=user_id)
         )],
         [InlineKeyboardButton(
             text=f"{EMOJI['bell']} Отправить напоминание",
-            callback_data=f"send_reminder_{user_id}"
+            callback_data=SEND_REMINDER.pack(user_id=user_id)
         )]
     ])
     return keyboard
 
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
 def get_payment_history_keyboard(user_id: int, page: int = 0, total_pages: int = 1) -> InlineKeyboardMarkup:
     """Клавиатура для навигации по истории платежей"""
     buttons = []
@@ -260,18 +410,18 @@ def get_payment_history_keyboard(user_id: int, page: int = 0, total_pages: int =
     if page > 0:
         nav_buttons.append(InlineKeyboardButton(
             text="◀️ Назад",
-            callback_data=f"history_page_{user_id}_{page-1}"
+            callback_data=HISTORY_PAGE.pack(user_id=user_id, page=page - 1)
         ))
     
     nav_buttons.append(InlineKeyboardButton(
         text=f"{page+1}/{total_pages}",
-        callback_data="history_current_page"
+        callback_data=HISTORY_CURRENT_PAGE.pack()
     ))
     
     if page < total_pages - 1:
         nav_buttons.append(InlineKeyboardButton(
             text="Вперед ▶️",
-            callback_data=f"history_page_{user_id}_{page+1}"
+            callback_data=HISTORY_PAGE.pack(user_id=user_id, page=page + 1)
         ))
     
     if nav_buttons:
@@ -280,23 +430,23 @@ def get_payment_history_keyboard(user_id: int, page: int = 0, total_pages: int =
     # Кнопка закрытия
     buttons.append([InlineKeyboardButton(
         text=f"{EMOJI['back']} Закрыть",
-        callback_data="close_history"
+        callback_data=CLOSE_HISTORY.pack()
     )])
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
     return keyboard
 
-def get_quick_actions_keyboard() -> ReplyKeyboardMarkup:
+def _build_quick_actions_keyboard() -> ReplyKeyboardMarkup:
     """Клавиатура быстрых действий для админа"""
     keyboard = ReplyKeyboardMarkup(
         keyboard=[
             [
-                KeyboardButton(text=f"{EMOJI['bell']} Напомнить всем"),
-                KeyboardButton(text=f"{EMOJI['stats']} Быстрая статистика")
+                KeyboardButton(text=BUTTONS['remind_all']),
+                KeyboardButton(text=BUTTONS['quick_stats'])
             ],
             [
-                KeyboardButton(text=f"{EMOJI['search']} Проверить оплаты"),
-                KeyboardButton(text=f"{EMOJI['back']} Главное меню")
+                KeyboardButton(text=BUTTONS['check_payments']),
+                KeyboardButton(text=BUTTONS['main_menu'])
             ]
         ],
         resize_keyboard=True,
@@ -304,20 +454,21 @@ def get_quick_actions_keyboard() -> ReplyKeyboardMarkup:
     )
     return keyboard
 
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
 def get_user_actions_keyboard(user_id: int, is_admin: bool = False) -> InlineKeyboardMarkup:
     """Клавиатура действий с пользователем для админа"""
     buttons = [
         [InlineKeyboardButton(
             text=f"{EMOJI['chat']} Начать чат",
-            callback_data=f"start_chat_{user_id}"
+            callback_data=START_CHAT.pack(user_id=user_id)
         )],
         [InlineKeyboardButton(
             text=f"{EMOJI['stats']} Статистика платежей",
-            callback_data=f"user_payment_stats_{user_id}"
+            callback_data=USER_PAYMENT_STATS.pack(user_id=user_id)
         )],
         [InlineKeyboardButton(
             text=f"{EMOJI['settings']} Изменить настройки",
-            callback_data=f"edit_user_settings_{user_id}"
+            callback_data=EDIT_USER_SETTINGS.pack(user_id=user_id)
         )]
     ]
     
@@ -325,31 +476,126 @@ def get_user_actions_keyboard(user_id: int, is_admin: bool = False) -> InlineKey
         buttons.append([
             InlineKeyboardButton(
                 text=f"{EMOJI['bell']} Отправить напоминание",
-                callback_data=f"send_reminder_now_{user_id}"
+                callback_data=SEND_REMINDER_NOW.pack(user_id=user_id)
             )
         ])
         buttons.append([
             InlineKeyboardButton(
                 text=f"{EMOJI['remove']} Удалить пользователя",
-                callback_data=f"delete_user_{user_id}"
+                callback_data=DELETE_USER.pack(user_id=user_id)
             )
         ])
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
     return keyboard
 
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
 def get_confirmation_keyboard(action: str, data: str) -> InlineKeyboardMarkup:
     """Универсальная клавиатура подтверждения действия"""
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [
             InlineKeyboardButton(
                 text=f"{EMOJI['success']} Да, подтверждаю",
-                callback_data=f"confirm_{action}_{data}"
+                callback_data=CONFIRM_ACTION.pack(action=action, data=data)
             ),
             InlineKeyboardButton(
                 text=f"{EMOJI['cancel']} Отмена",
-                callback_data=f"cancel_{action}"
+                callback_data=CANCEL_ACTION.pack(action=action)
             )
         ]
     ])
-    return keyboard
\ No newline at end of file
+    return keyboard
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def get_admin_settings_keyboard(show_notifications: bool) -> InlineKeyboardMarkup:
+    """Клавиатура экрана настроек администратора"""
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=f"{EMOJI['user']} Изменить псевдоним", callback_data=CHANGE_ALIAS.pack())],
+        [InlineKeyboardButton(text=f"{EMOJI['chat']} Изменить сообщение", callback_data=CHANGE_DEFAULT_MESSAGE.pack())],
+        [InlineKeyboardButton(
+            text=f"{EMOJI['bell']} {'Выключить' if show_notifications else 'Включить'} уведомления",
+            callback_data=TOGGLE_NOTIFICATIONS.pack()
+        )]
+    ])
+    return keyboard
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def get_new_user_keyboard(user_id: int) -> InlineKeyboardMarkup:
+    """Клавиатура уведомления админа о новом пользователе"""
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(
+            text=f"{EMOJI['add']} Добавить пользователя",
+            callback_data=ADD_NEW_USER.pack(user_id=user_id)
+        )]
+    ])
+    return keyboard
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def get_contact_admin_keyboard(admin_id: int) -> InlineKeyboardMarkup:
+    """Клавиатура связи с админом после отклонения платежа"""
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(
+            text=f"{EMOJI['chat']} Связаться с администратором",
+            callback_data=CONTACT_ADMIN.pack(admin_id=admin_id)
+        )]
+    ])
+    return keyboard
+
+# Реестр статических клавиатур: строятся один раз при импорте модуля.
+# Возвращаемые объекты общие для всех вызовов — их нельзя изменять.
+KEYBOARDS: Dict[str, Union[ReplyKeyboardMarkup, InlineKeyboardMarkup]] = {
+    'user': _build_user_keyboard(),
+    'admin': _build_admin_keyboard(),
+    'admin_panel': _build_admin_panel_keyboard(),
+    'back': _build_back_keyboard(),
+    'cancel': _build_cancel_keyboard(),
+    'message_choice': _build_message_choice_keyboard(),
+    'settings': _build_settings_keyboard(),
+    'quick_actions': _build_quick_actions_keyboard(),
+    'skip_receipt': _build_skip_receipt_keyboard(),
+    'open_receipts': _build_open_receipts_keyboard()
+}
+
+def get_keyboard(name: str) -> Union[ReplyKeyboardMarkup, InlineKeyboardMarkup]:
+    """Возвращает статическую клавиатуру из реестра"""
+    return KEYBOARDS[name]
+
+def get_user_keyboard() -> ReplyKeyboardMarkup:
+    """Клавиатура для обычных пользователей"""
+    return KEYBOARDS['user']
+
+def get_admin_keyboard() -> ReplyKeyboardMarkup:
+    """Клавиатура для администраторов"""
+    return KEYBOARDS['admin']
+
+def get_mixed_keyboard(is_admin: bool) -> ReplyKeyboardMarkup:
+    """Смешанная клавиатура (админ может переключаться между режимами)"""
+    return KEYBOARDS['admin_panel'] if is_admin else KEYBOARDS['user']
+
+def get_back_keyboard() -> ReplyKeyboardMarkup:
+    """Клавиатура с кнопкой назад"""
+    return KEYBOARDS['back']
+
+def get_cancel_keyboard() -> ReplyKeyboardMarkup:
+    """Клавиатура для отмены операции"""
+    return KEYBOARDS['cancel']
+
+def get_message_choice_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура для выбора типа сообщения при добавлении пользователя"""
+    return KEYBOARDS['message_choice']
+
+def get_settings_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура настроек администратора"""
+    return KEYBOARDS['settings']
+
+def get_quick_actions_keyboard() -> ReplyKeyboardMarkup:
+    """Клавиатура быстрых действий для админа"""
+    return KEYBOARDS['quick_actions']
+
+def get_skip_receipt_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура запроса чека у пользователя"""
+    return KEYBOARDS['skip_receipt']
+
+def get_open_receipts_keyboard() -> InlineKeyboardMarkup:
+    """Кнопка перехода к очереди чеков"""
+    return KEYBOARDS['open_receipts']
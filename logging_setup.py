@@ -0,0 +1,192 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+from datetime import datetime
+from typing import Dict
+
+# По умолчанию из каждых N сообщений с ключом выборки пишется одно
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "100"))
+# Размер пачки и максимальная задержка записи в файл
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "200"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "1.0"))
+
+# Стандартные атрибуты LogRecord, не попадающие в JSON как дополнительные поля
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись лога в одну строку JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage()
+        }
+
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                data[key] = value
+
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exc'] = record.exc_text
+        if record.stack_info:
+            data['stack'] = record.stack_info
+
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только каждое N-е сообщение с одинаковым sample_key
+
+    Ключ и частота задаются через extra: {'sample_key': ..., 'sample_every': N}.
+    Сообщения без ключа проходят всегда.
+    """
+
+    def __init__(self, default_every: int = LOG_SAMPLE_EVERY):
+        super().__init__()
+        self.default_every = max(default_every, 1)
+        self._counters: Dict[str, int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, 'sample_key', None)
+        if key is None or record.levelno >= logging.WARNING:
+            return True
+
+        every = max(getattr(record, 'sample_every', self.default_every), 1)
+        seen = self._counters.get(key, 0)
+        self._counters[key] = seen + 1
+
+        if seen % every:
+            return False
+
+        # В пропущенную запись добавляем число отброшенных до нее
+        record.sampled_out = every - 1 if seen else 0
+        return True
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, сохраняющий трассировку отдельно от текста сообщения
+
+    Стандартный prepare() дописывает трассировку в msg, и в JSON она попадает
+    внутрь текста. Здесь она форматируется в exc_text (сам traceback с кадрами
+    в очередь не передается), а msg остается текстом сообщения.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+_exception_formatter = logging.Formatter()
+
+class BatchingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Ротируемый файловый обработчик, пишущий записи пачками
+
+    Проверка ротации выполняется один раз на пачку, а не на каждую запись.
+    Предупреждения и ошибки сбрасываются на диск сразу.
+    """
+
+    def __init__(self, *args, batch_size: int = LOG_BATCH_SIZE,
+                 flush_interval: float = LOG_FLUSH_INTERVAL, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._timer = None
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            line = self.format(record) + self.terminator
+        except Exception:
+            self.handleError(record)
+            return
+
+        self.acquire()
+        try:
+            self._buffer.append(line)
+            if len(self._buffer) >= self.batch_size or record.levelno >= logging.WARNING:
+                self._flush_buffer()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        finally:
+            self.release()
+
+    def _flush_buffer(self):
+        """Записывает накопленную пачку (вызывается под блокировкой)"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        if not self._buffer:
+            return
+
+        data = ''.join(self._buffer)
+        self._buffer.clear()
+
+        if self.stream is None:
+            self.stream = self._open()
+
+        if self.maxBytes > 0:
+            self.stream.seek(0, 2)
+            position = self.stream.tell()
+            if position and position + len(data.encode(self.encoding or 'utf-8')) >= self.maxBytes:
+                self.doRollover()
+
+        self.stream.write(data)
+        self.stream.flush()
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self.stream is not None or self._buffer:
+                self._flush_buffer()
+        finally:
+            self.release()
+
+    def close(self):
+        self.flush()
+        super().close()
+
+def setup_logging(log_file: str = 'bot.log', level: int = logging.INFO) -> logging.handlers.QueueListener:
+    """Настраивает логирование через очередь с записью в фоновом потоке
+
+    Обработчики вызывающего кода только кладут запись в очередь; форматирование
+    и запись в файл/консоль выполняет QueueListener в отдельном потоке.
+    """
+    log_queue = queue.SimpleQueue()
+
+    file_handler = BatchingRotatingFileHandler(
+        log_file,
+        maxBytes=10*1024*1024,  # 10 MB
+        backupCount=5,
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(JsonFormatter())
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    queue_handler = StructuredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter())
+
+    logging.basicConfig(level=level, handlers=[queue_handler], force=True)
+
+    listener = logging.handlers.QueueListener(
+        log_queue, file_handler, stream_handler, respect_handler_level=True
+    )
+    listener.start()
+    atexit.register(listener.stop)
+
+    return listener
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, Optional, Set, Tuple
+
+import queries
+
+# Интервал замера задержки цикла событий
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL_MS", "100")) / 1000
+# Порог задержки, после которого снимается стек блокирующего кода
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "250")) / 1000
+# Режим отладки: предупреждать о синхронных запросах к БД из корутин
+LOOP_DEBUG = os.getenv("LOOP_DEBUG", "0") == "1"
+
+# Верхние границы корзин гистограммы (мс)
+HISTOGRAM_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_histogram = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+_lag_stats = {'samples': 0, 'total': 0.0, 'max': 0.0, 'stalls': 0}
+_last_heartbeat = time.monotonic()
+_loop_thread_id: Optional[int] = None
+_probe_task: Optional[asyncio.Task] = None
+_watchdog_thread: Optional[threading.Thread] = None
+_stop_event = threading.Event()
+_reported_db_calls: Set[Tuple[str, str, int]] = set()
+
+def _record_lag(lag: float):
+    """Добавляет замер задержки в гистограмму"""
+    lag_ms = lag * 1000
+    for i, bound in enumerate(HISTOGRAM_BUCKETS_MS):
+        if lag_ms <= bound:
+            _histogram[i] += 1
+            break
+    else:
+        _histogram[-1] += 1
+
+    _lag_stats['samples'] += 1
+    _lag_stats['total'] += lag
+    if lag > _lag_stats['max']:
+        _lag_stats['max'] = lag
+
+async def _lag_probe():
+    """Периодически засыпает и измеряет, насколько позже проснулся цикл"""
+    global _last_heartbeat
+    loop = asyncio.get_running_loop()
+
+    while True:
+        expected = loop.time() + LOOP_LAG_INTERVAL
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag = max(loop.time() - expected, 0.0)
+        _last_heartbeat = time.monotonic()
+        _record_lag(lag)
+
+def _watchdog():
+    """Фоновый поток: снимает стек цикла событий, если тот завис"""
+    reported_heartbeat = None
+
+    while not _stop_event.wait(LOOP_LAG_THRESHOLD / 2):
+        heartbeat = _last_heartbeat
+        stalled_for = time.monotonic() - heartbeat - LOOP_LAG_INTERVAL
+
+        if stalled_for < LOOP_LAG_THRESHOLD or heartbeat == reported_heartbeat:
+            continue
+
+        # Одно предупреждение на каждое зависание
+        reported_heartbeat = heartbeat
+        _lag_stats['stalls'] += 1
+
+        frame = sys._current_frames().get(_loop_thread_id)
+        stack = ''.join(traceback.format_stack(frame)) if frame else 'стек недоступен'
+        logging.warning(
+            f"Цикл событий заблокирован более {stalled_for * 1000:.0f} мс. "
+            f"Текущий стек:\n{stack}"
+        )
+
+def _flag_sync_db_call(name: str, elapsed: float):
+    """Предупреждает о синхронном запросе к БД, выполненном внутри цикла событий"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return
+
+    # Место вызова за пределами слоя запросов
+    caller = next(
+        (frame for frame in reversed(traceback.extract_stack()[:-1])
+         if os.path.basename(frame.filename) not in ('queries.py', 'loop_monitor.py')),
+        None
+    )
+    if caller is None:
+        return
+
+    key = (name, caller.filename, caller.lineno)
+    if key in _reported_db_calls:
+        return
+    _reported_db_calls.add(key)
+
+    logging.warning(
+        f"Синхронный запрос к БД {name} из корутины ({elapsed * 1000:.1f} мс): "
+        f"{os.path.basename(caller.filename)}:{caller.lineno} в {caller.name}"
+    )
+
+def start():
+    """Запускает замер задержки и сторожевой поток"""
+    global _probe_task, _watchdog_thread, _loop_thread_id, _last_heartbeat
+
+    if _probe_task is not None:
+        return
+
+    _loop_thread_id = threading.get_ident()
+    _last_heartbeat = time.monotonic()
+    _stop_event.clear()
+
+    _probe_task = asyncio.get_running_loop().create_task(_lag_probe())
+    _watchdog_thread = threading.Thread(target=_watchdog, name="loop-watchdog", daemon=True)
+    _watchdog_thread.start()
+
+    if LOOP_DEBUG:
+        queries.add_query_listener(_flag_sync_db_call)
+
+    logging.info(
+        f"Мониторинг цикла событий запущен (интервал {LOOP_LAG_INTERVAL * 1000:.0f} мс, "
+        f"порог {LOOP_LAG_THRESHOLD * 1000:.0f} мс)"
+    )
+
+def stop():
+    """Останавливает мониторинг"""
+    global _probe_task, _watchdog_thread
+
+    _stop_event.set()
+    if _probe_task is not None:
+        _probe_task.cancel()
+        _probe_task = None
+    _watchdog_thread = None
+
+def get_lag_stats() -> Dict:
+    """Возвращает сводку задержек и гистограмму"""
+    samples = _lag_stats['samples']
+    histogram = {}
+    for i, bound in enumerate(HISTOGRAM_BUCKETS_MS):
+        histogram[f"<={bound}"] = _histogram[i]
+    histogram[f">{HISTOGRAM_BUCKETS_MS[-1]}"] = _histogram[-1]
+
+    return {
+        'samples': samples,
+        'avg_ms': _lag_stats['total'] / samples * 1000 if samples else 0.0,
+        'max_ms': _lag_stats['max'] * 1000,
+        'stalls': _lag_stats['stalls'],
+        'histogram': histogram
+    }
+
+def reset_lag_stats():
+    """Сбрасывает накопленные замеры"""
+    for i in range(len(_histogram)):
+        _histogram[i] = 0
+    _lag_stats.update(samples=0, total=0.0, max=0.0, stalls=0)
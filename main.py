@@ -1,15 +1,16 @@
 import asyncio
-import sqlite3
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+from functools import partial
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 import logging
 import html
-import logging.handlers
+import math
 import os
 from dotenv import load_dotenv
 
 from aiogram import Bot, Dispatcher, F
-from aiogram.types import Message, CallbackQuery, BotCommand, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
+from aiogram.types import Message, CallbackQuery, BotCommand, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton, BufferedInputFile, FSInputFile, InputMediaPhoto, InputMediaDocument, InputMediaVideo, InputMediaAudio
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
@@ -17,6 +18,56 @@ from aiogram.fsm.storage.memory import MemoryStorage
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 
+from queries import execute, execute_many, fetch_one, fetch_all, get_top_queries, reset_query_stats, add_column_if_missing
+import queries
+import loop_monitor
+from logging_setup import setup_logging
+import profiler
+import tracing
+from middlewares import TracingMiddleware, TracingRequestMiddleware
+from text_router import text_router
+import templates
+from status_cache import status_cache
+from paid_sets import paid_sets
+import outbox
+import deliveries
+import slots
+import cleanup
+import payment_periods
+from payment_periods import PaymentState
+from batch_sender import send_batch
+import receipts
+import revenue
+import exports
+import bulk_import
+import broadcasts
+import relay
+from throttle import AsyncRateLimiter
+from callbacks import (
+    callback_router,
+    decode as decode_callback,
+    PAID,
+    CONTACT_ADMIN,
+    CONFIRM_PAYMENT,
+    REJECT_PAYMENT,
+    CONFIRM_ALL_PAYMENTS,
+    SKIP_RECEIPT,
+    OPEN_RECEIPTS,
+    RECEIPT_NEXT,
+    RECEIPT_PREV,
+    EXPORT,
+    BROADCAST_SEGMENT,
+    BROADCAST_CANCEL,
+    CANCEL_ACTION,
+    START_CHAT,
+    ADD_NEW_USER,
+    CHANGE_ALIAS,
+    CHANGE_DEFAULT_MESSAGE,
+    TOGGLE_NOTIFICATIONS,
+    ENTER_CUSTOM_MSG,
+    USE_DEFAULT_MSG
+)
+
 # Импорт клавиатур
 from keyboards import (
     get_user_keyboard, 
@@ -24,8 +75,21 @@ from keyboards import (
     get_mixed_keyboard,
     get_payment_confirmation_keyboard,
     get_admin_payment_confirmation_keyboard,
+    get_bulk_confirmation_keyboard,
+    get_skip_receipt_keyboard,
+    get_open_receipts_keyboard,
+    get_receipt_review_keyboard,
+    get_receipt_paging_keyboard,
+    get_export_keyboard,
+    get_broadcast_segments_keyboard,
+    get_broadcast_cancel_keyboard,
     get_cancel_keyboard,
-    get_back_keyboard
+    get_back_keyboard,
+    get_message_choice_keyboard,
+    get_admin_settings_keyboard,
+    get_new_user_keyboard,
+    get_contact_admin_keyboard,
+    BUTTONS
 )
 
 # Загрузка переменных окружения
@@ -45,6 +109,29 @@ if not ADMINS:
 # Дни на оплату
 PAYMENT_TIMEOUT_DAYS = int(os.getenv("PAYMENT_TIMEOUT_DAYS", "1"))
 
+# Догоняющая отправка пропущенных за время простоя напоминаний
+CATCHUP_BATCH_SIZE = int(os.getenv("CATCHUP_BATCH_SIZE", "20"))
+CATCHUP_BATCH_INTERVAL = float(os.getenv("CATCHUP_BATCH_INTERVAL", "2"))
+# Как часто бот отмечает, что он работает (сек)
+HEARTBEAT_INTERVAL = int(os.getenv("HEARTBEAT_INTERVAL", "60"))
+
+# Час ежедневной сводки о пользователях, до которых не доходят сообщения
+DEAD_CHAT_DIGEST_HOUR = int(os.getenv("DEAD_CHAT_DIGEST_HOUR", "10"))
+
+# Массовое подтверждение: правок сообщений в секунду и частота отчета о прогрессе (сек)
+BULK_EDIT_RATE = float(os.getenv("BULK_EDIT_RATE", "20"))
+BULK_PROGRESS_INTERVAL = float(os.getenv("BULK_PROGRESS_INTERVAL", "3"))
+
+# Сколько запросов можно запросить в /query_stats
+QUERY_STATS_MAX = 50
+
+# Причины недоступности чата для отчетов
+DEAD_CHAT_REASONS = {
+    outbox.CHAT_FORBIDDEN: 'заблокировал бота',
+    outbox.CHAT_NOT_FOUND: 'чат не найден',
+    outbox.CHAT_DEACTIVATED: 'аккаунт удален'
+}
+
 # Эмодзи для визуального оформления
 EMOJI = {
     'success': '✅',
@@ -70,7 +157,8 @@ EMOJI = {
     'check': '✔️',
     'loading': '⏳',
     'rocket': '🚀',
-    'broadcast': '📢'
+    'broadcast': '📢',
+    'receipt': '🧾'
 }
 
 # Состояния для FSM
@@ -80,6 +168,8 @@ class AdminStates(StatesGroup):
     waiting_time = State()
     waiting_message = State()
     waiting_unlink_user = State()
+    waiting_import = State()
+    waiting_broadcast = State()
     waiting_confirm_payment = State()
     waiting_alias = State()
     waiting_default_message = State()
@@ -87,6 +177,7 @@ class AdminStates(StatesGroup):
 
 class UserStates(StatesGroup):
     chatting_with_admin = State()
+    waiting_receipt = State()
     admin_mode = State()
     user_mode = State()
 
@@ -95,6 +186,11 @@ bot = Bot(token=BOT_TOKEN)
 dp = Dispatcher(storage=MemoryStorage())
 scheduler = AsyncIOScheduler()
 
+# Трассировка: обновление -> запросы к БД -> вызовы Telegram API
+dp.update.outer_middleware(TracingMiddleware())
+bot.session.middleware(TracingRequestMiddleware())
+queries.add_query_listener(tracing.record_db_span)
+
 # Вспомогательные функции для форматирования
 def escape_html(text: str) -> str:
     """Экранирует HTML-специальные символы"""
@@ -114,6 +210,16 @@ def format_date(date: datetime) -> str:
     """Форматирует дату в читаемый вид"""
     return date.strftime('%d.%m.%Y %H:%M')
 
+def parse_amount(text: str) -> Optional[float]:
+    """Сумма из текста («1500», «1 500,50 ₽»); None, если это не положительное число"""
+    try:
+        amount = float(text.replace('₽', '').replace(' ', '').replace(',', '.'))
+    except ValueError:
+        return None
+    if not math.isfinite(amount) or amount <= 0:
+        return None
+    return round(amount, 2)
+
 def format_payment_info(day: int, time: str, message: str) -> str:
     """Форматирует информацию о платеже"""
     return (
@@ -123,14 +229,41 @@ def format_payment_info(day: int, time: str, message: str) -> str:
         f"{'...' if len(message) > 100 else ''}</i>"
     )
 
+# Фоновые задачи обработчиков: ссылка хранится, пока задача не завершится
+_background_tasks = set()
+
+def run_in_background(coro) -> asyncio.Task:
+    """Запускает корутину, не дожидаясь ее в обработчике"""
+    task = asyncio.create_task(tracing.detached(coro))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+async def append_to_message(message: Message, suffix: str, reply_markup: Optional[InlineKeyboardMarkup] = None):
+    """Дописывает строку к тексту сообщения или к подписи под фото/документом"""
+    if message.text is not None:
+        await message.edit_text(message.text + suffix, reply_markup=reply_markup, parse_mode='HTML')
+    else:
+        await message.edit_caption(caption=(message.caption or '') + suffix, reply_markup=reply_markup, parse_mode='HTML')
+
+def get_receipt_paging(message: Message) -> Optional[InlineKeyboardMarkup]:
+    """Листание для карточки из очереди чеков, None для прочих сообщений"""
+    markup = message.reply_markup
+    for row in (markup.inline_keyboard if markup else ()):
+        for button in row:
+            decoded = decode_callback(button.callback_data)
+            if decoded is not None and decoded[0] is RECEIPT_NEXT:
+                return get_receipt_paging_keyboard(decoded[1]['receipt_id'])
+    return None
+
 # Заменяем все случаи использования разделительной линии
 def format_divider() -> str:
     """Возвращает отформатированную разделительную линию"""
-    return f"{'━' * 20}\n\n"
+    return templates.DIVIDER
 
 # База данных
 def init_db():
-    conn = sqlite3.connect('payment_bot.db')
+    conn = get_db_connection()
     cursor = conn.cursor()
     
     # Таблица настроек админов
@@ -158,31 +291,6 @@ def init_db():
         )
     ''')
     
-    # Таблица платежей
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS payments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            admin_id INTEGER NOT NULL,
-            payment_date DATE NOT NULL,
-            confirmed BOOLEAN DEFAULT FALSE,
-            amount REAL DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Таблица для хранения ID сообщений для удаления
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS pending_payments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            admin_id INTEGER NOT NULL,
-            message_id INTEGER NOT NULL,
-            due_date TIMESTAMP NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
     # Таблица активных чатов
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS active_chats (
@@ -206,12 +314,48 @@ def init_db():
         )
     ''')
     
+    # Очередь исходящих сообщений
+    outbox.create_tables(cursor)
+    
+    # Журнал отправленных напоминаний по периодам
+    deliveries.create_tables(cursor)
+    
+    # Очередь удаления устаревших напоминаний
+    cleanup.create_tables(cursor)
+    
+    # Состояние оплаты по периодам и журнал платежей
+    payment_periods.create_tables(cursor)
+    # Итоги выручки — до переноса старых платежей, чтобы триггер учел и их
+    revenue.create_tables(cursor)
+    payment_periods.migrate_legacy(cursor)
+    
+    # Чеки об оплате
+    receipts.create_tables(cursor)
+    
+    # Рассылки
+    broadcasts.create_tables(cursor)
+    
+    # Поиск привязок по слоту напоминания (день, время)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_links_slot ON user_admin_links(payment_day, payment_time)')
+    
+    # Доставляемость: чаты, заблокировавшие бота, исключаются из рассылок
+    add_column_if_missing(cursor, 'user_admin_links', 'delivery_status', "TEXT NOT NULL DEFAULT 'active'")
+    add_column_if_missing(cursor, 'user_admin_links', 'delivery_error_at', 'REAL')
+    add_column_if_missing(cursor, 'user_admin_links', 'delivery_notified', 'BOOLEAN NOT NULL DEFAULT FALSE')
+    
+    # Ожидаемая сумма ежемесячного платежа по привязке
+    add_column_if_missing(cursor, 'user_admin_links', 'expected_amount', 'REAL NOT NULL DEFAULT 0')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_links_undelivered ON user_admin_links(delivery_notified)
+        WHERE delivery_status != 'active'
+    ''')
+    
     conn.commit()
     conn.close()
 
 # Утилиты для работы с базой данных
 def get_db_connection():
-    return sqlite3.connect('payment_bot.db')
+    return queries.get_db_connection()
 
 def is_admin(user_id: int) -> bool:
     return user_id in ADMINS
@@ -219,101 +363,99 @@ def is_admin(user_id: int) -> bool:
 def get_admin_for_user(user_id: int) -> Optional[int]:
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT admin_id FROM user_admin_links WHERE user_id = ?', (user_id,))
-    result = cursor.fetchone()
+    result = fetch_one(cursor, 'get_admin_for_user',
+                       'SELECT admin_id FROM user_admin_links WHERE user_id = ?', (user_id,))
     conn.close()
     return result[0] if result else None
 
 def get_users_for_admin(admin_id: int) -> List[tuple]:
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
+    result = fetch_all(cursor, 'get_users_for_admin', '''
         SELECT user_id, payment_day, payment_time, payment_message 
         FROM user_admin_links WHERE admin_id = ?
         ORDER BY payment_day, payment_time
     ''', (admin_id,))
-    result = cursor.fetchall()
     conn.close()
     return result
 
 def add_user_to_admin(user_id: int, admin_id: int, day: int, time: str, message: str):
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        INSERT OR REPLACE INTO user_admin_links 
+    # Повторное добавление меняет только расписание: сумма, статус доставки
+    # и id привязки сохраняются (статус сам вернется в 'active', когда пользователь напишет боту)
+    execute(cursor, 'add_user_to_admin', '''
+        INSERT INTO user_admin_links
         (user_id, admin_id, payment_day, payment_time, payment_message)
         VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, admin_id) DO UPDATE
+        SET payment_day = excluded.payment_day, payment_time = excluded.payment_time,
+            payment_message = excluded.payment_message
     ''', (user_id, admin_id, day, time, message))
     conn.commit()
     conn.close()
+    status_cache.invalidate(user_id, admin_id)
+    paid_sets.add_member(user_id, admin_id)
 
 def remove_user_from_admin(user_id: int, admin_id: int):
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('DELETE FROM user_admin_links WHERE user_id = ? AND admin_id = ?', 
-                   (user_id, admin_id))
+    execute(cursor, 'remove_user_from_admin',
+            'DELETE FROM user_admin_links WHERE user_id = ? AND admin_id = ?',
+            (user_id, admin_id))
+    # Кнопки «Оплачено» в старых напоминаниях больше не нужны
+    cleanup.retire_pending(cursor, user_id, admin_id)
     conn.commit()
     conn.close()
+    status_cache.invalidate(user_id, admin_id)
+    paid_sets.remove_member(user_id, admin_id)
+    cleanup.wake()
 
 def get_payment_stats(admin_id: int) -> Dict:
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # Общая статистика
-    cursor.execute('''
-        SELECT COUNT(*) FROM payments WHERE admin_id = ? AND confirmed = TRUE
-    ''', (admin_id,))
-    confirmed_payments = cursor.fetchone()[0]
-    
-    cursor.execute('''
-        SELECT COUNT(*) FROM payments WHERE admin_id = ? AND confirmed = FALSE
-    ''', (admin_id,))
-    pending_payments = cursor.fetchone()[0]
-    
-    cursor.execute('''
-        SELECT COUNT(*) FROM user_admin_links WHERE admin_id = ?
-    ''', (admin_id,))
-    total_users = cursor.fetchone()[0]
-    
-    # Статистика за текущий месяц
-    current_month = datetime.now().replace(day=1)
-    cursor.execute('''
-        SELECT COUNT(*) FROM payments 
-        WHERE admin_id = ? AND confirmed = TRUE AND payment_date >= ?
-    ''', (admin_id, current_month))
-    month_payments = cursor.fetchone()[0]
-    
-    # Просроченные платежи
-    cursor.execute('''
-        SELECT COUNT(*) FROM pending_payments 
-        WHERE admin_id = ? AND due_date <= ?
-    ''', (admin_id, datetime.now()))
-    overdue_payments = cursor.fetchone()[0]
-    
-    # Сумма платежей за месяц
-    cursor.execute('''
-        SELECT SUM(amount) FROM payments 
-        WHERE admin_id = ? AND confirmed = TRUE AND payment_date >= ?
-    ''', (admin_id, current_month))
-    month_amount = cursor.fetchone()[0] or 0
+    # Вся сводка одним запросом по idx_payment_periods_admin
+    now = int(datetime.now().timestamp())
+    row = fetch_one(cursor, 'payment_stats', '''
+        SELECT
+            COUNT(*) FILTER (WHERE state = :confirmed),
+            COUNT(*) FILTER (WHERE state = :claimed),
+            (SELECT COUNT(*) FROM user_admin_links WHERE admin_id = :admin_id),
+            COUNT(*) FILTER (WHERE due_at <= :now)
+        FROM payment_periods
+        WHERE admin_id = :admin_id
+    ''', {
+        'admin_id': admin_id,
+        'now': now,
+        'confirmed': PaymentState.CONFIRMED,
+        'claimed': PaymentState.CLAIMED
+    })
+    # Месячные итоги — готовой строкой из revenue_rollups
+    month_payments, month_amount = revenue.get_month(cursor, admin_id, deliveries.get_period())
+    expected_links, expected_amount = revenue.get_expected(cursor, admin_id)
     
     conn.close()
     
+    confirmed, pending, total_users, overdue = row
     return {
-        'confirmed': confirmed_payments,
-        'pending': pending_payments,
+        'confirmed': confirmed,
+        'pending': pending,
         'total_users': total_users,
         'month_payments': month_payments,
-        'overdue': overdue_payments,
-        'month_amount': month_amount
+        'overdue': overdue,
+        'month_amount': month_amount,
+        'expected_links': expected_links,
+        'expected_amount': expected_amount
     }
 
 def get_admin_settings(admin_id: int) -> tuple:
     """Получить настройки админа"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT alias, default_message, show_notifications FROM admin_settings WHERE admin_id = ?', (admin_id,))
-    result = cursor.fetchone()
+    result = fetch_one(cursor, 'get_admin_settings',
+                       'SELECT alias, default_message, show_notifications FROM admin_settings WHERE admin_id = ?',
+                       (admin_id,))
     conn.close()
     
     if result:
@@ -327,7 +469,7 @@ def create_admin_settings(admin_id: int):
     """Создать настройки админа по умолчанию"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
+    execute(cursor, 'create_admin_settings', '''
         INSERT OR IGNORE INTO admin_settings (admin_id, alias, default_message, show_notifications)
         VALUES (?, ?, ?, ?)
     ''', (admin_id, 'Администратор', 'Время оплаты! Пожалуйста, оплатите услуги.', True))
@@ -338,25 +480,27 @@ def update_admin_alias(admin_id: int, alias: str):
     """Обновить псевдоним админа"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
+    execute(cursor, 'update_admin_alias', '''
         UPDATE admin_settings SET alias = ? WHERE admin_id = ?
     ''', (alias, admin_id))
     if cursor.rowcount == 0:
-        cursor.execute('''
+        execute(cursor, 'insert_admin_alias', '''
             INSERT INTO admin_settings (admin_id, alias) VALUES (?, ?)
         ''', (admin_id, alias))
     conn.commit()
     conn.close()
+    # Псевдоним показывается и в карточках пользователей
+    status_cache.invalidate_admin(admin_id)
 
 def update_admin_default_message(admin_id: int, message: str):
     """Обновить сообщение по умолчанию"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
+    execute(cursor, 'update_admin_default_message', '''
         UPDATE admin_settings SET default_message = ? WHERE admin_id = ?
     ''', (message, admin_id))
     if cursor.rowcount == 0:
-        cursor.execute('''
+        execute(cursor, 'insert_admin_default_message', '''
             INSERT INTO admin_settings (admin_id, default_message) VALUES (?, ?)
         ''', (admin_id, message))
     conn.commit()
@@ -366,7 +510,7 @@ def start_chat_session(user_id: int, admin_id: int):
     """Начать сессию чата"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
+    execute(cursor, 'start_chat_session', '''
         INSERT OR REPLACE INTO active_chats (user_id, admin_id)
         VALUES (?, ?)
     ''', (user_id, admin_id))
@@ -377,7 +521,7 @@ def end_chat_session(user_id: int, admin_id: int):
     """Завершить сессию чата"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
+    execute(cursor, 'end_chat_session', '''
         DELETE FROM active_chats WHERE user_id = ? AND admin_id = ?
     ''', (user_id, admin_id))
     conn.commit()
@@ -387,8 +531,9 @@ def get_active_chats_for_admin(admin_id: int) -> List[int]:
     """Получить список активных чатов для админа"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT user_id FROM active_chats WHERE admin_id = ?', (admin_id,))
-    result = [row[0] for row in cursor.fetchall()]
+    rows = fetch_all(cursor, 'get_active_chats_for_admin',
+                     'SELECT user_id FROM active_chats WHERE admin_id = ?', (admin_id,))
+    result = [row[0] for row in rows]
     conn.close()
     return result
 
@@ -396,21 +541,73 @@ def is_chat_active(user_id: int, admin_id: int) -> bool:
     """Проверить активен ли чат"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM active_chats WHERE user_id = ? AND admin_id = ?', (user_id, admin_id))
-    result = cursor.fetchone()[0] > 0
+    result = fetch_one(cursor, 'is_chat_active',
+                       'SELECT COUNT(*) FROM active_chats WHERE user_id = ? AND admin_id = ?',
+                       (user_id, admin_id))[0] > 0
     conn.close()
     return result
 
 def add_message_to_history(from_user_id: int, to_user_id: int, message_type: str, content: str = None):
     """Добавить сообщение в историю"""
+    add_messages_to_history([(from_user_id, to_user_id, message_type, content)])
+
+def add_messages_to_history(rows: List[tuple]):
+    """Добавить в историю пачку сообщений (from_user_id, to_user_id, type, content) одним commit"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
+    execute_many(cursor, 'add_message_to_history', '''
         INSERT INTO message_history (from_user_id, to_user_id, message_type, message_content)
         VALUES (?, ?, ?, ?)
-    ''', (from_user_id, to_user_id, message_type, content))
+    ''', rows)
+    conn.commit()
+    conn.close()
+
+def mark_chat_dead(user_id: int, reason: str):
+    """Помечает привязки пользователя недоставляемыми — напоминания ему больше не отправляются"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    execute(cursor, 'mark_chat_dead', '''
+        UPDATE user_admin_links
+        SET delivery_status = ?, delivery_error_at = ?, delivery_notified = FALSE
+        WHERE user_id = ? AND delivery_status = 'active'
+    ''', (reason, datetime.now().timestamp(), user_id))
+    marked = cursor.rowcount
+    conn.commit()
+    conn.close()
+    
+    if marked:
+        logging.info(f"Пользователь {user_id} недоступен ({reason}), напоминания приостановлены")
+
+def reactivate_user(user_id: int):
+    """Возвращает в рассылку пользователя, снова написавшего боту"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    admin_ids = [row[0] for row in fetch_all(cursor, 'dead_links_for_user', '''
+        SELECT admin_id FROM user_admin_links WHERE user_id = ? AND delivery_status != 'active'
+    ''', (user_id,))]
+    
+    if not admin_ids:
+        conn.close()
+        return
+    
+    execute(cursor, 'reactivate_user', '''
+        UPDATE user_admin_links
+        SET delivery_status = 'active', delivery_error_at = NULL, delivery_notified = FALSE
+        WHERE user_id = ?
+    ''', (user_id,))
+    for admin_id in admin_ids:
+        outbox.enqueue(
+            cursor,
+            'notification',
+            admin_id,
+            f"{EMOJI['success']} Пользователь ID: <code>{user_id}</code> снова доступен, "
+            f"напоминания возобновлены."
+        )
     conn.commit()
     conn.close()
+    outbox.wake()
+    
+    logging.info(f"Пользователь {user_id} снова доступен, напоминания возобновлены")
 
 # Обработчики команд
 @dp.message(Command("start"))
@@ -437,6 +634,9 @@ async def start_handler(message: Message, state: FSMContext):
         
         await message.answer(text, reply_markup=keyboard, parse_mode='HTML')
     else:
+        # Пользователь снова пишет боту — значит, сообщения до него доходят
+        reactivate_user(user_id)
+        
         admin_id = get_admin_for_user(user_id)
         keyboard = get_user_keyboard()
         
@@ -446,11 +646,10 @@ async def start_handler(message: Message, state: FSMContext):
             # Получаем информацию о настройках платежа
             conn = get_db_connection()
             cursor = conn.cursor()
-            cursor.execute('''
+            payment_info = fetch_one(cursor, 'start_payment_info', '''
                 SELECT payment_day, payment_time FROM user_admin_links 
                 WHERE user_id = ? AND admin_id = ?
             ''', (user_id, admin_id))
-            payment_info = cursor.fetchone()
             conn.close()
             
             text = (
@@ -481,12 +680,7 @@ async def start_handler(message: Message, state: FSMContext):
             await message.answer(text, reply_markup=keyboard, parse_mode='HTML')
             
             # Уведомляем всех админов о новом пользователе
-            admin_keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(
-                    text=f"{EMOJI['add']} Добавить пользователя",
-                    callback_data=f"add_new_user_{user_id}"
-                )]
-            ])
+            admin_keyboard = get_new_user_keyboard(user_id)
             
             admin_text = (
                 f"{EMOJI['bell']} <b>Новый пользователь в системе!</b>\n"
@@ -552,8 +746,390 @@ async def quick_chat_command(message: Message, state: FSMContext):
     except (ValueError, IndexError):
         await message.answer(f"{EMOJI['error']} Неверный формат команды. Используйте: /chat_USER_ID")
 
+# Единая точка входа для нажатий reply-кнопок: текст кнопки -> обработчик
+@dp.message(F.text.func(text_router.can_handle))
+async def route_button(message: Message, state: FSMContext):
+    await text_router.dispatch(message, state=state)
+
+# Статистика SQL-запросов для админов
+@dp.message(Command("query_stats"))
+async def query_stats_command(message: Message):
+    if not is_admin(message.from_user.id):
+        await message.answer(f"{EMOJI['error']} У вас нет прав администратора.")
+        return
+    
+    args = message.text.split()[1:]
+    
+    if args and args[0] == "reset":
+        reset_query_stats()
+        await message.answer(f"{EMOJI['success']} Статистика запросов сброшена.")
+        return
+    
+    try:
+        limit = int(args[0]) if args else 10
+    except ValueError:
+        await message.answer(f"{EMOJI['error']} Используйте: /query_stats [N] или /query_stats reset")
+        return
+    
+    top_queries = get_top_queries(max(1, min(limit, QUERY_STATS_MAX)))
+    
+    if not top_queries:
+        await message.answer(f"{EMOJI['info']} Статистика запросов пока пуста.")
+        return
+    
+    blocks = [f"{EMOJI['stats']} <b>Самые затратные запросы (топ {len(top_queries)}):</b>\n" + format_divider()]
+    
+    for i, (name, stats) in enumerate(top_queries, 1):
+        avg_ms = stats['total'] / stats['count'] * 1000
+        blocks.append(
+            f"<b>{i}. {escape_html(name)}</b>\n"
+            f"   Вызовов: <b>{stats['count']}</b> | Строк: <b>{stats['rows']}</b>\n"
+            f"   Всего: <b>{stats['total'] * 1000:.1f} мс</b> | "
+            f"Сред.: <b>{avg_ms:.2f} мс</b> | Макс.: <b>{stats['max'] * 1000:.1f} мс</b>\n\n"
+        )
+    
+    cache_stats = status_cache.get_stats()
+    text = format_divider()
+    text += f"{EMOJI['info']} Кэш статусов: попаданий <b>{cache_stats['hits']}</b>, "
+    text += f"промахов <b>{cache_stats['misses']}</b>, карточек <b>{cache_stats['size']}</b>\n"
+    
+    paid_stats = paid_sets.get_stats()
+    text += f"{EMOJI['info']} Множества оплат: админов <b>{paid_stats['admins']}</b>, "
+    text += f"загрузок <b>{paid_stats['loads']}</b>, попаданий <b>{paid_stats['hits']}</b>"
+    blocks.append(text)
+    
+    for text in templates.split_messages(blocks):
+        await message.answer(text, parse_mode='HTML')
+
+# Задержки цикла событий для админов
+@dp.message(Command("loop_stats"))
+async def loop_stats_command(message: Message):
+    if not is_admin(message.from_user.id):
+        await message.answer(f"{EMOJI['error']} У вас нет прав администратора.")
+        return
+    
+    if message.text.split()[1:] == ["reset"]:
+        loop_monitor.reset_lag_stats()
+        await message.answer(f"{EMOJI['success']} Статистика задержек сброшена.")
+        return
+    
+    stats = loop_monitor.get_lag_stats()
+    
+    text = f"{EMOJI['clock']} <b>Задержка цикла событий</b>\n"
+    text += format_divider()
+    text += f"• Замеров: <b>{stats['samples']}</b>\n"
+    text += f"• Средняя: <b>{stats['avg_ms']:.2f} мс</b>\n"
+    text += f"• Максимальная: <b>{stats['max_ms']:.1f} мс</b>\n"
+    text += f"• Зависаний: <b>{stats['stalls']}</b>\n\n"
+    text += f"{EMOJI['stats']} <b>Гистограмма (мс):</b>\n"
+    
+    for bucket, count in stats['histogram'].items():
+        if count:
+            text += f"<code>{escape_html(bucket):>7}</code> {count}\n"
+    
+    await message.answer(text, parse_mode='HTML')
+
+# Состояние очереди исходящих сообщений
+@dp.message(Command("outbox"))
+async def outbox_command(message: Message):
+    if not is_admin(message.from_user.id):
+        await message.answer(f"{EMOJI['error']} У вас нет прав администратора.")
+        return
+    
+    stats = outbox.get_outbox_stats()
+    
+    text = f"{EMOJI['broadcast']} <b>Очередь сообщений</b>\n"
+    text += format_divider()
+    text += f"• В очереди: <b>{stats['queued']}</b> (готовы к отправке: <b>{stats['due']}</b>)\n"
+    text += f"• Отправлено: <b>{stats['sent']}</b> за <b>{stats['batches']}</b> пачек\n"
+    text += f"• Повторов: <b>{stats['retried']}</b>\n"
+    text += f"• Не доставлено: <b>{stats['dead']}</b> (всего в архиве: <b>{stats['dead_total']}</b>)\n"
+    
+    cleanup_stats = cleanup.get_cleanup_stats()
+    text += f"\n{EMOJI['remove']} <b>Очистка напоминаний:</b>\n"
+    text += f"• Удалено: <b>{cleanup_stats['deleted']}</b>, снято кнопок: <b>{cleanup_stats['edited']}</b>\n"
+    text += f"• Пропущено: <b>{cleanup_stats['skipped']}</b>, вызовов API: <b>{cleanup_stats['calls']}</b>\n"
+    text += f"• В очереди: <b>{cleanup_stats['queued']}</b>\n"
+
+    text += f"\n{EMOJI['chat']} <b>Пересылка в чатах:</b>\n"
+    relay_stats = relay.chats.get_stats()
+    text += (
+        f"• <b>{relay_stats['items']}</b> сообщений в <b>{relay_stats['batches']}</b> отправках, "
+        f"ожидают: <b>{relay_stats['pending']}</b>\n"
+    )
+
+    dead_letters = outbox.get_dead_letters(5)
+    if dead_letters:
+        text += f"\n{EMOJI['alert']} <b>Последние недоставленные:</b>\n"
+        for row_id, kind, chat_id, attempts, last_error, failed_at in dead_letters:
+            text += (
+                f"• {format_date(datetime.fromtimestamp(failed_at))} {escape_html(kind)} → "
+                f"<code>{chat_id}</code>, попыток {attempts}: {escape_html((last_error or '')[:80])}\n"
+            )
+    
+    await message.answer(text, parse_mode='HTML')
+
+# Распределение напоминаний по слотам
+@dp.message(Command("slots"))
+async def slots_command(message: Message):
+    if not is_admin(message.from_user.id):
+        await message.answer(f"{EMOJI['error']} У вас нет прав администратора.")
+        return
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    load = slots.get_slot_load(cursor)
+    conn.close()
+    
+    if not load:
+        await message.answer(f"{EMOJI['info']} Напоминаний пока нет.")
+        return
+    
+    hot = [count for count in load.values() if slots.is_hot(count)]
+    
+    text = f"{EMOJI['calendar']} <b>Нагрузка по слотам напоминаний</b>\n"
+    text += format_divider()
+    text += f"• Напоминаний: <b>{sum(load.values())}</b> в <b>{len(load)}</b> слотах\n"
+    text += f"• Горячих слотов (>{slots.SLOT_HOT_THRESHOLD}): <b>{len(hot)}</b>, в них <b>{sum(hot)}</b> напоминаний\n"
+    text += f"• Окно разнесения: <b>{slots.SLOT_SPREAD_WINDOW} с</b>, подготовка за <b>{slots.SLOT_PRERENDER_LEAD} с</b>\n\n"
+    text += f"{EMOJI['stats']} <b>Самые загруженные:</b>\n"
+    text += f"<pre>{escape_html(chr(10).join(slots.render_load_histogram(load)))}</pre>"
+    
+    await message.answer(text, parse_mode='HTML')
+
+# Профилирование по запросу админа
+@dp.message(Command("profile"))
+async def profile_command(message: Message):
+    if not is_admin(message.from_user.id):
+        await message.answer(f"{EMOJI['error']} У вас нет прав администратора.")
+        return
+    
+    args = message.text.split()[1:]
+    try:
+        seconds = int(args[0]) if args else 30
+    except ValueError:
+        await message.answer(f"{EMOJI['error']} Используйте: /profile [секунды]")
+        return
+    
+    seconds = max(1, min(seconds, profiler.PROFILE_MAX_SECONDS))
+    # Не блокируем обработку обновлений на время профилирования
+    if not profiler.start_profile(seconds, partial(send_profile_report, message.chat.id, seconds)):
+        await message.answer(f"{EMOJI['warning']} Профилирование уже запущено.")
+        return
+    
+    await message.answer(f"{EMOJI['loading']} Профилирование запущено на <b>{seconds} с</b>...", parse_mode='HTML')
+
+async def send_profile_report(chat_id: int, seconds: int, report: str):
+    """Отправляет снятый профиль документом"""
+    await bot.send_document(
+        chat_id,
+        BufferedInputFile(report.encode('utf-8'), filename=f"profile_{datetime.now():%Y%m%d_%H%M%S}.txt"),
+        caption=f"{EMOJI['stats']} Профиль за {seconds} с"
+    )
+
+@dp.message(Command("mem_snapshot"))
+async def mem_snapshot_command(message: Message):
+    if not is_admin(message.from_user.id):
+        await message.answer(f"{EMOJI['error']} У вас нет прав администратора.")
+        return
+    
+    if message.text.split()[1:] == ["reset"]:
+        profiler.reset_memory_tracking()
+        await message.answer(f"{EMOJI['success']} Отслеживание памяти остановлено.")
+        return
+    
+    counts = {
+        'Состояния FSM': len(getattr(dp.storage, 'storage', {})),
+        'Задачи планировщика': len(scheduler.get_jobs())
+    }
+    report = await asyncio.to_thread(profiler.take_memory_snapshot, counts)
+    
+    await message.answer_document(
+        BufferedInputFile(report.encode('utf-8'), filename=f"memory_{datetime.now():%Y%m%d_%H%M%S}.txt"),
+        caption=f"{EMOJI['stats']} Снимок памяти"
+    )
+
+# Самые долгие трассы обновлений
+@dp.message(Command("traces"))
+async def traces_command(message: Message):
+    if not is_admin(message.from_user.id):
+        await message.answer(f"{EMOJI['error']} У вас нет прав администратора.")
+        return
+    
+    args = message.text.split()[1:]
+    try:
+        limit = int(args[0]) if args else 5
+    except ValueError:
+        await message.answer(f"{EMOJI['error']} Используйте: /traces [N]")
+        return
+    
+    slowest = tracing.get_slowest_traces(limit)
+    
+    if not slowest:
+        await message.answer(
+            f"{EMOJI['info']} Трасс пока нет. Доля выборки: <b>{tracing.TRACE_SAMPLE_RATE:.0%}</b>",
+            parse_mode='HTML'
+        )
+        return
+    
+    report = '\n\n'.join(tracing.render_waterfall(trace) for trace in slowest)
+    await message.answer_document(
+        BufferedInputFile(report.encode('utf-8'), filename=f"traces_{datetime.now():%Y%m%d_%H%M%S}.txt"),
+        caption=f"{EMOJI['clock']} Самые долгие трассы: {len(slowest)}"
+    )
+
+# Очередь проверки чеков
+@dp.message(Command("receipts"))
+async def receipts_command(message: Message):
+    if not is_admin(message.from_user.id):
+        await message.answer(f"{EMOJI['error']} У вас нет прав администратора.")
+        return
+    await open_receipt_queue(message.from_user.id)
+
+# Ожидаемая сумма платежа по привязке
+@dp.message(Command("amount"))
+async def amount_command(message: Message):
+    admin_id = message.from_user.id
+    if not is_admin(admin_id):
+        await message.answer(f"{EMOJI['error']} У вас нет прав администратора.")
+        return
+    
+    args = message.text.split(maxsplit=2)[1:]
+    user_id = int(args[0]) if args and args[0].isdigit() else None
+    amount = None
+    if len(args) == 2:
+        amount = 0.0 if args[1] == '0' else parse_amount(args[1])
+    if user_id is None or amount is None:
+        await message.answer(f"{EMOJI['error']} Используйте: /amount ID сумма (0 — без суммы)")
+        return
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    updated = fetch_one(cursor, 'set_expected_amount', '''
+        UPDATE user_admin_links SET expected_amount = ?
+        WHERE user_id = ? AND admin_id = ?
+        RETURNING id
+    ''', (amount, user_id, admin_id))
+    conn.commit()
+    conn.close()
+    
+    if updated is None:
+        await message.answer(f"{EMOJI['error']} Пользователь <code>{user_id}</code> не привязан к вам.", parse_mode='HTML')
+        return
+    
+    status_cache.invalidate(user_id, admin_id)
+    await message.answer(
+        f"{EMOJI['success']} Сумма платежа для <code>{user_id}</code>: <b>{amount:.2f} ₽</b>",
+        parse_mode='HTML'
+    )
+
+# Выручка по месяцам из revenue_rollups
+@dp.message(Command("revenue"))
+async def revenue_command(message: Message):
+    admin_id = message.from_user.id
+    if not is_admin(admin_id):
+        await message.answer(f"{EMOJI['error']} У вас нет прав администратора.")
+        return
+    
+    args = message.text.split()[1:]
+    try:
+        months = max(1, min(int(args[0]), 120)) if args else 12
+    except ValueError:
+        await message.answer(f"{EMOJI['error']} Используйте: /revenue [число месяцев]")
+        return
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    rows = revenue.get_trend(cursor, admin_id, months)
+    conn.close()
+    
+    if not rows:
+        await message.answer(f"{EMOJI['info']} Подтвержденных платежей пока нет.")
+        return
+    
+    peak = max(amount for _, _, amount in rows) or 1
+    blocks = [templates.REVENUE_HEADER.render()]
+    years = {}
+    for period, payments, amount in rows:
+        blocks.append(templates.REVENUE_ROW.render(
+            period=period,
+            bar='▇' * round(amount / peak * 10) or '·',
+            amount=amount,
+            payments=payments
+        ))
+        year = years.setdefault(period[:4], [0, 0.0])
+        year[0] += payments
+        year[1] += amount
+    
+    if len(years) > 1:
+        blocks.append('\n')
+        for year, (payments, amount) in years.items():
+            blocks.append(templates.REVENUE_YEAR.render(year=year, amount=amount, payments=payments))
+    
+    total = sum(amount for _, _, amount in rows)
+    blocks.append(templates.REVENUE_FOOTER.render(months=len(rows), amount=total, average=total / len(rows)))
+    
+    for text in templates.split_messages(blocks):
+        await message.answer(text, parse_mode='HTML')
+
+# Выгрузки в CSV/XLSX
+# Админы, у которых выгрузка уже собирается
+_running_exports = set()
+
+@dp.message(Command("export"))
+async def export_command(message: Message):
+    if not is_admin(message.from_user.id):
+        await message.answer(f"{EMOJI['error']} У вас нет прав администратора.")
+        return
+    
+    datasets = tuple((name, dataset.title) for name, dataset in exports.DATASETS.items())
+    await message.answer(
+        f"{EMOJI['list']} <b>Выгрузка</b>\n"
+        f"CSV сжимается в .csv.gz — его открывает Excel после распаковки.\n"
+        f"Что выгрузить?",
+        reply_markup=get_export_keyboard(datasets, exports.get_formats()),
+        parse_mode='HTML'
+    )
+
+@callback_router.route(EXPORT)
+async def export_callback(callback: CallbackQuery, state: FSMContext, dataset: str, fmt: str):
+    admin_id = callback.from_user.id
+    if not is_admin(admin_id):
+        await callback.answer(f"{EMOJI['error']} У вас нет прав администратора.", show_alert=True)
+        return
+    if dataset not in exports.DATASETS or fmt not in exports.get_formats():
+        await callback.answer(f"{EMOJI['error']} Выгрузка недоступна", show_alert=True)
+        return
+    if admin_id in _running_exports:
+        await callback.answer(f"{EMOJI['loading']} Предыдущая выгрузка еще готовится", show_alert=True)
+        return
+    
+    _running_exports.add(admin_id)
+    await callback.answer(f"{EMOJI['loading']} Готовлю выгрузку...")
+    # Файл собирается в фоне — обработка обновлений не ждет
+    run_in_background(send_export(callback.message.chat.id, admin_id, dataset, fmt))
+
+async def send_export(chat_id: int, admin_id: int, dataset: str, fmt: str):
+    """Собирает выгрузку в потоке и отправляет файлом; файл читается с диска порциями"""
+    title = exports.DATASETS[dataset].title
+    path = None
+    try:
+        path, filename, count = await asyncio.to_thread(exports.build, dataset, admin_id, fmt)
+        await bot.send_document(
+            chat_id,
+            FSInputFile(path, filename=filename),
+            caption=f"{EMOJI['list']} {title}: {count} строк"
+        )
+    except Exception as e:
+        logging.error(f"Ошибка выгрузки {dataset} для {admin_id}: {e}")
+        await bot.send_message(chat_id, f"{EMOJI['error']} Не удалось подготовить выгрузку «{title}».")
+    finally:
+        _running_exports.discard(admin_id)
+        if path is not None:
+            os.remove(path)
+
 # Обработчики кнопок
-@dp.message(F.text == f"{EMOJI['settings']} Админ-панель")
+@text_router.route(BUTTONS['admin_panel'])
 async def admin_panel_button(message: Message, state: FSMContext):
     if not is_admin(message.from_user.id):
         await message.answer(f"{EMOJI['error']} У вас нет прав администратора.")
@@ -583,129 +1159,136 @@ async def admin_panel_button(message: Message, state: FSMContext):
     
     await message.answer(text, reply_markup=keyboard, parse_mode='HTML')
 
-@dp.message(F.text == f"{EMOJI['stats']} Мой статус")
-async def status_button(message: Message):
-    user_id = message.from_user.id
-    admin_id = get_admin_for_user(user_id)
+def get_admin_status_text(admin_id: int) -> str:
+    """Карточка статуса администратора (из кэша, если не устарела)"""
+    text = status_cache.get(admin_id, admin_id)
+    if text is not None:
+        return text
     
-    await bot.send_chat_action(message.chat.id, "typing")
+    stats = get_payment_stats(admin_id)
+    alias, default_message, show_notifications = get_admin_settings(admin_id)
     
-    if is_admin(user_id):
-        # Статус админа
-        users = get_users_for_admin(user_id)
-        stats = get_payment_stats(user_id)
-        alias, default_message, show_notifications = get_admin_settings(user_id)
-        
-        text = f"{EMOJI['admin']} <b>Ваш статус: Администратор</b>\n"
-        text += format_divider()
-        
-        text += f"{EMOJI['user']} <b>Профиль:</b>\n"
-        text += f"• Псевдоним: <b>{escape_html(alias)}</b>\n"
-        text += f"• Уведомления: <b>{'Включены' if show_notifications else 'Выключены'}</b>\n\n"
-        
-        text += f"{EMOJI['stats']} <b>Статистика:</b>\n"
-        text += f"• Пользователей: <b>{stats['total_users']}</b>\n"
-        text += f"• Всего платежей: <b>{stats['confirmed']}</b>\n"
-        text += f"• За текущий месяц: <b>{stats['month_payments']}</b>\n"
-        
-        if stats['month_amount'] > 0:
-            text += f"• Сумма за месяц: <b>{stats['month_amount']:.2f} ₽</b>\n"
-        
-        if stats['pending'] > 0:
-            text += f"{format_divider()}"
-            text += f"\n{EMOJI['loading']} Ожидают подтверждения: <b>{stats['pending']}</b>\n"
-        
-        if stats['overdue'] > 0:
-            text += f"{format_divider()}"
-            text += f"{EMOJI['alert']} Просроченных: <b>{stats['overdue']}</b>\n"
-        
-        # Процент успешных платежей
-        if stats['confirmed'] + stats['pending'] > 0:
-            success_rate = (stats['confirmed'] / (stats['confirmed'] + stats['pending']) * 100)
-            text += f"{format_divider()}"
-            text += f"{EMOJI['success']} Успешность платежей: <b>{success_rate:.1f}%</b>"
-        
+    parts = [templates.ADMIN_STATUS.render(
+        alias=alias,
+        notifications='Включены' if show_notifications else 'Выключены',
+        total_users=stats['total_users'],
+        confirmed=stats['confirmed'],
+        month_payments=stats['month_payments']
+    )]
+    
+    if stats['month_amount'] > 0:
+        parts.append(templates.MONTH_AMOUNT.render(amount=stats['month_amount']))
+    if stats['expected_amount'] > 0:
+        parts.append(templates.EXPECTED_AMOUNT.render(amount=stats['expected_amount'], links=stats['expected_links']))
+    
+    if stats['pending'] > 0:
+        parts.append(templates.ADMIN_STATUS_PENDING.render(pending=stats['pending']))
+    
+    if stats['overdue'] > 0:
+        parts.append(templates.ADMIN_STATUS_OVERDUE.render(overdue=stats['overdue']))
+    
+    # Процент успешных платежей
+    if stats['confirmed'] + stats['pending'] > 0:
+        success_rate = (stats['confirmed'] / (stats['confirmed'] + stats['pending']) * 100)
+        parts.append(templates.ADMIN_STATUS_SUCCESS_RATE.render(rate=success_rate))
+    
+    text = ''.join(parts)
+    
+    # Месячная статистика устаревает с началом нового месяца
+    month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    next_month = (month_start + timedelta(days=32)).replace(day=1)
+    status_cache.set(admin_id, admin_id, text, expires_at=next_month.timestamp())
+    return text
+
+def get_user_status_card(user_id: int, admin_id: int) -> Optional[dict]:
+    """Неизменная во времени часть статуса пользователя (из кэша или из БД)"""
+    card = status_cache.get(user_id, admin_id)
+    if card is not None:
+        return card
+    
+    # Получаем информацию о настройках
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    result = fetch_one(cursor, 'status_link', '''
+        SELECT payment_day, payment_time, payment_message, expected_amount
+        FROM user_admin_links WHERE user_id = ? AND admin_id = ?
+    ''', (user_id, admin_id))
+    
+    if not result:
+        conn.close()
+        return None
+    
+    # Статистика платежей пользователя
+    confirmed_count, pending_count, last_payment = fetch_one(cursor, 'status_payments', '''
+        SELECT COUNT(*) FILTER (WHERE state = ?),
+               COUNT(*) FILTER (WHERE state = ?),
+               MAX(resolved_at) FILTER (WHERE state = ?)
+        FROM payment_periods
+        WHERE user_id = ? AND admin_id = ?
+    ''', (PaymentState.CONFIRMED, PaymentState.CLAIMED, PaymentState.CONFIRMED, user_id, admin_id))
+    
+    conn.close()
+    
+    # Получаем псевдоним админа
+    admin_alias, _, _ = get_admin_settings(admin_id)
+    
+    day, time, msg, expected_amount = result
+    head = templates.USER_STATUS.render(
+        alias=admin_alias,
+        day=day,
+        time=time,
+        confirmed=confirmed_count
+    )
+    if expected_amount > 0:
+        head += templates.USER_STATUS_AMOUNT.render(amount=expected_amount)
+    if pending_count > 0:
+        head += templates.USER_STATUS_PENDING.render(pending=pending_count)
+    
+    card = {
+        'head': head,
+        'day': day,
+        'time': time,
+        'last_payment': datetime.fromtimestamp(last_payment) if last_payment else None
+    }
+    status_cache.set(user_id, admin_id, card)
+    return card
+
+def render_user_status(card: dict) -> str:
+    """Дорисовывает к карточке части, зависящие от текущего времени"""
+    parts = [card['head']]
+    
+    if card['last_payment']:
+        days_ago = (datetime.now() - card['last_payment']).days
+        parts.append(templates.USER_STATUS_LAST_PAYMENT.render(days_ago=days_ago))
+    
+    # Следующее напоминание
+    next_reminder = calculate_next_reminder(card['day'], card['time'])
+    if next_reminder:
+        parts.append(templates.USER_STATUS_NEXT_REMINDER.render(next_reminder=format_date(next_reminder)))
+    
+    parts.append(templates.USER_STATUS_FOOTER.render())
+    return ''.join(parts)
+
+@text_router.route(BUTTONS['my_status'])
+async def status_button(message: Message, state: FSMContext):
+    user_id = message.from_user.id
+    
+    await bot.send_chat_action(message.chat.id, "typing")
+    
+    if is_admin(user_id):
+        # Статус админа
+        text = get_admin_status_text(user_id)
     else:
         # Статус пользователя
+        admin_id = get_admin_for_user(user_id)
         if admin_id:
-            # Получаем информацию о настройках
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT payment_day, payment_time, payment_message 
-                FROM user_admin_links WHERE user_id = ? AND admin_id = ?
-            ''', (user_id, admin_id))
-            result = cursor.fetchone()
-            
-            # Статистика платежей пользователя
-            cursor.execute('''
-                SELECT COUNT(*) FROM payments 
-                WHERE user_id = ? AND admin_id = ? AND confirmed = TRUE
-            ''', (user_id, admin_id))
-            confirmed_count = cursor.fetchone()[0]
-            
-            cursor.execute('''
-                SELECT COUNT(*) FROM payments 
-                WHERE user_id = ? AND admin_id = ? AND confirmed = FALSE
-            ''', (user_id, admin_id))
-            pending_count = cursor.fetchone()[0]
-            
-            # Последний платеж
-            cursor.execute('''
-                SELECT payment_date FROM payments 
-                WHERE user_id = ? AND admin_id = ? AND confirmed = TRUE
-                ORDER BY payment_date DESC LIMIT 1
-            ''', (user_id, admin_id))
-            last_payment = cursor.fetchone()
-            
-            conn.close()
-            
-            # Получаем псевдоним админа
-            admin_alias, _, _ = get_admin_settings(admin_id)
-            
-            if result:
-                day, time, msg = result
-                
-                text = f"{EMOJI['user']} <b>Ваш статус</b>\n"
-                text += format_divider()
-                
-                text += f"{EMOJI['success']} <b>Активный пользователь</b>\n"
-                text += f"{EMOJI['admin']} Администратор: <b>{escape_html(admin_alias)}</b>\n\n"
-                
-                text += f"{EMOJI['bell']} <b>График напоминаний:</b>\n"
-                text += f"• День: <b>{day} число</b> каждого месяца\n"
-                text += f"• Время: <b>{time}</b> (+5 МСК)\n\n"
-                
-                text += f"{EMOJI['money']} <b>История платежей:</b>\n"
-                text += f"• Подтверждено: <b>{confirmed_count}</b>\n"
-                
-                if pending_count > 0:
-                    text += f"• Ожидают: <b>{pending_count}</b>\n"
-                
-                if last_payment:
-                    last_date = datetime.strptime(last_payment[0], '%Y-%m-%d')
-                    days_ago = (datetime.now() - last_date).days
-                    text += f"{format_divider()}"
-                    text += f"{EMOJI['calendar']} Последний платеж: <b>{days_ago} дн. назад</b>\n\n"
-                
-                # Следующее напоминание
-                next_reminder = calculate_next_reminder(day, time)
-                if next_reminder:
-                    text += f"{format_divider()}"
-                    text += f"{EMOJI['rocket']} <b>Первое напоминание:</b> {format_date(next_reminder)}\n\n"
-                
-                text += f"{format_divider()}"
-                text += f"{EMOJI['info']} Используйте /start для просмотра вашего статуса."
+            card = get_user_status_card(user_id, admin_id)
+            if card:
+                text = render_user_status(card)
             else:
                 text = f"{EMOJI['error']} Ошибка получения данных"
         else:
-            text = (
-                f"{EMOJI['user']} <b>Ваш статус</b>\n"
-                f"{format_divider()}"
-                f"{EMOJI['warning']} <b>Не привязан к администратору</b>\n\n"
-                f"Передайте ваш ID администратору:\n"
-                f"<code>{user_id}</code>"
-            )
+            text = templates.USER_STATUS_UNLINKED.render(user_id=user_id)
     
     await message.answer(text, parse_mode='HTML')
 
@@ -744,7 +1327,7 @@ def calculate_next_reminder(day: int, time_str: str) -> Optional[datetime]:
     except:
         return None
 
-@dp.message(F.text == f"{EMOJI['chat']} Связь с админом")
+@text_router.route(BUTTONS['contact_admin'])
 async def chat_button(message: Message, state: FSMContext):
     user_id = message.from_user.id
     
@@ -801,7 +1384,7 @@ async def chat_button(message: Message, state: FSMContext):
     except Exception as e:
         logging.error(f"Ошибка уведомления админа: {e}")
 
-@dp.message(F.text == f"{EMOJI['back']} Назад")
+@text_router.route(BUTTONS['back'])
 async def back_button(message: Message, state: FSMContext):
     current_state = await state.get_state()
     user_id = message.from_user.id
@@ -855,8 +1438,8 @@ async def back_button(message: Message, state: FSMContext):
     else:
         await start_handler(message, state)
 
-@dp.message(F.text == f"{EMOJI['settings']} Настройки админа")
-async def admin_settings_button(message: Message):
+@text_router.route(BUTTONS['admin_settings'])
+async def admin_settings_button(message: Message, state: FSMContext):
     if not is_admin(message.from_user.id):
         await message.answer(f"{EMOJI['error']} У вас нет прав администратора.")
         return
@@ -873,19 +1456,12 @@ async def admin_settings_button(message: Message):
         f"Выберите, что хотите изменить:"
     )
     
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=f"{EMOJI['user']} Изменить псевдоним", callback_data="change_alias")],
-        [InlineKeyboardButton(text=f"{EMOJI['chat']} Изменить сообщение", callback_data="change_default_message")],
-        [InlineKeyboardButton(
-            text=f"{EMOJI['bell']} {'Выключить' if show_notifications else 'Включить'} уведомления", 
-            callback_data="toggle_notifications"
-        )]
-    ])
+    keyboard = get_admin_settings_keyboard(bool(show_notifications))
     
     await message.answer(text, reply_markup=keyboard, parse_mode='HTML')
 
-@dp.message(F.text == f"{EMOJI['chat']} Активные чаты")
-async def active_chats_button(message: Message):
+@text_router.route(BUTTONS['active_chats'])
+async def active_chats_button(message: Message, state: FSMContext):
     if not is_admin(message.from_user.id):
         await message.answer(f"{EMOJI['error']} У вас нет прав администратора.")
         return
@@ -910,7 +1486,7 @@ async def active_chats_button(message: Message):
             
             buttons.append([InlineKeyboardButton(
                 text=f"{EMOJI['chat']} {user_name}",
-                callback_data=f"start_chat_{user_id}"
+                callback_data=START_CHAT.pack(user_id=user_id)
             )])
         except:
             text += f"{i}. {EMOJI['user']} Недоступен (ID: <code>{user_id}</code>)\n\n"
@@ -918,7 +1494,7 @@ async def active_chats_button(message: Message):
     keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
     await message.answer(text, reply_markup=keyboard, parse_mode='HTML')
 
-@dp.message(F.text == f"{EMOJI['add']} Добавить пользователя")
+@text_router.route(BUTTONS['add_user'])
 async def add_user_button(message: Message, state: FSMContext):
     if not is_admin(message.from_user.id):
         await message.answer(f"{EMOJI['error']} У вас нет прав администратора.")
@@ -932,13 +1508,14 @@ async def add_user_button(message: Message, state: FSMContext):
         f"{format_divider()}"
         f"Введите ID пользователя, которого хотите добавить.\n\n"
         f"{EMOJI['info']} <b>Подсказка:</b>\n"
-        f"Пользователь может узнать свой ID, написав боту /start"
+        f"Пользователь может узнать свой ID, написав боту /start\n"
+        f"Чтобы добавить сразу многих, используйте /import"
     )
     
     await message.answer(text, reply_markup=keyboard, parse_mode='HTML')
 
-@dp.message(F.text == f"{EMOJI['list']} Список пользователей")
-async def list_users_button(message: Message):
+@text_router.route(BUTTONS['list_users'])
+async def list_users_button(message: Message, state: FSMContext):
     if not is_admin(message.from_user.id):
         await message.answer(f"{EMOJI['error']} У вас нет прав администратора.")
         return
@@ -950,8 +1527,7 @@ async def list_users_button(message: Message):
         await message.answer(f"{EMOJI['info']} У вас нет привязанных пользователей.")
         return
     
-    text = f"{EMOJI['list']} <b>Ваши пользователи ({len(users)}):</b>\n"
-    text += format_divider()
+    blocks = [templates.USER_LIST_HEADER.render(count=len(users))]
     
     for i, (user_id, day, time, msg) in enumerate(users, 1):
         try:
@@ -962,20 +1538,21 @@ async def list_users_button(message: Message):
             username = "недоступен"
             full_name = "Недоступен"
         
-        text += f"<b>{i}. {escape_html(full_name)}</b>\n"
-        text += f"   @{escape_html(username)} | ID: <code>{user_id}</code>\n"
-        text += f"   {EMOJI['calendar']} {day} число, {EMOJI['clock']} {time}\n\n"
-        
-        # Разбиваем на части если слишком длинное
-        if len(text) > 3500:
-            await message.answer(text, parse_mode='HTML')
-            text = ""
-    
-    if text:
+        blocks.append(templates.USER_LIST_ITEM.render(
+            index=i,
+            full_name=full_name,
+            username=username,
+            user_id=user_id,
+            day=day,
+            time=time
+        ))
+    
+    # Разбиваем на минимальное число сообщений в пределах лимита Telegram
+    for text in templates.split_messages(blocks):
         await message.answer(text, parse_mode='HTML')
 
-@dp.message(F.text == f"{EMOJI['stats']} Статистика оплат")
-async def payment_stats_button(message: Message):
+@text_router.route(BUTTONS['payment_stats'])
+async def payment_stats_button(message: Message, state: FSMContext):
     if not is_admin(message.from_user.id):
         await message.answer(f"{EMOJI['error']} У вас нет прав администратора.")
         return
@@ -983,41 +1560,36 @@ async def payment_stats_button(message: Message):
     await bot.send_chat_action(message.chat.id, "typing")
     stats = get_payment_stats(message.from_user.id)
     
-    text = f"{EMOJI['stats']} <b>Статистика оплат</b>\n"
-    text += format_divider()
-    
-    text += f"{EMOJI['user']} <b>Пользователи:</b>\n"
-    text += f"• Всего в системе: <b>{stats['total_users']}</b>\n\n"
-    
-    text += f"{EMOJI['money']} <b>Платежи:</b>\n"
-    text += f"• Всего подтверждено: <b>{stats['confirmed']}</b>\n"
-    text += f"• Ожидают подтверждения: <b>{stats['pending']}</b>\n"
-    text += f"• За текущий месяц: <b>{stats['month_payments']}</b>\n"
+    parts = [templates.PAYMENT_STATS.render(
+        total_users=stats['total_users'],
+        confirmed=stats['confirmed'],
+        pending=stats['pending'],
+        month_payments=stats['month_payments']
+    )]
     
     if stats['month_amount'] > 0:
-        text += f"• Сумма за месяц: <b>{stats['month_amount']:.2f} ₽</b>\n"
+        parts.append(templates.MONTH_AMOUNT.render(amount=stats['month_amount']))
+    if stats['expected_amount'] > 0:
+        parts.append(templates.EXPECTED_AMOUNT.render(amount=stats['expected_amount'], links=stats['expected_links']))
     
     if stats['overdue'] > 0:
-        text += f"{format_divider()}"
-        text += f"\n{EMOJI['alert']} Просроченных: <b>{stats['overdue']}</b>\n"
+        parts.append(templates.PAYMENT_STATS_OVERDUE.render(overdue=stats['overdue']))
     
-    text += f"{format_divider()}"
-    text += f"\n{EMOJI['stats']} <b>Аналитика:</b>\n"
+    parts.append(templates.PAYMENT_STATS_ANALYTICS.render())
     
-    if stats['total_users'] > 0:
+    paid_count, linked_count = paid_sets.get_counts(message.from_user.id)
+    if linked_count > 0:
         # Процент оплативших в этом месяце
-        month_rate = (stats['month_payments'] / stats['total_users'] * 100)
-        text += f"{format_divider()}"
-        text += f"• Оплатили в этом месяце: <b>{month_rate:.1f}%</b>\n"
+        month_rate = paid_count / linked_count * 100
+        parts.append(templates.PAYMENT_STATS_MONTH_RATE.render(rate=month_rate))
     
     if stats['confirmed'] + stats['pending'] > 0:
         success_rate = (stats['confirmed'] / (stats['confirmed'] + stats['pending']) * 100)
-        text += f"{format_divider()}"
-        text += f"• Успешность платежей: <b>{success_rate:.1f}%</b>\n"
+        parts.append(templates.PAYMENT_STATS_SUCCESS_RATE.render(rate=success_rate))
     
-    await message.answer(text, parse_mode='HTML')
+    await message.answer(''.join(parts), parse_mode='HTML')
 
-@dp.message(F.text == f"{EMOJI['remove']} Удалить пользователя")
+@text_router.route(BUTTONS['remove_user'])
 async def remove_user_button(message: Message, state: FSMContext):
     if not is_admin(message.from_user.id):
         await message.answer(f"{EMOJI['error']} У вас нет прав администратора.")
@@ -1048,32 +1620,16 @@ async def remove_user_button(message: Message, state: FSMContext):
     keyboard = get_cancel_keyboard()
     await message.answer(text, reply_markup=keyboard, parse_mode='HTML')
 
-@dp.message(F.text == f"{EMOJI['search']} Неоплатившие")
-async def unpaid_users_button(message: Message):
+@text_router.route(BUTTONS['unpaid'])
+async def unpaid_users_button(message: Message, state: FSMContext):
     if not is_admin(message.from_user.id):
         await message.answer(f"{EMOJI['error']} У вас нет прав администратора.")
         return
     
     await bot.send_chat_action(message.chat.id, "typing")
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Пользователи без платежей в текущем месяце
-    current_month = datetime.now().replace(day=1)
-    cursor.execute('''
-        SELECT DISTINCT u.user_id 
-        FROM user_admin_links u
-        LEFT JOIN payments p ON u.user_id = p.user_id 
-                             AND u.admin_id = p.admin_id 
-                             AND p.payment_date >= ?
-                             AND p.confirmed = TRUE
-        WHERE u.admin_id = ? AND p.user_id IS NULL
-        ORDER BY u.user_id
-    ''', (current_month, message.from_user.id))
-    
-    unpaid_users = cursor.fetchall()
-    conn.close()
+    # Пользователи без подтвержденной оплаты за текущий период
+    unpaid_users = paid_sets.get_unpaid(message.from_user.id)
     
     if not unpaid_users:
         await message.answer(f"{EMOJI['success']} Все пользователи оплатили в этом месяце!")
@@ -1082,7 +1638,7 @@ async def unpaid_users_button(message: Message):
     text = f"{EMOJI['search']} <b>Не оплатили в {datetime.now().strftime('%B %Y')}:</b>\n"
     text += format_divider()
     
-    for i, (user_id,) in enumerate(unpaid_users, 1):
+    for i, user_id in enumerate(unpaid_users, 1):
         try:
             user_info = await bot.get_chat(user_id)
             name = user_info.full_name or "Без имени"
@@ -1096,8 +1652,8 @@ async def unpaid_users_button(message: Message):
     
     await message.answer(text, parse_mode='HTML')
 
-@dp.message(F.text == f"{EMOJI['alert']} Просроченные")
-async def overdue_payments_button(message: Message):
+@text_router.route(BUTTONS['overdue'])
+async def overdue_payments_button(message: Message, state: FSMContext):
     if not is_admin(message.from_user.id):
         await message.answer(f"{EMOJI['error']} У вас нет прав администратора.")
         return
@@ -1107,14 +1663,13 @@ async def overdue_payments_button(message: Message):
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    cursor.execute('''
-        SELECT DISTINCT user_id, due_date
-        FROM pending_payments 
-        WHERE admin_id = ? AND due_date <= ?
-        ORDER BY due_date
-    ''', (message.from_user.id, datetime.now()))
-    
-    overdue = cursor.fetchall()
+    now = int(datetime.now().timestamp())
+    overdue = fetch_all(cursor, 'overdue_payments', '''
+        SELECT user_id, due_at
+        FROM payment_periods 
+        WHERE admin_id = ? AND due_at <= ?
+        ORDER BY due_at
+    ''', (message.from_user.id, now))
     conn.close()
     
     if not overdue:
@@ -1124,7 +1679,7 @@ async def overdue_payments_button(message: Message):
     text = f"{EMOJI['alert']} <b>Просроченные платежи:</b>\n"
     text += format_divider()
     
-    for user_id, due_date in overdue:
+    for user_id, due_at in overdue:
         try:
             user_info = await bot.get_chat(user_id)
             name = user_info.full_name or "Без имени"
@@ -1133,8 +1688,7 @@ async def overdue_payments_button(message: Message):
             name = "Недоступен"
             username = None
         
-        due_dt = datetime.fromisoformat(due_date.replace('Z', '+00:00') if 'Z' in due_date else due_date)
-        days_overdue = (datetime.now() - due_dt).days
+        days_overdue = (now - due_at) // 86400
         
         text += f"{format_user_info(user_id, name, username)}\n"
         text += f"{EMOJI['clock']} Просрочка: <b>{days_overdue} дн.</b>\n\n"
@@ -1144,8 +1698,8 @@ async def overdue_payments_button(message: Message):
     
     await message.answer(text, parse_mode='HTML')
 
-@dp.message(F.text == f"{EMOJI['check']} Подтвердить оплаты")
-async def confirm_payments_button(message: Message):
+@text_router.route(BUTTONS['confirm_payments'])
+async def confirm_payments_button(message: Message, state: FSMContext):
     if not is_admin(message.from_user.id):
         await message.answer(f"{EMOJI['error']} У вас нет прав администратора.")
         return
@@ -1153,42 +1707,120 @@ async def confirm_payments_button(message: Message):
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # Получаем неподтвержденные платежи
-    cursor.execute('''
-        SELECT user_id, payment_date 
-        FROM payments 
-        WHERE admin_id = ? AND confirmed = FALSE
-        ORDER BY payment_date DESC
+    # Сколько заявок ждет решения: всего и за текущий период
+    period = deliveries.get_period()
+    total, period_count, until = fetch_one(cursor, 'unconfirmed_counts', '''
+        SELECT COUNT(*), COUNT(*) FILTER (WHERE period = ?), MAX(claimed_at)
+        FROM payment_periods WHERE admin_id = ? AND state = ?
+    ''', (period, message.from_user.id, PaymentState.CLAIMED))
+    
+    # Последние заявки для примера
+    pending = fetch_all(cursor, 'unconfirmed_payments', '''
+        SELECT user_id, claimed_at 
+        FROM payment_periods 
+        WHERE admin_id = ? AND state = ?
+        ORDER BY claimed_at DESC
         LIMIT 10
-    ''', (message.from_user.id,))
-    
-    pending = cursor.fetchall()
+    ''', (message.from_user.id, PaymentState.CLAIMED))
+    conn.close()
     
     if not pending:
         await message.answer(f"{EMOJI['success']} Нет платежей, ожидающих подтверждения!")
         return
     
-    text = f"{EMOJI['check']} <b>Ожидают подтверждения:</b>\n"
+    text = f"{EMOJI['check']} <b>Ожидают подтверждения: {total}</b>\n"
     text += format_divider()
     
-    for user_id, payment_date in pending:
-        try:
-            user_info = await bot.get_chat(user_id)
-            name = user_info.full_name or "Без имени"
-            username = user_info.username
-        except:
-            name = "Недоступен"
-            username = None
-        
-        text += f"{format_user_info(user_id, name, username)}\n"
-        text += f"{EMOJI['calendar']} Дата: <b>{payment_date}</b>\n\n"
+    for user_id, claimed_at in pending:
+        text += f"{EMOJI['user']} ID: <code>{user_id}</code> — {datetime.fromtimestamp(claimed_at).strftime('%d.%m.%Y %H:%M')}\n"
+    
+    if total > len(pending):
+        text += f"… и еще {total - len(pending)}\n"
     
-    text += f"{EMOJI['info']} Используйте кнопки в уведомлениях для подтверждения."
+    text += f"\n{EMOJI['info']} Подтвердите по одной кнопками в уведомлениях или все сразу:"
     
+    await message.answer(
+        text,
+        reply_markup=get_bulk_confirmation_keyboard(total, period, period_count, until),
+        parse_mode='HTML'
+    )
+
+@callback_router.route(CONFIRM_ALL_PAYMENTS)
+async def confirm_all_payments(callback: CallbackQuery, state: FSMContext, until: int, period: Optional[str]):
+    admin_id = callback.from_user.id
+    if not is_admin(admin_id):
+        await callback.answer(f"{EMOJI['error']} У вас нет прав администратора.", show_alert=True)
+        return
+    
+    admin_alias, _, _ = get_admin_settings(admin_id)
+    
+    # Все переходы, снятие напоминаний и уведомления — одной транзакцией.
+    # Подтверждаются только заявки, которые админ видел на экране
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    confirmed = payment_periods.resolve_all(cursor, admin_id, until, period)
+    
+    if not confirmed:
+        conn.close()
+        await callback.answer(f"{EMOJI['warning']} Нет платежей, ожидающих подтверждения.", show_alert=True)
+        return
+    
+    cleanup.retire_pending_many(cursor, [(user_id, admin_id) for user_id, _, _ in confirmed])
+    
+    confirmed_at = datetime.now().strftime('%d.%m.%Y %H:%M')
+    for user_id, _, _ in confirmed:
+        outbox.enqueue(
+            cursor,
+            'notification',
+            user_id,
+            f"{EMOJI['success']} <b>Ваш платеж подтвержден!</b>\n\n"
+            f"{EMOJI['admin']} Администратор: <b>{escape_html(admin_alias)}</b>\n"
+            f"{EMOJI['calendar']} Дата: <b>{confirmed_at}</b>\n\n"
+            f"Спасибо за своевременную оплату!"
+        )
+    
+    conn.commit()
     conn.close()
-    await message.answer(text, parse_mode='HTML')
+    
+    for user_id, confirmed_period, _ in confirmed:
+        status_cache.invalidate(user_id, admin_id)
+        paid_sets.mark_paid(user_id, admin_id, confirmed_period)
+    outbox.wake()
+    cleanup.wake()
+    
+    await callback.answer(f"{EMOJI['success']} Подтверждено платежей: {len(confirmed)}")
+    
+    # Кнопки в уведомлениях о заявках снимаются в фоне с ограничением частоты
+    notices = [message_id for _, _, message_id in confirmed if message_id]
+    head = (
+        f"{EMOJI['success']} <b>Подтверждено платежей: {len(confirmed)}</b>\n"
+        f"{format_divider()}"
+        f"{EMOJI['bell']} Уведомления пользователям поставлены в очередь.\n"
+    )
+    await callback.message.edit_text(head, parse_mode='HTML')
+    if notices:
+        run_in_background(clear_claim_notices(callback.message, admin_id, notices, head))
+
+async def clear_claim_notices(progress_message: Message, admin_id: int, message_ids: List[int], head: str):
+    """Снимает кнопки с уведомлений о подтвержденных заявках, показывая прогресс"""
+    async def report(progress: Dict[str, int]):
+        processed = progress['done'] + progress['skipped'] + progress['failed']
+        text = head + f"{EMOJI['clock']} Обновлено уведомлений: <b>{processed}/{progress['total']}</b>"
+        if processed == progress['total']:
+            text = head + f"{EMOJI['success']} Уведомления обновлены: <b>{progress['done']}</b>"
+            if progress['failed']:
+                text += f", с ошибкой: <b>{progress['failed']}</b>"
+        await progress_message.edit_text(text, parse_mode='HTML')
+    
+    await send_batch(
+        message_ids,
+        lambda message_id: bot.edit_message_reply_markup(chat_id=admin_id, message_id=message_id),
+        AsyncRateLimiter(BULK_EDIT_RATE),
+        on_progress=report,
+        progress_interval=BULK_PROGRESS_INTERVAL
+    )
 
-@dp.message(F.text == f"{EMOJI['cancel']} Отмена")
+@text_router.route(BUTTONS['cancel'])
 async def cancel_button(message: Message, state: FSMContext):
     await state.clear()
     
@@ -1199,8 +1831,13 @@ async def cancel_button(message: Message, state: FSMContext):
         keyboard = get_user_keyboard()
         await message.answer(f"{EMOJI['info']} Операция отменена.", reply_markup=keyboard)
 
+# Единая точка входа для callback-запросов: префикс -> обработчик
+@dp.callback_query(callback_router.match)
+async def route_callback(callback: CallbackQuery, state: FSMContext, callback_action: tuple):
+    await callback_router.dispatch(callback, callback_action, state=state)
+
 # Обработчики callback'ов для настроек
-@dp.callback_query(F.data == "change_alias")
+@callback_router.route(CHANGE_ALIAS)
 async def change_alias_callback(callback: CallbackQuery, state: FSMContext):
     if not is_admin(callback.from_user.id):
         await callback.answer(f"{EMOJI['error']} У вас нет прав администратора.", show_alert=True)
@@ -1214,7 +1851,7 @@ async def change_alias_callback(callback: CallbackQuery, state: FSMContext):
         parse_mode='HTML'
     )
 
-@dp.callback_query(F.data == "change_default_message")
+@callback_router.route(CHANGE_DEFAULT_MESSAGE)
 async def change_default_message_callback(callback: CallbackQuery, state: FSMContext):
     if not is_admin(callback.from_user.id):
         await callback.answer(f"{EMOJI['error']} У вас нет прав администратора.", show_alert=True)
@@ -1228,8 +1865,8 @@ async def change_default_message_callback(callback: CallbackQuery, state: FSMCon
         parse_mode='HTML'
     )
 
-@dp.callback_query(F.data == "toggle_notifications")
-async def toggle_notifications_callback(callback: CallbackQuery):
+@callback_router.route(TOGGLE_NOTIFICATIONS)
+async def toggle_notifications_callback(callback: CallbackQuery, state: FSMContext):
     if not is_admin(callback.from_user.id):
         await callback.answer(f"{EMOJI['error']} У вас нет прав администратора.", show_alert=True)
         return
@@ -1242,11 +1879,12 @@ async def toggle_notifications_callback(callback: CallbackQuery):
     
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
+    execute(cursor, 'toggle_notifications', '''
         UPDATE admin_settings SET show_notifications = ? WHERE admin_id = ?
     ''', (new_status, callback.from_user.id))
     conn.commit()
     conn.close()
+    status_cache.invalidate(callback.from_user.id, callback.from_user.id)
     
     # Обновляем сообщение с настройками
     alias, default_message, _ = get_admin_settings(callback.from_user.id)
@@ -1261,14 +1899,7 @@ async def toggle_notifications_callback(callback: CallbackQuery):
         f"Выберите, что хотите изменить:"
     )
     
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text=f"{EMOJI['user']} Изменить псевдоним", callback_data="change_alias")],
-        [InlineKeyboardButton(text=f"{EMOJI['chat']} Изменить сообщение", callback_data="change_default_message")],
-        [InlineKeyboardButton(
-            text=f"{EMOJI['bell']} {'Выключить' if new_status else 'Включить'} уведомления", 
-            callback_data="toggle_notifications"
-        )]
-    ])
+    keyboard = get_admin_settings_keyboard(bool(new_status))
     
     await callback.message.edit_text(text, reply_markup=keyboard, parse_mode='HTML')
     await callback.answer(
@@ -1276,14 +1907,12 @@ async def toggle_notifications_callback(callback: CallbackQuery):
         show_alert=True
     )
 
-@dp.callback_query(F.data.startswith("start_chat_"))
-async def start_chat_with_user_callback(callback: CallbackQuery, state: FSMContext):
+@callback_router.route(START_CHAT)
+async def start_chat_with_user_callback(callback: CallbackQuery, state: FSMContext, user_id: int):
     if not is_admin(callback.from_user.id):
         await callback.answer(f"{EMOJI['error']} У вас нет прав администратора.", show_alert=True)
         return
     
-    user_id = int(callback.data.split("_")[2])
-    
     # Проверяем что чат все еще активен
     if not is_chat_active(user_id, callback.from_user.id):
         await callback.answer(f"{EMOJI['error']} Чат больше не активен.", show_alert=True)
@@ -1325,7 +1954,7 @@ async def start_chat_with_user_callback(callback: CallbackQuery, state: FSMConte
 # Обработчики состояний для изменения настроек
 @dp.message(StateFilter(AdminStates.waiting_alias))
 async def process_alias_change(message: Message, state: FSMContext):
-    if message.text == f"{EMOJI['cancel']} Отмена":
+    if message.text == BUTTONS['cancel']:
         await cancel_button(message, state)
         return
     
@@ -1351,7 +1980,7 @@ async def process_alias_change(message: Message, state: FSMContext):
 
 @dp.message(StateFilter(AdminStates.waiting_default_message))
 async def process_default_message_change(message: Message, state: FSMContext):
-    if message.text == f"{EMOJI['cancel']} Отмена":
+    if message.text == BUTTONS['cancel']:
         await cancel_button(message, state)
         return
     
@@ -1378,7 +2007,7 @@ async def process_default_message_change(message: Message, state: FSMContext):
 # Обработчики состояний для добавления пользователей
 @dp.message(StateFilter(AdminStates.waiting_user_id))
 async def process_user_id(message: Message, state: FSMContext):
-    if message.text == f"{EMOJI['cancel']} Отмена":
+    if message.text == BUTTONS['cancel']:
         await cancel_button(message, state)
         return
     
@@ -1428,7 +2057,7 @@ async def process_user_id(message: Message, state: FSMContext):
 
 @dp.message(StateFilter(AdminStates.waiting_day))
 async def process_day(message: Message, state: FSMContext):
-    if message.text == f"{EMOJI['cancel']} Отмена":
+    if message.text == BUTTONS['cancel']:
         await cancel_button(message, state)
         return
     
@@ -1454,7 +2083,7 @@ async def process_day(message: Message, state: FSMContext):
 
 @dp.message(StateFilter(AdminStates.waiting_time))
 async def process_time(message: Message, state: FSMContext):
-    if message.text == f"{EMOJI['cancel']} Отмена":
+    if message.text == BUTTONS['cancel']:
         await cancel_button(message, state)
         return
     
@@ -1469,16 +2098,7 @@ async def process_time(message: Message, state: FSMContext):
         _, default_message, _ = get_admin_settings(message.from_user.id)
         
         # Предлагаем выбор
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(
-                text=f"{EMOJI['chat']} Ввести своё сообщение", 
-                callback_data="enter_custom_msg"
-            )],
-            [InlineKeyboardButton(
-                text=f"{EMOJI['success']} Использовать сообщение по умолчанию", 
-                callback_data="use_default_msg"
-            )]
-        ])
+        keyboard = get_message_choice_keyboard()
         
         data = await state.get_data()
         
@@ -1503,7 +2123,7 @@ async def process_time(message: Message, state: FSMContext):
 
 @dp.message(StateFilter(AdminStates.waiting_message))
 async def process_message(message: Message, state: FSMContext):
-    if message.text == f"{EMOJI['cancel']} Отмена":
+    if message.text == BUTTONS['cancel']:
         await cancel_button(message, state)
         return
     
@@ -1526,20 +2146,61 @@ async def process_message(message: Message, state: FSMContext):
         message.from_user.id, user_id, day, time, payment_message, state, message
     )
 
+def schedule_reminders(links) -> int:
+    """Регистрирует задачи напоминаний пачкой: (user_id, admin_id, day, time, message)
+
+    Привязки одного слота получают общий CronTrigger — он не хранит состояния,
+    а разбор cron-полей заметен при тысячах задач. Возвращает число задач.
+    """
+    triggers = {}
+    scheduled = 0
+    for user_id, admin_id, day, time, message in links:
+        try:
+            trigger = triggers.get((day, time))
+            if trigger is None:
+                hour, minute = map(int, time.split(':'))
+                trigger = triggers[(day, time)] = CronTrigger(day=day, hour=hour, minute=minute)
+            scheduler.add_job(
+                send_payment_reminder,
+                trigger,
+                args=[user_id, admin_id, message],
+                id=f"payment_{user_id}_{admin_id}",
+                replace_existing=True
+            )
+            scheduled += 1
+            logging.info(
+                f"Загружено напоминание для пользователя {user_id} на {day} число в {time}",
+                extra={'sample_key': 'reminder_loaded'}
+            )
+        except Exception as e:
+            logging.error(f"Ошибка загрузки напоминания для {user_id}: {e}")
+    return scheduled
+
+def format_welcome_text(admin_alias: str, day: int, time: str) -> str:
+    """Уведомление пользователю о добавлении в систему напоминаний"""
+    next_reminder = calculate_next_reminder(day, time)
+    
+    text = (
+        f"{EMOJI['bell']} <b>Вы добавлены в систему напоминаний!</b>\n"
+        f"{format_divider()}"
+        f"{EMOJI['admin']} <b>Администратор:</b> {escape_html(admin_alias)}\n"
+        f"{EMOJI['calendar']} <b>День напоминания:</b> {day} число\n"
+        f"{EMOJI['clock']} <b>Время:</b> {time} (+5 МСК)\n\n"
+    )
+    
+    if next_reminder:
+        text += f"{EMOJI['rocket']} <b>Первое напоминание:</b> {format_date(next_reminder)}\n\n"
+    
+    text += f"{EMOJI['info']} Используйте /start для просмотра вашего статуса."
+    return text
+
 async def complete_user_addition(admin_id: int, user_id: int, day: int, time: str, payment_message: str, state: FSMContext, message: Message):
     """Завершает добавление пользователя"""
     # Сохраняем в базу данных
     add_user_to_admin(user_id, admin_id, day, time, payment_message)
     
     # Добавляем задачу в планировщик
-    hour, minute = map(int, time.split(':'))
-    scheduler.add_job(
-        send_payment_reminder,
-        CronTrigger(day=day, hour=hour, minute=minute),
-        args=[user_id, admin_id, payment_message],
-        id=f"payment_{user_id}_{admin_id}",
-        replace_existing=True
-    )
+    schedule_reminders([(user_id, admin_id, day, time, payment_message)])
     
     await state.clear()
     
@@ -1567,24 +2228,9 @@ async def complete_user_addition(admin_id: int, user_id: int, day: int, time: st
     
     # Уведомляем пользователя
     try:
-        next_reminder = calculate_next_reminder(day, time)
-        
-        text = (
-            f"{EMOJI['bell']} <b>Вы добавлены в систему напоминаний!</b>\n"
-            f"{format_divider()}"
-            f"{EMOJI['admin']} <b>Администратор:</b> {escape_html(admin_alias)}\n"
-            f"{EMOJI['calendar']} <b>День напоминания:</b> {day} число\n"
-            f"{EMOJI['clock']} <b>Время:</b> {time} (+5 МСК)\n\n"
-        )
-        
-        if next_reminder:
-            text += f"{EMOJI['rocket']} <b>Первое напоминание:</b> {format_date(next_reminder)}\n\n"
-        
-        text += f"{EMOJI['info']} Используйте /start для просмотра вашего статуса."
-        
         await bot.send_message(
             user_id,
-            text,
+            format_welcome_text(admin_alias, day, time),
             reply_markup=get_user_keyboard(),
             parse_mode='HTML'
         )
@@ -1594,171 +2240,473 @@ async def complete_user_addition(admin_id: int, user_id: int, day: int, time: st
             f"Возможно, он не начал диалог с ботом."
         )
 
-@dp.message(StateFilter(AdminStates.waiting_unlink_user))
-async def process_unlink_user(message: Message, state: FSMContext):
-    if message.text == f"{EMOJI['cancel']} Отмена":
+# Массовое добавление пользователей из CSV/TSV
+@dp.message(Command("import"))
+async def import_command(message: Message, state: FSMContext):
+    if not is_admin(message.from_user.id):
+        await message.answer(f"{EMOJI['error']} У вас нет прав администратора.")
+        return
+    
+    await state.set_state(AdminStates.waiting_import)
+    await message.answer(
+        f"{EMOJI['add']} <b>Импорт пользователей</b>\n"
+        f"{format_divider()}"
+        f"Пришлите файл CSV/TSV или вставьте строки текстом.\n"
+        f"Столбцы: <code>ID; день; ЧЧ:ММ; сообщение; сумма</code>\n"
+        f"Сообщение и сумму можно не указывать — возьмется сообщение по умолчанию.\n\n"
+        f"Пример:\n<code>123456789;5;10:00;Оплата за интернет;500</code>\n\n"
+        f"{EMOJI['info']} Привязки, которые уже есть у вас, будут обновлены.",
+        reply_markup=get_cancel_keyboard(),
+        parse_mode='HTML'
+    )
+
+@dp.message(StateFilter(AdminStates.waiting_import))
+async def process_import(message: Message, state: FSMContext):
+    if message.text == BUTTONS['cancel']:
         await cancel_button(message, state)
         return
     
-    try:
-        user_id = int(message.text.strip())
-        
-        # Проверяем что пользователь привязан к этому админу
-        users = get_users_for_admin(message.from_user.id)
-        user_ids = [u[0] for u in users]
-        
-        if user_id not in user_ids:
-            await message.answer(f"{EMOJI['error']} Этот пользователь не привязан к вам!")
-            return
-        
-        remove_user_from_admin(user_id, message.from_user.id)
-        
-        # Удаляем задачу из планировщика
-        try:
-            scheduler.remove_job(f"payment_{user_id}_{message.from_user.id}")
-        except:
-            pass
-        
-        # Завершаем активный чат если есть
-        if is_chat_active(user_id, message.from_user.id):
-            end_chat_session(user_id, message.from_user.id)
-        
-        await state.clear()
-        
-        keyboard = get_admin_keyboard()
-        await message.answer(
-            f"{EMOJI['success']} Пользователь <code>{user_id}</code> успешно удален из системы.",
-            reply_markup=keyboard,
-            parse_mode='HTML'
-        )
-        
-        # Уведомляем пользователя
-        try:
-            await bot.send_message(
-                user_id,
-                f"{EMOJI['warning']} Вы были удалены из системы напоминаний об оплате.\n\n"
-                f"Вы больше не будете получать напоминания.",
-                reply_markup=get_user_keyboard()
+    if message.document:
+        if message.document.file_size and message.document.file_size > bulk_import.IMPORT_MAX_BYTES:
+            await message.answer(
+                f"{EMOJI['error']} Файл больше {bulk_import.IMPORT_MAX_BYTES // 1024} КБ. Разбейте его на части."
             )
-        except:
-            pass
-            
-    except ValueError:
-        await message.answer(f"{EMOJI['error']} Неверный формат ID. Введите число.")
-
-# Обработчик чата пользователя с админом
-@dp.message(StateFilter(UserStates.chatting_with_admin))
-async def forward_to_admin(message: Message, state: FSMContext):
-    if message.text == f"{EMOJI['back']} Назад":
-        await back_button(message, state)
+            return
+        data = await bot.download(message.document)
+        text = bulk_import.decode(data.read())
+    elif message.text:
+        text = message.text
+    else:
+        await message.answer(f"{EMOJI['error']} Пришлите файл CSV/TSV или строки текстом.")
         return
     
-    data = await state.get_data()
-    admin_id = data['admin_id']
+    admin_id = message.from_user.id
+    await bot.send_chat_action(message.chat.id, "typing")
+    admin_alias, default_message, _ = get_admin_settings(admin_id)
+    rows, errors = bulk_import.parse(text, default_message)
     
-    user_info = message.from_user
-    admin_alias, _, show_notifications = get_admin_settings(admin_id)
+    # Проверка привязок, запись и приветствия — одной транзакцией
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    new, existing, link_errors = bulk_import.check_links(cursor, admin_id, rows)
+    errors += link_errors
+    imported = new + existing
+    bulk_import.apply(cursor, admin_id, imported)
+    for row in new:
+        outbox.enqueue(cursor, 'notification', row.user_id,
+                       format_welcome_text(admin_alias, row.day, row.time))
+    conn.commit()
+    conn.close()
     
-    if not show_notifications:
-        # Если уведомления выключены, просто подтверждаем отправку
-        await message.answer(f"{EMOJI['success']} Сообщение отправлено")
-        return
+    schedule_reminders([(row.user_id, admin_id, row.day, row.time, row.message) for row in imported])
+    for row in imported:
+        status_cache.invalidate(row.user_id, admin_id)
+        paid_sets.add_member(row.user_id, admin_id)
+    if new:
+        outbox.wake()
     
-    try:
-        # Обработка различных типов сообщений
-        if message.text:
-            text = (
-                f"{EMOJI['chat']} <b>Новое сообщение</b>\n"
-                f"{format_divider()}"
-                f"{format_user_info(user_info.id, user_info.full_name, user_info.username)}\n\n"
-                f"{EMOJI['chat']} <b>Текст:</b>\n{escape_html(message.text)}\n\n"
-                f"{EMOJI['info']} Используйте /chat_{user_info.id} для ответа"
-            )
-            await bot.send_message(admin_id, text, parse_mode='HTML')
-            add_message_to_history(user_info.id, admin_id, 'text', message.text)
-        
-        elif message.photo:
-            caption = message.caption or ""
-            text = (
-                f"{EMOJI['chat']} <b>Новое фото</b>\n"
-                f"{format_divider()}"
-                f"{format_user_info(user_info.id, user_info.full_name, user_info.username)}\n\n"
-                f"{EMOJI['chat']} Подпись: {escape_html(caption)}" if caption else text
-            )
-            await bot.send_photo(
-                admin_id,
-                message.photo[-1].file_id,
-                caption=f"{text}\n\n{EMOJI['chat']} Подпись: {escape_html(caption)}" if caption else text,
-                parse_mode='HTML'
-            )
-            add_message_to_history(user_info.id, admin_id, 'photo', caption)
-        
-        elif message.video:
-            caption = message.caption or ""
-            text = (
-                f"{EMOJI['chat']} <b>Новое видео</b>\n"
-                f"{format_divider()}"
-                f"{format_user_info(user_info.id, user_info.full_name, user_info.username)}\n\n"
-                f"{EMOJI['chat']} Подпись: {escape_html(caption)}" if caption else text
+    await state.clear()
+    await message.answer(
+        f"{EMOJI['success'] if imported else EMOJI['warning']} <b>Импорт завершен</b>\n"
+        f"{format_divider()}"
+        f"• Добавлено: <b>{len(new)}</b>\n"
+        f"• Обновлено: <b>{len(existing)}</b>\n"
+        f"• С ошибками: <b>{len(errors)}</b>",
+        reply_markup=get_admin_keyboard(),
+        parse_mode='HTML'
+    )
+    
+    if errors:
+        report = bulk_import.render_report(errors)
+        if len(errors) <= 20:
+            await message.answer(f"{EMOJI['error']} <b>Ошибки:</b>\n{escape_html(report)}", parse_mode='HTML')
+        else:
+            await message.answer_document(
+                BufferedInputFile(report.encode('utf-8'), filename=f"import_errors_{datetime.now():%Y%m%d_%H%M%S}.txt"),
+                caption=f"{EMOJI['error']} Ошибки импорта: {len(errors)}"
             )
-            await bot.send_video(
-                admin_id,
-                message.video.file_id,
-                caption=f"{text}\n\n{EMOJI['chat']} Подпись: {escape_html(caption)}" if caption else text,
-                parse_mode='HTML'
-            )
-            add_message_to_history(user_info.id, admin_id, 'video', caption)
+
+# Рассылки пользователям админа
+@text_router.route(BUTTONS['broadcast'])
+async def broadcast_button(message: Message, state: FSMContext):
+    if not is_admin(message.from_user.id):
+        await message.answer(f"{EMOJI['error']} У вас нет прав администратора.")
+        return
+    
+    await state.set_state(AdminStates.waiting_broadcast)
+    await message.answer(
+        f"{EMOJI['broadcast']} <b>Новая рассылка</b>\n"
+        f"{format_divider()}"
+        f"Пришлите сообщение для рассылки — текст, фото или документ.\n"
+        f"Пользователи получат его копию с тем же оформлением.\n\n"
+        f"{EMOJI['info']} Прошлые рассылки: /broadcasts",
+        reply_markup=get_cancel_keyboard(),
+        parse_mode='HTML'
+    )
+
+@dp.message(Command("broadcast"))
+async def broadcast_command(message: Message, state: FSMContext):
+    await broadcast_button(message, state)
+
+@dp.message(StateFilter(AdminStates.waiting_broadcast))
+async def process_broadcast_message(message: Message, state: FSMContext):
+    if message.text == BUTTONS['cancel']:
+        await cancel_button(message, state)
+        return
+    
+    admin_id = message.from_user.id
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    counts = broadcasts.count_segments(cursor, admin_id)
+    conn.close()
+    
+    segments = [(segment, broadcasts.segment_title(segment), count)
+                for segment, count in counts.items() if count > 0]
+    if not segments:
+        await state.clear()
+        await message.answer(
+            f"{EMOJI['info']} Некому отправлять: нет доступных пользователей.",
+            reply_markup=get_admin_keyboard()
+        )
+        return
+    
+    # Рассылается копия этого сообщения, запоминаем только его координаты
+    await state.update_data(broadcast_chat_id=message.chat.id, broadcast_message_id=message.message_id)
+    await message.answer(
+        f"{EMOJI['broadcast']} Кому отправить это сообщение?",
+        reply_markup=get_broadcast_segments_keyboard(segments)
+    )
+
+@callback_router.route(BROADCAST_SEGMENT)
+async def broadcast_segment_callback(callback: CallbackQuery, state: FSMContext, segment: str):
+    admin_id = callback.from_user.id
+    if not is_admin(admin_id):
+        await callback.answer(f"{EMOJI['error']} У вас нет прав администратора.", show_alert=True)
+        return
+    
+    data = await state.get_data()
+    if await state.get_state() != AdminStates.waiting_broadcast.state or 'broadcast_message_id' not in data:
+        await callback.answer(f"{EMOJI['warning']} Сообщение для рассылки не найдено, начните заново", show_alert=True)
+        return
+    
+    # Рассылка и снимок получателей — одной транзакцией
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        broadcast_id, total = broadcasts.create(
+            cursor, admin_id, data['broadcast_chat_id'], data['broadcast_message_id'], segment
+        )
+    except ValueError:
+        conn.close()
+        await callback.answer(f"{EMOJI['error']} Неизвестный сегмент", show_alert=True)
+        return
+    if total == 0:
+        conn.close()
+        await callback.answer(f"{EMOJI['info']} В этом сегменте больше нет пользователей", show_alert=True)
+        return
+    conn.commit()
+    
+    # Сообщение с прогрессом; запись не держим открытой, пока ждем Telegram
+    status = await callback.message.edit_text(
+        render_broadcast_progress({
+            'segment': segment, 'status': broadcasts.STATUS_SENDING,
+            'total': total, 'sent': 0, 'failed': 0
+        }),
+        reply_markup=get_broadcast_cancel_keyboard(broadcast_id),
+        parse_mode='HTML'
+    )
+    broadcasts.set_status_message(cursor, broadcast_id, status.chat.id, status.message_id)
+    conn.commit()
+    conn.close()
+    broadcasts.wake()
+    
+    await state.clear()
+    await callback.message.answer(f"{EMOJI['rocket']} Рассылка запущена", reply_markup=get_admin_keyboard())
+    await callback.answer()
+
+@callback_router.route(BROADCAST_CANCEL)
+async def broadcast_cancel_callback(callback: CallbackQuery, state: FSMContext, broadcast_id: int):
+    broadcast = broadcasts.cancel(broadcast_id, callback.from_user.id)
+    if broadcast is not None:
+        await broadcast_progress(broadcast)
+        await callback.answer(f"{EMOJI['success']} Рассылка остановлена")
+    else:
+        await callback.answer(f"{EMOJI['info']} Рассылка уже завершена", show_alert=True)
+
+@callback_router.route(CANCEL_ACTION)
+async def cancel_action_callback(callback: CallbackQuery, state: FSMContext, action: str):
+    await state.clear()
+    await callback.message.edit_reply_markup()
+    await callback.message.answer(f"{EMOJI['info']} Операция отменена.",
+                                  reply_markup=get_admin_keyboard() if is_admin(callback.from_user.id) else get_user_keyboard())
+    await callback.answer()
+
+BROADCAST_STATUS_NAMES = {
+    broadcasts.STATUS_SENDING: 'Отправляется',
+    broadcasts.STATUS_DONE: 'Завершена',
+    broadcasts.STATUS_CANCELLED: 'Остановлена',
+    broadcasts.STATUS_SOURCE_LOST: 'Остановлена: исходное сообщение удалено'
+}
+
+def render_broadcast_progress(broadcast: dict) -> str:
+    """Текст сообщения с прогрессом рассылки"""
+    done = broadcast['sent'] + broadcast['failed']
+    percent = done / broadcast['total'] * 100 if broadcast['total'] else 100
+    return templates.BROADCAST_PROGRESS.render(
+        title=broadcasts.segment_title(broadcast['segment']),
+        status=BROADCAST_STATUS_NAMES[broadcast['status']],
+        done=done,
+        total=broadcast['total'],
+        percent=percent,
+        bar='▇' * int(percent // 10) + '░' * (10 - int(percent // 10)),
+        sent=broadcast['sent'],
+        failed=broadcast['failed']
+    )
+
+@broadcasts.on_progress
+async def broadcast_progress(broadcast: dict):
+    if not broadcast['status_message_id']:
+        return
+    sending = broadcast['status'] == broadcasts.STATUS_SENDING
+    try:
+        await bot.edit_message_text(
+            render_broadcast_progress(broadcast),
+            chat_id=broadcast['status_chat_id'],
+            message_id=broadcast['status_message_id'],
+            reply_markup=get_broadcast_cancel_keyboard(broadcast['id']) if sending else None,
+            parse_mode='HTML'
+        )
+    except TelegramBadRequest as e:
+        # «message is not modified» — прогресс не изменился с прошлого обновления
+        if 'not modified' not in str(e):
+            raise
+
+broadcasts.on_dead_chat(mark_chat_dead)
+
+@dp.message(Command("broadcasts"))
+async def broadcasts_command(message: Message):
+    admin_id = message.from_user.id
+    if not is_admin(admin_id):
+        await message.answer(f"{EMOJI['error']} У вас нет прав администратора.")
+        return
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    recent = broadcasts.get_recent(cursor, admin_id)
+    conn.close()
+    
+    if not recent:
+        await message.answer(f"{EMOJI['info']} Рассылок еще не было.")
+        return
+    
+    text = f"{EMOJI['broadcast']} <b>Последние рассылки</b>\n{format_divider()}"
+    for broadcast_id, segment, status, total, sent, failed, created_at in recent:
+        text += (
+            f"<b>#{broadcast_id}</b> {format_date(datetime.fromtimestamp(created_at))} — "
+            f"{broadcasts.segment_title(segment)}\n"
+            f"   {BROADCAST_STATUS_NAMES[status]}: доставлено <b>{sent}</b> из {total}, ошибок {failed}\n"
+        )
+    await message.answer(text, parse_mode='HTML')
+
+@dp.message(StateFilter(AdminStates.waiting_unlink_user))
+async def process_unlink_user(message: Message, state: FSMContext):
+    if message.text == BUTTONS['cancel']:
+        await cancel_button(message, state)
+        return
+    
+    try:
+        user_id = int(message.text.strip())
         
-        elif message.document:
-            caption = message.caption or ""
-            text = (
-                f"{EMOJI['chat']} <b>Новый документ</b>\n"
-                f"{format_divider()}"
-                f"{format_user_info(user_info.id, user_info.full_name, user_info.username)}\n\n"
-                f"{EMOJI['chat']} Подпись: {escape_html(caption)}" if caption else text
-            )
-            await bot.send_document(
-                admin_id,
-                message.document.file_id,
-                caption=f"{text}\n\n{EMOJI['chat']} Подпись: {escape_html(caption)}" if caption else text,
-                parse_mode='HTML'
-            )
-            add_message_to_history(user_info.id, admin_id, 'document', message.document.file_name)
+        # Проверяем что пользователь привязан к этому админу
+        users = get_users_for_admin(message.from_user.id)
+        user_ids = [u[0] for u in users]
         
-        elif message.voice:
-            text = (
-                f"{EMOJI['chat']} <b>Голосовое сообщение</b>\n"
-                f"{format_divider()}"
-                f"{format_user_info(user_info.id, user_info.full_name, user_info.username)}\n\n"
-                f"{EMOJI['chat']} Подпись: {escape_html(message.voice.caption)}" if message.voice.caption else text
-            )
-            await bot.send_voice(
-                admin_id,
-                message.voice.file_id,
-                caption=text,
-                parse_mode='HTML'
-            )
-            add_message_to_history(user_info.id, admin_id, 'voice', message.voice.caption)
+        if user_id not in user_ids:
+            await message.answer(f"{EMOJI['error']} Этот пользователь не привязан к вам!")
+            return
         
-        elif message.video_note:
-            await bot.send_video_note(admin_id, message.video_note.file_id)
-            text = (
-                f"{EMOJI['chat']} <b>Видеосообщение от:</b>\n"
-                f"{format_user_info(user_info.id, user_info.full_name, user_info.username)}\n\n"
-                f"{EMOJI['chat']} Подпись: {escape_html(message.video_note.caption)}" if message.video_note.caption else text
-            )
-            await bot.send_message(admin_id, text, parse_mode='HTML')
-            add_message_to_history(user_info.id, admin_id, 'video_note', message.video_note.caption)
+        remove_user_from_admin(user_id, message.from_user.id)
+        
+        # Удаляем задачу из планировщика
+        try:
+            scheduler.remove_job(f"payment_{user_id}_{message.from_user.id}")
+        except:
+            pass
+        
+        # Завершаем активный чат если есть
+        if is_chat_active(user_id, message.from_user.id):
+            end_chat_session(user_id, message.from_user.id)
+        
+        await state.clear()
+        
+        keyboard = get_admin_keyboard()
+        await message.answer(
+            f"{EMOJI['success']} Пользователь <code>{user_id}</code> успешно удален из системы.",
+            reply_markup=keyboard,
+            parse_mode='HTML'
+        )
         
-        await message.answer(f"{EMOJI['success']} Сообщение доставлено")
+        # Уведомляем пользователя
+        try:
+            await bot.send_message(
+                user_id,
+                f"{EMOJI['warning']} Вы были удалены из системы напоминаний об оплате.\n\n"
+                f"Вы больше не будете получать напоминания.",
+                reply_markup=get_user_keyboard()
+            )
+        except:
+            pass
+            
+    except ValueError:
+        await message.answer(f"{EMOJI['error']} Неверный формат ID. Введите число.")
+
+# Пересылка сообщений в чате пользователя с админом
+# Заголовки по типу сообщения: (от пользователя админу, от админа пользователю)
+RELAY_TITLES = {
+    'text': ("Новое сообщение", "{alias}:"),
+    'photo': ("Новое фото", "Фото от {alias}"),
+    'video': ("Новое видео", "Видео от {alias}"),
+    'document': ("Новый документ", "Документ от {alias}"),
+    'audio': ("Новое аудио", "Аудио от {alias}"),
+    'voice': ("Голосовое сообщение", "Голосовое от {alias}"),
+    'video_note': ("Видеосообщение", "Видеосообщение от {alias}"),
+    'album': ("Новый альбом", "Альбом от {alias}")
+}
+
+RELAY_MEDIA = {
+    'photo': InputMediaPhoto,
+    'video': InputMediaVideo,
+    'document': InputMediaDocument,
+    'audio': InputMediaAudio
+}
+
+def get_message_kind(message: Message) -> Optional[str]:
+    for kind in ('text', 'photo', 'video', 'document', 'audio', 'voice', 'video_note'):
+        if getattr(message, kind):
+            return kind
+    return None
+
+def get_file_id(message: Message, kind: str) -> str:
+    media = message.photo[-1] if kind == 'photo' else getattr(message, kind)
+    return media.file_id
+
+def get_history_content(message: Message, kind: str) -> Optional[str]:
+    if kind == 'text':
+        return message.text
+    if kind == 'document':
+        return message.document.file_name
+    return message.caption
+
+async def relay_messages(chat_id: int, messages: List[Message], head: Callable[[str], str],
+                         tail: str = '') -> List[Tuple[str, Optional[str]]]:
+    """Отправляет пачку сообщений минимальным числом вызовов API
+
+    Серия текстов склеивается в одно сообщение, альбом уходит одним
+    send_media_group. head(kind) — заголовок, tail — подпись в конце.
+    Возвращает (тип, содержимое) каждого сообщения для истории.
+    """
+    kinds = [get_message_kind(message) for message in messages]
+    
+    if kinds[0] == 'text':
+        blocks = [head('text')]
+        blocks += [escape_html(message.text) + "\n\n" for message in messages]
+        blocks.append(tail)
+        for text in templates.split_messages(blocks):
+            await bot.send_message(chat_id, text, parse_mode='HTML')
+    
+    elif messages[0].media_group_id:
+        media = []
+        for i, (message, kind) in enumerate(zip(messages, kinds)):
+            caption = escape_html(message.caption or '')
+            if i == 0:
+                caption = head('album') + (caption + "\n\n" if caption else '') + tail
+            media.append(RELAY_MEDIA[kind](media=get_file_id(message, kind), caption=caption or None, parse_mode='HTML'))
+        await bot.send_media_group(chat_id, media)
+    
+    else:
+        message, kind = messages[0], kinds[0]
+        caption = escape_html(message.caption or '')
+        text = head(kind) + (caption + "\n\n" if caption else '') + tail
+        if kind == 'video_note':
+            # У видеосообщений не бывает подписи — заголовок идет отдельным сообщением
+            await bot.send_video_note(chat_id, message.video_note.file_id)
+            await bot.send_message(chat_id, text, parse_mode='HTML')
+        else:
+            send = getattr(bot, f"send_{kind}")
+            await send(chat_id, get_file_id(message, kind), caption=text, parse_mode='HTML')
+    
+    return [(kind, get_history_content(message, kind)) for message, kind in zip(messages, kinds)]
+
+def relay_message(message: Message, flush: Callable[[List[Message]], Awaitable[None]]):
+    """Ставит сообщение в очередь чата: части альбома и серии текстов уходят пачкой
+
+    Остальные вложения отправляются сразу, но после уже отложенных сообщений
+    этого чата — порядок у получателя совпадает с порядком отправки.
+    """
+    if message.media_group_id and get_message_kind(message) in RELAY_MEDIA:
+        relay.chats.add(message.chat.id, message, flush, relay.RELAY_ALBUM_WINDOW, message.media_group_id)
+    elif message.text:
+        relay.chats.add(message.chat.id, message, flush, relay.RELAY_TEXT_WINDOW, 'text')
+    else:
+        relay.chats.add(message.chat.id, message, flush, 0)
+
+def confirm_relayed(count: int, single: str) -> str:
+    return single if count == 1 else f"{EMOJI['success']} Доставлено сообщений: {count}"
+
+# Обработчик чата пользователя с админом
+@dp.message(StateFilter(UserStates.chatting_with_admin))
+async def forward_to_admin(message: Message, state: FSMContext):
+    if message.text == BUTTONS['back']:
+        # Сначала досылаем отложенное, потом выходим из чата
+        await relay.chats.flush(message.chat.id)
+        await back_button(message, state)
+        return
+    
+    if get_message_kind(message) is None:
+        await message.answer(f"{EMOJI['warning']} Такие сообщения пока не пересылаются.")
+        return
+    
+    data = await state.get_data()
+    admin_id = data['admin_id']
+    flush = partial(relay_to_admin, admin_id)
+    relay_message(message, flush)
+
+async def relay_to_admin(admin_id: int, messages: List[Message]):
+    """Пересылает админу пачку сообщений пользователя"""
+    user_info = messages[0].from_user
+    last = messages[-1]
+    _, _, show_notifications = get_admin_settings(admin_id)
+    
+    if not show_notifications:
+        # Если уведомления выключены, просто подтверждаем отправку
+        await last.answer(confirm_relayed(len(messages), f"{EMOJI['success']} Сообщение отправлено"))
+        return
+    
+    def head(kind: str) -> str:
+        text = (
+            f"{EMOJI['chat']} <b>{RELAY_TITLES[kind][0]}</b>\n"
+            f"{format_divider()}"
+            f"{format_user_info(user_info.id, user_info.full_name, user_info.username)}\n\n"
+        )
+        if kind == 'text':
+            text += f"{EMOJI['chat']} <b>Текст:</b>\n"
+        return text
+    
+    try:
+        history = await relay_messages(
+            admin_id, messages, head, f"{EMOJI['info']} Используйте /chat_{user_info.id} для ответа"
+        )
+        add_messages_to_history([(user_info.id, admin_id, kind, content) for kind, content in history])
+        await last.answer(confirm_relayed(len(messages), f"{EMOJI['success']} Сообщение доставлено"))
     except Exception as e:
-        await message.answer(f"{EMOJI['error']} Не удалось отправить сообщение. Попробуйте позже.")
+        await last.answer(f"{EMOJI['error']} Не удалось отправить сообщение. Попробуйте позже.")
         logging.error(f"Ошибка при пересылке сообщения админу: {e}")
 
 # Обработчик чата админа с пользователем  
 @dp.message(StateFilter(AdminStates.chatting_with_user))
 async def forward_to_user(message: Message, state: FSMContext):
-    if message.text == f"{EMOJI['back']} Назад":
+    if message.text == BUTTONS['back']:
+        await relay.chats.flush(message.chat.id)
         await back_button(message, state)
         return
     
@@ -1784,75 +2732,63 @@ async def forward_to_user(message: Message, state: FSMContext):
         )
         return
     
-    admin_alias, _, _ = get_admin_settings(message.from_user.id)
+    if get_message_kind(message) is None:
+        await message.answer(f"{EMOJI['warning']} Такие сообщения пока не пересылаются.")
+        return
+    
+    flush = partial(relay_to_user, user_id)
+    relay_message(message, flush)
+
+async def relay_to_user(user_id: int, messages: List[Message]):
+    """Пересылает пользователю пачку сообщений админа"""
+    admin_id = messages[0].from_user.id
+    last = messages[-1]
+    admin_alias, _, _ = get_admin_settings(admin_id)
+    
+    def head(kind: str) -> str:
+        title = RELAY_TITLES[kind][1].format(alias=escape_html(admin_alias))
+        return f"{EMOJI['admin']} <b>{title}</b>\n\n"
     
     try:
-        # Обработка различных типов сообщений
-        if message.text:
-            text = f"{EMOJI['admin']} <b>{escape_html(admin_alias)}:</b>\n\n{escape_html(message.text)}\n\n"
-            await bot.send_message(user_id, text, parse_mode='HTML')
-            add_message_to_history(message.from_user.id, user_id, 'text', message.text)
-        
-        elif message.photo:
-            caption = message.caption or ""
-            text = f"{EMOJI['admin']} <b>Фото от {escape_html(admin_alias)}</b>\n\n{escape_html(caption)}\n\n"
-            await bot.send_photo(
-                user_id,
-                message.photo[-1].file_id,
-                caption=f"{text}\n\n{escape_html(caption)}" if caption else text,
-                parse_mode='HTML'
-            )
-            add_message_to_history(message.from_user.id, user_id, 'photo', caption)
-        
-        elif message.video:
-            caption = message.caption or ""
-            text = f"{EMOJI['admin']} <b>Видео от {escape_html(admin_alias)}</b>\n\n{escape_html(caption)}\n\n"
-            await bot.send_video(
-                user_id,
-                message.video.file_id,
-                caption=f"{text}\n\n{escape_html(caption)}" if caption else text,
-                parse_mode='HTML'
-            )
-            add_message_to_history(message.from_user.id, user_id, 'video', caption)
-        
-        elif message.document:
-            caption = message.caption or ""
-            text = f"{EMOJI['admin']} <b>Документ от {escape_html(admin_alias)}</b>\n\n{escape_html(caption)}\n\n"
-            await bot.send_document(
-                user_id,
-                message.document.file_id,
-                caption=f"{text}\n\n{escape_html(caption)}" if caption else text,
-                parse_mode='HTML'
-            )
-            add_message_to_history(message.from_user.id, user_id, 'document', message.document.file_name)
-        
-        elif message.voice:
-            text = f"{EMOJI['admin']} <b>Голосовое от {escape_html(admin_alias)}</b>\n\n{escape_html(message.voice.caption)}\n\n"
-            await bot.send_voice(
-                user_id,
-                message.voice.file_id,
-                caption=text,
-                parse_mode='HTML'
-            )
-            add_message_to_history(message.from_user.id, user_id, 'voice', message.voice.caption)
-        
-        elif message.video_note:
-            await bot.send_video_note(user_id, message.video_note.file_id)
-            text = f"{EMOJI['admin']} <b>Видеосообщение от {escape_html(admin_alias)}</b>\n\n{escape_html(message.video_note.caption)}\n\n"
-            await bot.send_message(user_id, text, parse_mode='HTML')
-            add_message_to_history(message.from_user.id, user_id, 'video_note', message.video_note.caption)
-        
-        await message.answer(f"{EMOJI['success']} Доставлено")
+        history = await relay_messages(user_id, messages, head)
+        add_messages_to_history([(admin_id, user_id, kind, content) for kind, content in history])
+        await last.answer(confirm_relayed(len(messages), f"{EMOJI['success']} Доставлено"))
     except Exception as e:
-        await message.answer(
+        await last.answer(
             f"{EMOJI['error']} Не удалось отправить сообщение.\n"
             f"Возможно, пользователь заблокировал бота."
         )
         logging.error(f"Ошибка при пересылке сообщения пользователю: {e}")
 
 # Функции для отправки напоминаний
-async def send_payment_reminder(user_id: int, admin_id: int, message_text: str):
-    keyboard = get_payment_confirmation_keyboard(admin_id)
+def queue_reminder(cursor, user_id: int, admin_id: int, text: str, period: str,
+                   send_at: Optional[datetime] = None) -> bool:
+    """Ставит напоминание в очередь в транзакции вызывающего кода
+
+    Ожидающий платеж и само напоминание сохраняются вместе, message_id
+    проставляется после фактической отправки. False — за период уже было.
+    """
+    # Не больше одного напоминания за расчетный период
+    if not deliveries.claim_delivery(cursor, user_id, admin_id, period):
+        return False
+    
+    # Напоминания прошлых периодов заменяются новым
+    cleanup.retire_pending(cursor, user_id, admin_id)
+    
+    due_date = (send_at or datetime.now()) + timedelta(days=PAYMENT_TIMEOUT_DAYS)
+    period_id = payment_periods.mark_reminded(cursor, user_id, admin_id, period, int(due_date.timestamp()))
+    outbox.enqueue(
+        cursor,
+        'reminder',
+        user_id,
+        text,
+        get_payment_confirmation_keyboard(admin_id, period),
+        ref_id=period_id,
+        send_at=send_at.timestamp() if send_at else None
+    )
+    return True
+
+async def send_payment_reminder(user_id: int, admin_id: int, message_text: str, period: Optional[str] = None):
     admin_alias, _, _ = get_admin_settings(admin_id)
     
     try:
@@ -1862,75 +2798,213 @@ async def send_payment_reminder(user_id: int, admin_id: int, message_text: str):
             logging.warning(f"Пользователь {user_id} больше не привязан к админу {admin_id}")
             return
         
-        text = (
-            f"{EMOJI['money']} <b>Напоминание об оплате!</b>\n"
-            f"{format_divider()}"
-            f"{escape_html(message_text)}\n\n"
-            f"{EMOJI['admin']} От: <b>{escape_html(admin_alias)}</b>\n"
-            f"{EMOJI['clock']} Время: <b>{format_date(datetime.now())}</b> (+5 МСК)"
-        )
+        # Чаты, заблокировавшие бота, пропускаем до возвращения пользователя
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        delivery_status = fetch_one(cursor, 'link_delivery_status', '''
+            SELECT delivery_status FROM user_admin_links WHERE user_id = ? AND admin_id = ?
+        ''', (user_id, admin_id))
+        conn.close()
+        if delivery_status and delivery_status[0] != 'active':
+            logging.info(f"Напоминание пользователю {user_id} пропущено: {delivery_status[0]}")
+            return
         
-        sent_message = await bot.send_message(
-            user_id,
-            text,
-            reply_markup=keyboard,
-            parse_mode='HTML'
+        text = templates.PAYMENT_REMINDER.render(
+            message=message_text,
+            alias=admin_alias,
+            sent_at=format_date(datetime.now())
         )
         
-        # Сохраняем информацию о ожидающем платеже
+        period = period or deliveries.get_period()
         conn = get_db_connection()
         cursor = conn.cursor()
-        due_date = datetime.now() + timedelta(days=PAYMENT_TIMEOUT_DAYS)
-        cursor.execute('''
-            INSERT INTO pending_payments (user_id, admin_id, message_id, due_date)
-            VALUES (?, ?, ?, ?)
-        ''', (user_id, admin_id, sent_message.message_id, due_date))
+        queued = queue_reminder(cursor, user_id, admin_id, text, period)
         conn.commit()
         conn.close()
         
-        # Планируем проверку просрочки
-        scheduler.add_job(
-            check_overdue_payment,
-            'date',
-            run_date=due_date,
-            args=[user_id, admin_id],
-            id=f"overdue_{user_id}_{admin_id}_{sent_message.message_id}"
-        )
-        
-        # Уведомляем админа об отправке
-        await bot.send_message(
-            admin_id,
-            f"{EMOJI['success']} Напоминание отправлено пользователю ID: <code>{user_id}</code>",
-            parse_mode='HTML'
-        )
+        if queued:
+            outbox.wake()
+            cleanup.wake()
+        else:
+            logging.info(f"Напоминание пользователю {user_id} за {period} уже отправлено")
         
     except Exception as e:
-        logging.error(f"Ошибка отправки напоминания пользователю {user_id}: {e}")
+        logging.error(f"Ошибка постановки напоминания пользователю {user_id} в очередь: {e}")
+
+async def prerender_hot_slots():
+    """Заранее ставит в очередь напоминания горячих слотов, разнося отправку по окну
+
+    Напоминания, поставленные здесь, уже отмечены в журнале периода, поэтому
+    сработавшие в срок задачи планировщика для них ничего не делают.
+    """
+    upcoming = slots.upcoming_slots(datetime.now())
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    load = slots.get_slot_load(cursor)
+    
+    for moment, slot in upcoming:
+        if not slots.is_hot(load.get(slot, 0)):
+            continue
+        
+        day, time_str = slot
+        # Одним запросом: привязки слота, псевдоним админа, основной админ пользователя
+        rows = fetch_all(cursor, 'slot_links', '''
+            SELECT l.user_id, l.admin_id, l.payment_time, l.payment_message,
+                   COALESCE(s.alias, 'Администратор')
+            FROM user_admin_links l
+            LEFT JOIN admin_settings s ON s.admin_id = l.admin_id
+            WHERE l.payment_day = ? AND l.delivery_status = 'active'
+              AND l.admin_id = (SELECT admin_id FROM user_admin_links WHERE user_id = l.user_id LIMIT 1)
+        ''', (day,))
+        
+        period = deliveries.get_period(moment)
+        queued = 0
+        for user_id, admin_id, link_time, message_text, alias in rows:
+            if slots.normalize_time(link_time) != time_str:
+                continue
+            send_at = moment + timedelta(seconds=slots.jitter(user_id, admin_id))
+            text = templates.PAYMENT_REMINDER.render(
+                message=message_text,
+                alias=alias,
+                sent_at=format_date(send_at)
+            )
+            if queue_reminder(cursor, user_id, admin_id, text, period, send_at):
+                queued += 1
         
-        # Уведомляем админа об ошибке
-        try:
-            await bot.send_message(
-                admin_id,
-                f"{EMOJI['error']} Не удалось отправить напоминание пользователю ID: <code>{user_id}</code>\n"
-                f"Возможно, пользователь заблокировал бота.",
-                parse_mode='HTML'
+        conn.commit()
+        if queued:
+            cleanup.wake()
+            logging.info(
+                f"Слот {day} число {time_str}: подготовлено {queued} напоминаний, "
+                f"отправка растянута на {slots.SLOT_SPREAD_WINDOW} с"
             )
-        except:
-            pass
+    
+    conn.close()
+
+@outbox.on_delivered('reminder')
+async def reminder_delivered(period_id: int, sent_message: Message):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    pending = payment_periods.set_message(cursor, period_id, sent_message.message_id)
+    conn.commit()
+    conn.close()
+    
+    # Платеж могли подтвердить, пока напоминание ждало в очереди
+    if not pending:
+        return
+    
+    user_id, admin_id, due_at = pending
+    
+    # Планируем проверку просрочки
+    scheduler.add_job(
+        check_overdue_payment,
+        'date',
+        run_date=datetime.fromtimestamp(due_at),
+        args=[user_id, admin_id],
+        id=f"overdue_{user_id}_{admin_id}_{sent_message.message_id}"
+    )
+    
+    # Уведомляем админа об отправке
+    outbox.notify(
+        admin_id,
+        f"{EMOJI['success']} Напоминание отправлено пользователю ID: <code>{user_id}</code>"
+    )
+
+@outbox.on_dead('reminder')
+async def reminder_failed(period_id: int, user_id: int, error: Exception):
+    # Напоминание не дошло — ожидать по нему оплату бессмысленно
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    pending = payment_periods.forget_message(cursor, period_id)
+    conn.commit()
+    conn.close()
+    
+    # Заблокированный чат попадет в ежедневную сводку, а не в отдельное сообщение
+    reason = outbox.classify_chat_error(error)
+    if reason:
+        mark_chat_dead(user_id, reason)
+        return
+    
+    if not pending:
+        return
+    
+    # Уведомляем админа об ошибке
+    outbox.notify(
+        pending[1],
+        f"{EMOJI['error']} Не удалось отправить напоминание пользователю ID: <code>{user_id}</code>\n"
+        f"{escape_html(outbox.describe_error(error)[:200])}"
+    )
+
+@outbox.on_delivered('payment_claim')
+async def payment_claim_delivered(period_id: int, sent_message: Message):
+    # Кнопки этого уведомления снимаются при массовом подтверждении
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    payment_periods.set_admin_message(cursor, period_id, sent_message.message_id)
+    conn.commit()
+    conn.close()
+
+@outbox.on_dead('payment_claim')
+@outbox.on_dead('notification')
+async def notification_failed(ref_id: Optional[int], chat_id: int, error: Exception):
+    reason = outbox.classify_chat_error(error)
+    if reason:
+        mark_chat_dead(chat_id, reason)
+
+async def send_dead_chat_digest():
+    """Раз в день сообщает админам о пользователях, до которых перестали доходить сообщения"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    rows = fetch_all(cursor, 'dead_chats_new', '''
+        SELECT admin_id, user_id, delivery_status, delivery_error_at FROM user_admin_links
+        WHERE delivery_status != 'active' AND delivery_notified = FALSE
+        ORDER BY admin_id, delivery_error_at
+    ''')
+    
+    if not rows:
+        conn.close()
+        return
+    
+    by_admin: Dict[int, List[tuple]] = {}
+    for admin_id, user_id, status, error_at in rows:
+        by_admin.setdefault(admin_id, []).append((user_id, status, error_at))
+    
+    for admin_id, users in by_admin.items():
+        text = f"{EMOJI['alert']} <b>Недоступные пользователи ({len(users)}):</b>\n"
+        text += format_divider()
+        for user_id, status, error_at in users[:50]:
+            text += (
+                f"• <code>{user_id}</code> — {DEAD_CHAT_REASONS.get(status, escape_html(status))}, "
+                f"{format_date(datetime.fromtimestamp(error_at)) if error_at else 'дата неизвестна'}\n"
+            )
+        if len(users) > 50:
+            text += f"… и еще {len(users) - 50}\n"
+        text += f"\n{EMOJI['info']} Напоминания им приостановлены и возобновятся, когда пользователь отправит /start."
+        outbox.enqueue(cursor, 'notification', admin_id, text)
+    
+    execute(cursor, 'dead_chats_mark_notified', '''
+        UPDATE user_admin_links SET delivery_notified = TRUE
+        WHERE delivery_status != 'active' AND delivery_notified = FALSE
+    ''')
+    conn.commit()
+    conn.close()
+    outbox.wake()
 
 async def check_overdue_payment(user_id: int, admin_id: int):
     conn = get_db_connection()
     cursor = conn.cursor()
     
     # Проверяем, есть ли неподтвержденные платежи
-    cursor.execute('''
-        SELECT COUNT(*) FROM pending_payments 
-        WHERE user_id = ? AND admin_id = ? AND due_date <= ?
-    ''', (user_id, admin_id, datetime.now()))
-    
-    overdue_count = cursor.fetchone()[0]
+    overdue_count = fetch_one(cursor, 'check_overdue_payment', '''
+        SELECT COUNT(*) FROM payment_periods 
+        WHERE user_id = ? AND admin_id = ? AND due_at <= ?
+    ''', (user_id, admin_id, int(datetime.now().timestamp())))[0]
     
     if overdue_count > 0:
+        # Число просроченных в сводке администратора изменилось
+        status_cache.invalidate(user_id, admin_id)
+        
         try:
             user_info = await bot.get_chat(user_id)
             user_name = user_info.full_name or "Без имени"
@@ -1942,50 +3016,57 @@ async def check_overdue_payment(user_id: int, admin_id: int):
         _, _, show_notifications = get_admin_settings(admin_id)
         
         if show_notifications:
-            await bot.send_message(
+            outbox.notify(
                 admin_id,
-                f"{EMOJI['alert']} <b>ПРОСРОЧКА ПЛАТЕЖА!</b>\n"
-                f"{format_divider()}"
-                f"{format_user_info(user_id, user_name, username)}\n\n"
-                f"{EMOJI['clock']} Просрочено на: <b>{PAYMENT_TIMEOUT_DAYS} дн.</b>\n\n"
-                f"{EMOJI['info']} Свяжитесь с пользователем для уточнения.",
-                parse_mode='HTML'
+                templates.OVERDUE_ALERT.render(
+                    user_info=format_user_info(user_id, user_name, username),
+                    days=PAYMENT_TIMEOUT_DAYS
+                )
             )
     
     conn.close()
 
 # Обработка подтверждения оплаты
-@dp.callback_query(F.data.startswith("paid_"))
-async def payment_confirmation(callback: CallbackQuery):
-    admin_id = int(callback.data.split("_")[1])
+@callback_router.route(PAID)
+async def payment_confirmation(callback: CallbackQuery, state: FSMContext, admin_id: int, period: Optional[str]):
     user_id = callback.from_user.id
+    admin_alias, _, show_notifications = get_admin_settings(admin_id)
     
-    # Проверяем что платеж еще не был подтвержден
+    period = period or deliveries.get_period()
+    
+    # Переход «напомнили/отклонен -> заявлен» одним условным UPSERT:
+    # повторные и одновременные нажатия ничего не меняют
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT COUNT(*) FROM payments 
-        WHERE user_id = ? AND admin_id = ? 
-        AND DATE(payment_date) = DATE('now') 
-        AND confirmed = FALSE
-    ''', (user_id, admin_id))
-    
-    existing_payment = cursor.fetchone()[0]
-    
-    if existing_payment > 0:
+    period_id = payment_periods.claim(cursor, user_id, admin_id, period)
+    if period_id is None:
+        conn.close()
         await callback.answer(
-            f"{EMOJI['warning']} Вы уже отправили подтверждение сегодня. Ожидайте ответа администратора.",
+            f"{EMOJI['warning']} Оплата за этот период уже отправлена. Ожидайте ответа администратора.",
             show_alert=True
         )
         return
     
-    # Отмечаем как оплаченное (но неподтвержденное)
-    cursor.execute('''
-        INSERT INTO payments (user_id, admin_id, payment_date, confirmed)
-        VALUES (?, ?, DATE('now'), FALSE)
-    ''', (user_id, admin_id))
+    # Уведомление админу уходит через очередь вместе с записью платежа
+    if show_notifications:
+        outbox.enqueue(
+            cursor,
+            'payment_claim',
+            admin_id,
+            f"{EMOJI['money']} <b>Новое подтверждение оплаты!</b>\n"
+            f"{format_divider()}"
+            f"{format_user_info(user_id, callback.from_user.full_name or 'Без имени', callback.from_user.username)}\n\n"
+            f"{EMOJI['calendar']} Дата: <b>{datetime.now().strftime('%d.%m.%Y')}</b>\n"
+            f"{EMOJI['clock']} Время: <b>{datetime.now().strftime('%H:%M')}</b>\n\n"
+            f"Подтвердите или отклоните платеж:",
+            get_admin_payment_confirmation_keyboard(user_id, period),
+            ref_id=period_id
+        )
+    
     conn.commit()
     conn.close()
+    status_cache.invalidate(user_id, admin_id)
+    outbox.wake()
     
     # Убираем кнопку
     await callback.message.edit_reply_markup()
@@ -1994,154 +3075,291 @@ async def payment_confirmation(callback: CallbackQuery):
     new_text = callback.message.text + f"\n\n{EMOJI['success']} <b>Подтверждение отправлено!</b>\nОжидайте ответа администратора."
     await callback.message.edit_text(new_text, parse_mode='HTML')
     
-    # Создаем кнопки для админа
-    keyboard = get_admin_payment_confirmation_keyboard(user_id)
+    await callback.answer(f"{EMOJI['success']} Подтверждение отправлено администратору!")
     
-    try:
-        user_info = await bot.get_chat(user_id)
-        user_name = user_info.full_name or "Без имени"
-        username = user_info.username
-    except:
-        user_name = "Недоступен"
-        username = None
+    # Просим приложить чек к заявке, не прерывая начатое действие (например, чат с админом)
+    if await state.get_state() is not None:
+        await callback.message.answer(
+            f"{EMOJI['receipt']} Чек можно прислать после завершения текущего действия — "
+            f"он будет приложен к заявке."
+        )
+        return
     
-    admin_alias, _, show_notifications = get_admin_settings(admin_id)
+    await state.set_state(UserStates.waiting_receipt)
+    await state.update_data(receipt_period_id=period_id, receipt_admin_id=admin_id, receipt_period=period)
+    await callback.message.answer(
+        f"{EMOJI['receipt']} Пришлите скриншот или файл чека об оплате — "
+        f"администратор увидит его вместе с заявкой.\n"
+        f"Если сумма отличается от обычной, напишите ее числом.",
+        reply_markup=get_skip_receipt_keyboard()
+    )
+
+async def save_receipt(message: Message, claim: Optional[tuple]) -> bool:
+    """Прикрепляет фото или документ из сообщения к заявке (period_id, admin_id, period)"""
+    if message.photo:
+        kind, media = receipts.RECEIPT_PHOTO, message.photo[-1]
+    elif message.document:
+        kind, media = receipts.RECEIPT_DOCUMENT, message.document
+    else:
+        return False
     
-    if show_notifications:
-        await bot.send_message(
-            admin_id,
-            f"{EMOJI['money']} <b>Новое подтверждение оплаты!</b>\n"
-            f"{format_divider()}"
-            f"{format_user_info(user_id, user_name, username)}\n\n"
-            f"{EMOJI['calendar']} Дата: <b>{datetime.now().strftime('%d.%m.%Y')}</b>\n"
-            f"{EMOJI['clock']} Время: <b>{datetime.now().strftime('%H:%M')}</b>\n\n"
-            f"Подтвердите или отклоните платеж:",
-            reply_markup=keyboard,
-            parse_mode='HTML'
+    user = message.from_user
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    if claim is None:
+        claim = receipts.find_claim(cursor, user.id)
+    if claim is None:
+        conn.close()
+        return False
+    
+    period_id, admin_id, period = claim
+    attached = receipts.attach(
+        cursor, period_id, user.id, admin_id, period, kind, media.file_id, media.file_unique_id
+    )
+    if attached is None:
+        conn.close()
+        await message.answer(f"{EMOJI['info']} Заявка уже рассмотрена администратором, чек не нужен.")
+        return True
+    
+    receipt_id, earlier = attached
+    if receipt_id is None:
+        conn.close()
+        await message.answer(f"{EMOJI['info']} Этот чек уже приложен к заявке.")
+        return True
+    
+    text = (
+        f"{EMOJI['receipt']} <b>Новый чек об оплате</b>\n"
+        f"{format_divider()}"
+        f"{format_user_info(user.id, user.full_name, user.username)}\n\n"
+        f"{EMOJI['calendar']} Период: <b>{period}</b>\n"
+    )
+    if earlier:
+        text += f"\n{EMOJI['warning']} <b>Этот файл уже присылали:</b> ID <code>{earlier[1]}</code> за {earlier[2]}\n"
+    outbox.enqueue(cursor, 'notification', admin_id, text, get_open_receipts_keyboard())
+    conn.commit()
+    conn.close()
+    outbox.wake()
+    
+    await message.answer(f"{EMOJI['success']} Чек приложен к заявке. Ожидайте ответа администратора.")
+    return True
+
+@dp.message(StateFilter(UserStates.waiting_receipt))
+async def receipt_upload(message: Message, state: FSMContext):
+    data = await state.get_data()
+    claim = (data['receipt_period_id'], data['receipt_admin_id'], data['receipt_period'])
+    if await save_receipt(message, claim):
+        await state.clear()
+        return
+    
+    # Фактическая сумма платежа, если пользователь ее уточнил
+    amount = parse_amount(message.text) if message.text else None
+    if amount is not None:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        updated = payment_periods.set_amount(cursor, claim[0], amount)
+        conn.commit()
+        conn.close()
+        if updated:
+            status_cache.invalidate(message.from_user.id, claim[1])
+            await message.answer(
+                f"{EMOJI['success']} Сумма <b>{amount:.2f} ₽</b> записана. Пришлите чек или нажмите «Без чека».",
+                reply_markup=get_skip_receipt_keyboard(),
+                parse_mode='HTML'
+            )
+        else:
+            await state.clear()
+            await message.answer(f"{EMOJI['info']} Заявка уже рассмотрена администратором.")
+        return
+    
+    await message.answer(
+        f"{EMOJI['info']} Пришлите фото или документ с чеком либо нажмите «Без чека».",
+        reply_markup=get_skip_receipt_keyboard()
+    )
+
+@callback_router.route(SKIP_RECEIPT)
+async def skip_receipt(callback: CallbackQuery, state: FSMContext):
+    if await state.get_state() == UserStates.waiting_receipt.state:
+        await state.clear()
+    await callback.message.edit_reply_markup()
+    await callback.answer(f"{EMOJI['info']} Хорошо, без чека")
+
+# Очередь проверки чеков
+async def show_receipt(callback_or_message, admin_id: int, item: tuple, edit: bool):
+    """Показывает чек из очереди; при листании меняется только медиа в том же сообщении"""
+    receipt_id, user_id, period, kind, file_id, created_at, duplicate_user, duplicate_period = item
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    position, total = receipts.get_review_position(cursor, admin_id, receipt_id)
+    conn.close()
+    
+    caption = (
+        f"{EMOJI['receipt']} <b>Чек {position} из {total}</b>\n"
+        f"{EMOJI['user']} ID: <code>{user_id}</code>\n"
+        f"{EMOJI['calendar']} Период: <b>{period}</b>, прислан {format_date(datetime.fromtimestamp(created_at))}"
+    )
+    if duplicate_user is not None:
+        caption += f"\n{EMOJI['warning']} <b>Повтор:</b> файл уже присылал ID <code>{duplicate_user}</code> за {duplicate_period}"
+    keyboard = get_receipt_review_keyboard(receipt_id, user_id, period)
+    
+    if edit:
+        media_type = InputMediaPhoto if kind == receipts.RECEIPT_PHOTO else InputMediaDocument
+        await callback_or_message.message.edit_media(
+            media_type(media=file_id, caption=caption, parse_mode='HTML'),
+            reply_markup=keyboard
         )
+    elif kind == receipts.RECEIPT_PHOTO:
+        await bot.send_photo(admin_id, file_id, caption=caption, reply_markup=keyboard, parse_mode='HTML')
+    else:
+        await bot.send_document(admin_id, file_id, caption=caption, reply_markup=keyboard, parse_mode='HTML')
+
+async def open_receipt_queue(admin_id: int) -> bool:
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    item = receipts.get_review_item(cursor, admin_id)
+    conn.close()
     
-    await callback.answer(f"{EMOJI['success']} Подтверждение отправлено администратору!")
+    if item is None:
+        await bot.send_message(admin_id, f"{EMOJI['success']} Нет чеков, ожидающих проверки!")
+        return False
+    await show_receipt(None, admin_id, item, edit=False)
+    return True
+
+@callback_router.route(OPEN_RECEIPTS)
+async def open_receipts_callback(callback: CallbackQuery, state: FSMContext):
+    if not is_admin(callback.from_user.id):
+        await callback.answer(f"{EMOJI['error']} У вас нет прав администратора.", show_alert=True)
+        return
+    await callback.answer()
+    await open_receipt_queue(callback.from_user.id)
+
+async def page_receipts(callback: CallbackQuery, receipt_id: int, backwards: bool):
+    if not is_admin(callback.from_user.id):
+        await callback.answer(f"{EMOJI['error']} У вас нет прав администратора.", show_alert=True)
+        return
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    item = receipts.get_review_item(cursor, callback.from_user.id, receipt_id, backwards)
+    conn.close()
+    
+    if item is None:
+        await callback.answer(f"{EMOJI['info']} {'Это первый чек' if backwards else 'Больше чеков нет'}")
+        return
+    await show_receipt(callback, callback.from_user.id, item, edit=True)
+    await callback.answer()
+
+@callback_router.route(RECEIPT_NEXT)
+async def next_receipt(callback: CallbackQuery, state: FSMContext, receipt_id: int):
+    await page_receipts(callback, receipt_id, backwards=False)
+
+@callback_router.route(RECEIPT_PREV)
+async def prev_receipt(callback: CallbackQuery, state: FSMContext, receipt_id: int):
+    await page_receipts(callback, receipt_id, backwards=True)
 
 # Подтверждение/отклонение админом
-@dp.callback_query(F.data.startswith("confirm_"))
-async def confirm_payment(callback: CallbackQuery):
+@callback_router.route(CONFIRM_PAYMENT)
+async def confirm_payment(callback: CallbackQuery, state: FSMContext, user_id: int, period: Optional[str]):
     if not is_admin(callback.from_user.id):
         await callback.answer(f"{EMOJI['error']} У вас нет прав администратора.", show_alert=True)
         return
     
-    user_id = int(callback.data.split("_")[1])
+    admin_alias, _, _ = get_admin_settings(callback.from_user.id)
     
     # Подтверждаем платеж
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE payments SET confirmed = TRUE 
-        WHERE user_id = ? AND admin_id = ? AND confirmed = FALSE
-        AND DATE(payment_date) = DATE('now')
-    ''', (user_id, callback.from_user.id))
+    resolved = payment_periods.resolve(cursor, user_id, callback.from_user.id, period, confirmed=True)
     
-    updated_rows = cursor.rowcount
-    
-    if updated_rows == 0:
+    if resolved is None:
+        conn.close()
         await callback.answer(
             f"{EMOJI['warning']} Платеж уже был обработан или не найден.",
             show_alert=True
         )
         return
     
-    # Удаляем ожидающие платежи
-    cursor.execute('''
-        DELETE FROM pending_payments 
-        WHERE user_id = ? AND admin_id = ?
-    ''', (user_id, callback.from_user.id))
+    # Снимаем ожидающие платежи, их напоминания уходят в очистку
+    cleanup.retire_pending(cursor, user_id, callback.from_user.id)
+    
+    # Уведомление пользователю фиксируется вместе с подтверждением
+    outbox.enqueue(
+        cursor,
+        'notification',
+        user_id,
+        f"{EMOJI['success']} <b>Ваш платеж подтвержден!</b>\n\n"
+        f"{EMOJI['admin']} Администратор: <b>{escape_html(admin_alias)}</b>\n"
+        f"{EMOJI['calendar']} Дата: <b>{datetime.now().strftime('%d.%m.%Y %H:%M')}</b>\n\n"
+        f"Спасибо за своевременную оплату!"
+    )
     
     conn.commit()
     conn.close()
+    status_cache.invalidate(user_id, callback.from_user.id)
+    paid_sets.mark_paid(user_id, callback.from_user.id, resolved)
+    outbox.wake()
+    cleanup.wake()
     
     # Обновляем сообщение
-    await callback.message.edit_text(
-        callback.message.text + f"\n\n{EMOJI['success']} <b>ПЛАТЕЖ ПОДТВЕРЖДЕН</b>\n{format_date(datetime.now())}",
-        parse_mode='HTML'
+    await append_to_message(
+        callback.message,
+        f"\n\n{EMOJI['success']} <b>ПЛАТЕЖ ПОДТВЕРЖДЕН</b>\n{format_date(datetime.now())}",
+        get_receipt_paging(callback.message)
     )
     
-    admin_alias, _, _ = get_admin_settings(callback.from_user.id)
-    
-    try:
-        await bot.send_message(
-            user_id,
-            f"{EMOJI['success']} <b>Ваш платеж подтвержден!</b>\n\n"
-            f"{EMOJI['admin']} Администратор: <b>{escape_html(admin_alias)}</b>\n"
-            f"{EMOJI['calendar']} Дата: <b>{datetime.now().strftime('%d.%m.%Y %H:%M')}</b>\n\n"
-            f"Спасибо за своевременную оплату!",
-            parse_mode='HTML'
-        )
-    except:
-        pass
-    
     await callback.answer(f"{EMOJI['success']} Платеж подтвержден!")
 
-@dp.callback_query(F.data.startswith("reject_"))
-async def reject_payment(callback: CallbackQuery):
+@callback_router.route(REJECT_PAYMENT)
+async def reject_payment(callback: CallbackQuery, state: FSMContext, user_id: int, period: Optional[str]):
     if not is_admin(callback.from_user.id):
         await callback.answer(f"{EMOJI['error']} У вас нет прав администратора.", show_alert=True)
         return
     
-    user_id = int(callback.data.split("_")[1])
+    admin_alias, _, _ = get_admin_settings(callback.from_user.id)
     
     # Удаляем неподтвержденный платеж
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        DELETE FROM payments 
-        WHERE user_id = ? AND admin_id = ? AND confirmed = FALSE
-        AND DATE(payment_date) = DATE('now')
-    ''', (user_id, callback.from_user.id))
+    resolved = payment_periods.resolve(cursor, user_id, callback.from_user.id, period, confirmed=False)
+    
+    if resolved is not None:
+        # Уведомление пользователю фиксируется вместе с отклонением
+        outbox.enqueue(
+            cursor,
+            'notification',
+            user_id,
+            f"{EMOJI['error']} <b>Ваш платеж был отклонен</b>\n\n"
+            f"{EMOJI['admin']} Администратор: <b>{escape_html(admin_alias)}</b>\n"
+            f"{EMOJI['calendar']} Дата: <b>{datetime.now().strftime('%d.%m.%Y %H:%M')}</b>\n\n"
+            f"{EMOJI['info']} Свяжитесь с администратором для уточнения деталей.",
+            get_contact_admin_keyboard(callback.from_user.id)
+        )
     
-    deleted_rows = cursor.rowcount
     conn.commit()
     conn.close()
     
-    if deleted_rows == 0:
+    if resolved is None:
         await callback.answer(
             f"{EMOJI['warning']} Платеж уже был обработан или не найден.",
             show_alert=True
         )
         return
     
+    status_cache.invalidate(user_id, callback.from_user.id)
+    outbox.wake()
+    
     # Обновляем сообщение
-    await callback.message.edit_text(
-        callback.message.text + f"\n\n{EMOJI['error']} <b>ПЛАТЕЖ ОТКЛОНЕН</b>\n{format_date(datetime.now())}",
-        parse_mode='HTML'
+    await append_to_message(
+        callback.message,
+        f"\n\n{EMOJI['error']} <b>ПЛАТЕЖ ОТКЛОНЕН</b>\n{format_date(datetime.now())}",
+        get_receipt_paging(callback.message)
     )
     
-    admin_alias, _, _ = get_admin_settings(callback.from_user.id)
-    
-    try:
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(
-                text=f"{EMOJI['chat']} Связаться с администратором",
-                callback_data=f"contact_admin_{callback.from_user.id}"
-            )]
-        ])
-        
-        await bot.send_message(
-            user_id,
-            f"{EMOJI['error']} <b>Ваш платеж был отклонен</b>\n\n"
-            f"{EMOJI['admin']} Администратор: <b>{escape_html(admin_alias)}</b>\n"
-            f"{EMOJI['calendar']} Дата: <b>{datetime.now().strftime('%d.%m.%Y %H:%M')}</b>\n\n"
-            f"{EMOJI['info']} Свяжитесь с администратором для уточнения деталей.",
-            reply_markup=keyboard,
-            parse_mode='HTML'
-        )
-    except:
-        pass
-    
     await callback.answer(f"{EMOJI['info']} Платеж отклонен")
 
 # Обработчик кнопки связи с админом из отклоненного платежа
-@dp.callback_query(F.data.startswith("contact_admin_"))
-async def contact_admin_from_rejection(callback: CallbackQuery, state: FSMContext):
-    admin_id = int(callback.data.split("_")[2])
+@callback_router.route(CONTACT_ADMIN)
+async def contact_admin_from_rejection(callback: CallbackQuery, state: FSMContext, admin_id: int):
     user_id = callback.from_user.id
     
     # Проверяем что пользователь привязан к этому админу
@@ -2187,7 +3405,7 @@ async def contact_admin_from_rejection(callback: CallbackQuery, state: FSMContex
     await callback.answer()
 
 # Обработчики callback'ов для выбора сообщения
-@dp.callback_query(F.data == "use_default_msg")
+@callback_router.route(USE_DEFAULT_MSG)
 async def use_default_message_callback(callback: CallbackQuery, state: FSMContext):
     if not is_admin(callback.from_user.id):
         await callback.answer(f"{EMOJI['error']} У вас нет прав администратора.", show_alert=True)
@@ -2212,7 +3430,7 @@ async def use_default_message_callback(callback: CallbackQuery, state: FSMContex
         callback.message
     )
 
-@dp.callback_query(F.data == "enter_custom_msg")
+@callback_router.route(ENTER_CUSTOM_MSG)
 async def enter_custom_message_callback(callback: CallbackQuery, state: FSMContext):
     if not is_admin(callback.from_user.id):
         await callback.answer(f"{EMOJI['error']} У вас нет прав администратора.", show_alert=True)
@@ -2275,6 +3493,11 @@ async def handle_unknown_message(message: Message, state: FSMContext):
     if current_state:
         return
     
+    # Фото или документ без запроса — чек к последней заявке, если она есть
+    if (message.photo or message.document) and not is_admin(message.from_user.id):
+        if await save_receipt(message, None):
+            return
+    
     # Для неизвестных команд
     if message.text and message.text.startswith('/'):
         await message.answer(
@@ -2302,21 +3525,27 @@ async def handle_unknown_message(message: Message, state: FSMContext):
         )
 
 # Функция запуска бота
+def record_heartbeat():
+    """Отмечает, что бот работает — от этой отметки считается простой"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    deliveries.touch_last_run(cursor)
+    conn.commit()
+    conn.close()
+
+async def catch_up_reminders(missed: List[tuple]):
+    """Отправляет пропущенные за время простоя напоминания пачками"""
+    for start in range(0, len(missed), CATCHUP_BATCH_SIZE):
+        if start:
+            await asyncio.sleep(CATCHUP_BATCH_INTERVAL)
+        for user_id, admin_id, message_text, period in missed[start:start + CATCHUP_BATCH_SIZE]:
+            await send_payment_reminder(user_id, admin_id, message_text, period)
+    
+    logging.info(f"Догоняющая отправка завершена: {len(missed)} напоминаний")
+
 async def main():
-    # Настройка логирования
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.handlers.RotatingFileHandler(
-                'bot.log',
-                maxBytes=10*1024*1024,  # 10 MB
-                backupCount=5,
-                encoding='utf-8'
-            ),
-            logging.StreamHandler()
-        ]
-    )
+    # Настройка логирования (запись в фоновом потоке)
+    setup_logging('bot.log')
     
     # Инициализация базы данных
     init_db()
@@ -2328,27 +3557,69 @@ async def main():
     # Загрузка существующих задач в планировщик
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT user_id, admin_id, payment_day, payment_time, payment_message FROM user_admin_links')
-    links = cursor.fetchall()
+    links = fetch_all(cursor, 'load_reminders',
+                      'SELECT user_id, admin_id, payment_day, payment_time, payment_message FROM user_admin_links')
     conn.close()
     
-    for user_id, admin_id, day, time, message in links:
-        try:
-            hour, minute = map(int, time.split(':'))
-            scheduler.add_job(
-                send_payment_reminder,
-                CronTrigger(day=day, hour=hour, minute=minute),
-                args=[user_id, admin_id, message],
-                id=f"payment_{user_id}_{admin_id}",
-                replace_existing=True
-            )
-            logging.info(f"Загружено напоминание для пользователя {user_id} на {day} число в {time}")
-        except Exception as e:
-            logging.error(f"Ошибка загрузки напоминания для {user_id}: {e}")
+    scheduled = schedule_reminders(links)
+    logging.info(f"Загружено напоминаний: {scheduled}")
+    
+    # Напоминания, срок которых наступил, пока бот не работал
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    last_run = deliveries.get_last_run(cursor)
+    missed = deliveries.find_missed_reminders(cursor, last_run, datetime.now()) if last_run else []
+    conn.close()
+    record_heartbeat()
+    
+    scheduler.add_job(
+        record_heartbeat,
+        'interval',
+        seconds=HEARTBEAT_INTERVAL,
+        id="heartbeat",
+        replace_existing=True
+    )
+    
+    # Ежедневная сводка о недоступных пользователях
+    scheduler.add_job(
+        send_dead_chat_digest,
+        CronTrigger(hour=DEAD_CHAT_DIGEST_HOUR, minute=0),
+        id="dead_chat_digest",
+        replace_existing=True
+    )
+    
+    # Подготовка горячих слотов заранее
+    scheduler.add_job(
+        prerender_hot_slots,
+        'interval',
+        minutes=1,
+        next_run_time=datetime.now(),
+        id="prerender_slots",
+        replace_existing=True
+    )
     
     # Запуск планировщика
     scheduler.start()
     
+    # Фоновая отправка очереди сообщений
+    outbox.start(bot)
+    
+    # Фоновое удаление устаревших напоминаний
+    cleanup.start(bot)
+    
+    # Рассылки; прерванные перезапуском продолжатся с места остановки
+    broadcasts.start(bot)
+    
+    if missed:
+        logging.info(f"Пропущено за время простоя напоминаний: {len(missed)}, отправляем")
+        run_in_background(catch_up_reminders(missed))
+    
+    # Мониторинг задержек цикла событий
+    loop_monitor.start()
+    
+    # Профилирование по сигналу SIGUSR1
+    profiler.install_signal_handler()
+    
     # Настройка команд бота
     await setup_bot_commands()
     
@@ -2373,14 +3644,12 @@ async def main():
     await dp.start_polling(bot)
 
 # Обработчик кнопки быстрого добавления пользователя
-@dp.callback_query(F.data.startswith("add_new_user_"))
-async def add_new_user_callback(callback: CallbackQuery, state: FSMContext):
+@callback_router.route(ADD_NEW_USER)
+async def add_new_user_callback(callback: CallbackQuery, state: FSMContext, user_id: int):
     if not is_admin(callback.from_user.id):
         await callback.answer(f"{EMOJI['error']} У вас нет прав администратора.", show_alert=True)
         return
     
-    user_id = int(callback.data.split("_")[3])
-    
     # Проверяем что пользователь еще не добавлен
     existing_admin = get_admin_for_user(user_id)
     if existing_admin:
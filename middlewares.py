@@ -0,0 +1,40 @@
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import TelegramObject, Update
+
+import tracing
+
+class TracingMiddleware(BaseMiddleware):
+    """Открывает корневой отрезок трассы на каждое обновление"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        if isinstance(event, Update):
+            name = f"update:{event.event_type}"
+            attrs = {'update_id': event.update_id}
+        else:
+            name = f"update:{type(event).__name__}"
+            attrs = {}
+
+        with tracing.start_trace(name, **attrs):
+            return await handler(event, data)
+
+class TracingRequestMiddleware(BaseRequestMiddleware):
+    """Оборачивает каждый вызов Telegram API в дочерний отрезок"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot,
+        method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        with tracing.span(type(method).__name__, kind='api'):
+            return await make_request(bot, method)
@@ -0,0 +1,312 @@
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from aiogram.types import InlineKeyboardMarkup
+
+import queries
+from queries import execute, execute_many, fetch_all, fetch_one
+from throttle import AsyncRateLimiter
+
+# Сколько сообщений забирается из очереди за один проход
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+# Ограничение частоты отправки (сообщений в секунду, лимит Telegram ~30)
+OUTBOX_RATE = float(os.getenv("OUTBOX_RATE", "25"))
+# Число попыток, после которого сообщение уходит в outbox_dead
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+# Экспоненциальная задержка между попытками (сек)
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "2"))
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "600"))
+# Интервал проверки очереди, если никто не разбудил отправителя
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+
+# Причины, по которым чат больше не принимает сообщения
+CHAT_FORBIDDEN = 'forbidden'
+CHAT_NOT_FOUND = 'chat_not_found'
+CHAT_DEACTIVATED = 'deactivated'
+
+# Ответы BadRequest, означающие, что чата для бота больше нет. Прочие
+# BadRequest (ошибка разметки, «message is not modified» и т.п.) повторяются
+_CHAT_NOT_FOUND_ERRORS = ('chat not found', 'user not found', 'peer_id_invalid')
+
+DeliveredHandler = Callable[[Optional[int], Any], Awaitable[None]]
+DeadHandler = Callable[[Optional[int], int, Exception], Awaitable[None]]
+
+_delivered_handlers: Dict[str, DeliveredHandler] = {}
+_dead_handlers: Dict[str, DeadHandler] = {}
+_stats = {'sent': 0, 'retried': 0, 'dead': 0, 'batches': 0}
+
+_limiter = AsyncRateLimiter(OUTBOX_RATE)
+_wakeup: Optional[asyncio.Event] = None
+_drain_task: Optional[asyncio.Task] = None
+
+def create_tables(cursor: sqlite3.Cursor):
+    """Создает таблицы очереди исходящих сообщений"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            chat_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            reply_markup TEXT,
+            ref_id INTEGER,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at REAL NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_outbox_next_attempt ON outbox(next_attempt_at)')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS outbox_dead (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            chat_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            reply_markup TEXT,
+            ref_id INTEGER,
+            attempts INTEGER NOT NULL,
+            last_error TEXT,
+            created_at REAL NOT NULL,
+            failed_at REAL NOT NULL
+        )
+    ''')
+
+def enqueue(cursor: sqlite3.Cursor, kind: str, chat_id: int, text: str,
+            reply_markup: Optional[InlineKeyboardMarkup] = None, ref_id: Optional[int] = None,
+            send_at: Optional[float] = None) -> int:
+    """Ставит сообщение в очередь в транзакции вызывающего кода
+
+    Сообщение уйдет только после commit — вместе с изменением состояния,
+    которое его породило. После commit стоит вызвать wake().
+    """
+    now = time.time()
+    markup = reply_markup.model_dump_json(exclude_none=True) if reply_markup is not None else None
+    execute(cursor, 'outbox_enqueue', '''
+        INSERT INTO outbox (kind, chat_id, text, reply_markup, ref_id, next_attempt_at, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (kind, chat_id, text, markup, ref_id, send_at or now, now))
+    return cursor.lastrowid
+
+def notify(chat_id: int, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None,
+           kind: str = 'notification'):
+    """Ставит в очередь уведомление отдельной транзакцией"""
+    conn = queries.get_db_connection()
+    cursor = conn.cursor()
+    enqueue(cursor, kind, chat_id, text, reply_markup)
+    conn.commit()
+    conn.close()
+    wake()
+
+def on_delivered(kind: str):
+    """Декоратор: корутина handler(ref_id, message) после успешной отправки"""
+    def decorator(handler: DeliveredHandler):
+        _delivered_handlers[kind] = handler
+        return handler
+    return decorator
+
+def on_dead(kind: str):
+    """Декоратор: корутина handler(ref_id, chat_id, error) после окончательной неудачи
+
+    error — исключение последней попытки.
+    """
+    def decorator(handler: DeadHandler):
+        _dead_handlers[kind] = handler
+        return handler
+    return decorator
+
+def wake():
+    """Будит отправителя, не дожидаясь очередного опроса"""
+    if _wakeup is not None:
+        _wakeup.set()
+
+def classify_chat_error(error: Exception) -> Optional[str]:
+    """Причина, по которой чат недоступен навсегда, или None для прочих ошибок"""
+    text = str(error).lower()
+    if isinstance(error, TelegramForbiddenError):
+        return CHAT_DEACTIVATED if 'deactivated' in text else CHAT_FORBIDDEN
+    if isinstance(error, TelegramBadRequest) and any(reason in text for reason in _CHAT_NOT_FOUND_ERRORS):
+        return CHAT_NOT_FOUND
+    return None
+
+def is_permanent(error: Exception) -> bool:
+    """Ошибка не исправится повтором: бот заблокирован, аккаунт удален, чат не найден"""
+    return classify_chat_error(error) is not None
+
+def describe_error(error: Exception) -> str:
+    return f"{type(error).__name__}: {error}"
+
+def _backoff(attempts: int) -> float:
+    """Задержка перед следующей попыткой с небольшим случайным разбросом"""
+    delay = min(OUTBOX_BACKOFF_BASE * (2 ** (attempts - 1)), OUTBOX_BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+async def _deliver(bot, row: tuple):
+    """Отправляет одно сообщение; возвращает (row, message, error)"""
+    _, _, chat_id, text, markup, _, _ = row
+    await _limiter.acquire()
+    try:
+        message = await bot.send_message(
+            chat_id,
+            text,
+            reply_markup=InlineKeyboardMarkup.model_validate_json(markup) if markup else None,
+            parse_mode='HTML'
+        )
+        return row, message, None
+    except TelegramRetryAfter as e:
+        # Telegram просит подождать — притормаживаем всю отправку
+        _limiter.pause(e.retry_after)
+        return row, None, e
+    except Exception as e:
+        return row, None, e
+
+async def drain_once(bot) -> int:
+    """Отправляет одну пачку готовых к отправке сообщений, возвращает ее размер"""
+    now = time.time()
+    conn = queries.get_db_connection()
+    cursor = conn.cursor()
+    rows = fetch_all(cursor, 'outbox_due', '''
+        SELECT id, kind, chat_id, text, reply_markup, ref_id, attempts
+        FROM outbox WHERE next_attempt_at <= ?
+        ORDER BY next_attempt_at LIMIT ?
+    ''', (now, OUTBOX_BATCH_SIZE))
+
+    if not rows:
+        conn.close()
+        return 0
+
+    results = await asyncio.gather(*(_deliver(bot, row) for row in rows))
+
+    delivered = []
+    retries = []
+    dead = []
+    now = time.time()
+
+    for row, message, error in results:
+        row_id, kind, chat_id, _, _, ref_id, attempts = row
+        if error is None:
+            delivered.append((row_id, kind, ref_id, message))
+        elif isinstance(error, TelegramRetryAfter):
+            # Не считаем попыткой: сообщение не было отвергнуто
+            retries.append((now + error.retry_after, str(error), row_id))
+        elif is_permanent(error) or attempts + 1 >= OUTBOX_MAX_ATTEMPTS:
+            dead.append((row_id, kind, chat_id, ref_id, error))
+        else:
+            retries.append((now + _backoff(attempts + 1), describe_error(error), row_id))
+
+    # Результаты всей пачки фиксируются одной транзакцией
+    if delivered:
+        execute_many(cursor, 'outbox_delete_sent',
+                     'DELETE FROM outbox WHERE id = ?', [(item[0],) for item in delivered])
+    if retries:
+        execute_many(cursor, 'outbox_retry', '''
+            UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ?
+            WHERE id = ?
+        ''', retries)
+    if dead:
+        execute_many(cursor, 'outbox_move_dead', '''
+            INSERT OR REPLACE INTO outbox_dead
+            (id, kind, chat_id, text, reply_markup, ref_id, attempts, last_error, created_at, failed_at)
+            SELECT id, kind, chat_id, text, reply_markup, ref_id, attempts + 1, ?, created_at, ?
+            FROM outbox WHERE id = ?
+        ''', [(describe_error(item[4]), now, item[0]) for item in dead])
+        execute_many(cursor, 'outbox_delete_dead',
+                     'DELETE FROM outbox WHERE id = ?', [(item[0],) for item in dead])
+    conn.commit()
+    conn.close()
+
+    _stats['batches'] += 1
+    _stats['sent'] += len(delivered)
+    _stats['retried'] += len(retries)
+    _stats['dead'] += len(dead)
+
+    for row_id, kind, ref_id, message in delivered:
+        handler = _delivered_handlers.get(kind)
+        if handler is not None:
+            try:
+                await handler(ref_id, message)
+            except Exception as e:
+                logging.error(f"Ошибка обработки доставки сообщения {row_id} ({kind}): {e}")
+
+    for row_id, kind, chat_id, ref_id, error in dead:
+        logging.warning(f"Сообщение {row_id} ({kind}) для {chat_id} не доставлено: {describe_error(error)}")
+        handler = _dead_handlers.get(kind)
+        if handler is not None:
+            try:
+                await handler(ref_id, chat_id, error)
+            except Exception as e:
+                logging.error(f"Ошибка обработки недоставленного сообщения {row_id} ({kind}): {e}")
+
+    return len(rows)
+
+async def _drain_loop(bot):
+    """Фоновый отправитель: разбирает очередь пачками"""
+    while True:
+        try:
+            processed = await drain_once(bot)
+        except Exception as e:
+            logging.error(f"Ошибка отправки очереди сообщений: {e}")
+            processed = 0
+
+        # Полная пачка — вероятно, в очереди есть еще
+        if processed >= OUTBOX_BATCH_SIZE:
+            continue
+
+        _wakeup.clear()
+        try:
+            await asyncio.wait_for(_wakeup.wait(), OUTBOX_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+def start(bot):
+    """Запускает фоновую отправку очереди"""
+    global _drain_task, _wakeup
+
+    if _drain_task is not None:
+        return
+
+    _wakeup = asyncio.Event()
+    _drain_task = asyncio.get_running_loop().create_task(_drain_loop(bot))
+    logging.info(
+        f"Очередь сообщений запущена (пачка {OUTBOX_BATCH_SIZE}, "
+        f"до {OUTBOX_RATE:.0f} сообщений/с)"
+    )
+
+def stop():
+    """Останавливает фоновую отправку"""
+    global _drain_task
+
+    if _drain_task is not None:
+        _drain_task.cancel()
+        _drain_task = None
+
+def get_outbox_stats() -> Dict:
+    """Счетчики отправки и текущий размер очереди"""
+    conn = queries.get_db_connection()
+    cursor = conn.cursor()
+    queued, due = fetch_one(cursor, 'outbox_size', '''
+        SELECT COUNT(*), COALESCE(SUM(next_attempt_at <= ?), 0) FROM outbox
+    ''', (time.time(),))
+    dead = fetch_one(cursor, 'outbox_dead_size', 'SELECT COUNT(*) FROM outbox_dead')[0]
+    conn.close()
+
+    stats = dict(_stats)
+    stats.update({'queued': queued, 'due': due, 'dead_total': dead})
+    return stats
+
+def get_dead_letters(limit: int = 10) -> List[tuple]:
+    """Последние недоставленные сообщения"""
+    conn = queries.get_db_connection()
+    cursor = conn.cursor()
+    rows = fetch_all(cursor, 'outbox_dead_recent', '''
+        SELECT id, kind, chat_id, attempts, last_error, failed_at
+        FROM outbox_dead ORDER BY failed_at DESC LIMIT ?
+    ''', (limit,))
+    conn.close()
+    return rows
@@ -0,0 +1,101 @@
+from typing import Dict, List, Optional, Set, Tuple
+
+import deliveries
+import queries
+from payment_periods import PaymentState
+from queries import fetch_all
+
+class _Membership:
+    """Пользователи админа, разделенные на оплативших и нет"""
+    __slots__ = ('paid', 'unpaid')
+
+    def __init__(self):
+        self.paid: Set[int] = set()
+        self.unpaid: Set[int] = set()
+
+class PaidSets:
+    """Кто оплатил текущий период — по каждому администратору
+
+    Хранятся в базе (user_admin_links и payment_periods), здесь — их зеркало
+    в памяти. Множества админа загружаются одним запросом при первом обращении,
+    дальше обновляются событиями: подтверждение оплаты, привязка и отвязка.
+    Со сменой периода все множества сбрасываются.
+    """
+
+    def __init__(self):
+        self._period: Optional[str] = None
+        self._admins: Dict[int, _Membership] = {}
+        self._stats = {'loads': 0, 'hits': 0, 'resets': 0}
+
+    def _current(self, admin_id: int) -> _Membership:
+        period = deliveries.get_period()
+        if period != self._period:
+            self.reset(period)
+
+        membership = self._admins.get(admin_id)
+        if membership is None:
+            membership = self._admins[admin_id] = self._load(admin_id, period)
+            self._stats['loads'] += 1
+        else:
+            self._stats['hits'] += 1
+        return membership
+
+    def _load(self, admin_id: int, period: str) -> _Membership:
+        conn = queries.get_db_connection()
+        cursor = conn.cursor()
+        rows = fetch_all(cursor, 'paid_sets_load', '''
+            SELECT u.user_id, EXISTS (
+                SELECT 1 FROM payment_periods p
+                WHERE p.user_id = u.user_id AND p.admin_id = u.admin_id
+                  AND p.period = ? AND p.state = ?
+            )
+            FROM user_admin_links u
+            WHERE u.admin_id = ?
+        ''', (period, PaymentState.CONFIRMED, admin_id))
+        conn.close()
+
+        membership = _Membership()
+        for user_id, paid in rows:
+            (membership.paid if paid else membership.unpaid).add(user_id)
+        return membership
+
+    def get_unpaid(self, admin_id: int) -> List[int]:
+        """Не оплатившие текущий период, по возрастанию ID"""
+        return sorted(self._current(admin_id).unpaid)
+
+    def get_counts(self, admin_id: int) -> Tuple[int, int]:
+        """(оплатили, всего пользователей) за текущий период"""
+        membership = self._current(admin_id)
+        return len(membership.paid), len(membership.paid) + len(membership.unpaid)
+
+    def mark_paid(self, user_id: int, admin_id: int, period: str):
+        """Вызывается после фиксации подтверждения оплаты"""
+        if period != self._period:
+            return
+        membership = self._admins.get(admin_id)
+        if membership is not None and user_id in membership.unpaid:
+            membership.unpaid.discard(user_id)
+            membership.paid.add(user_id)
+
+    def add_member(self, user_id: int, admin_id: int):
+        """Новая привязка: оплату за период надо сверить с базой — перечитаем при обращении"""
+        self._admins.pop(admin_id, None)
+
+    def remove_member(self, user_id: int, admin_id: int):
+        membership = self._admins.get(admin_id)
+        if membership is not None:
+            membership.paid.discard(user_id)
+            membership.unpaid.discard(user_id)
+
+    def reset(self, period: Optional[str] = None):
+        """Сбрасывает все множества (смена расчетного периода)"""
+        self._period = period or deliveries.get_period()
+        self._admins.clear()
+        self._stats['resets'] += 1
+
+    def get_stats(self) -> Dict[str, int]:
+        stats = dict(self._stats)
+        stats['admins'] = len(self._admins)
+        return stats
+
+paid_sets = PaidSets()
@@ -0,0 +1,286 @@
+import sqlite3
+import time
+from enum import IntEnum
+from typing import List, Optional, Tuple
+
+from queries import add_column_if_missing, execute, execute_many, fetch_all, fetch_one, table_exists
+
+class PaymentState(IntEnum):
+    """Состояние оплаты за расчетный период"""
+    REMINDED = 0   # напоминание отправлено
+    CLAIMED = 1    # пользователь нажал «Оплатил», ждем админа
+    CONFIRMED = 2  # админ подтвердил
+    REJECTED = 3   # админ отклонил, можно заявить оплату снова
+
+def create_tables(cursor: sqlite3.Cursor):
+    """Создает состояние оплат по периодам и журнал переходов
+
+    payment_periods — текущее состояние: одна строка на (привязка, период),
+    amount — фактическая сумма платежа за период.
+    Пока по периоду висит напоминание, в строке хранятся его message_id
+    (0 — еще в outbox) и срок оплаты due_at, а пока заявка ждет решения —
+    admin_message_id уведомления с кнопками у админа. payment_ledger — неизменяемый
+    журнал всех переходов. Все времена — целые секунды эпохи.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS payment_periods (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            admin_id INTEGER NOT NULL,
+            period TEXT NOT NULL,
+            state INTEGER NOT NULL,
+            amount REAL NOT NULL DEFAULT 0,
+            message_id INTEGER,
+            admin_message_id INTEGER,
+            reminded_at INTEGER,
+            due_at INTEGER,
+            claimed_at INTEGER,
+            resolved_at INTEGER,
+            updated_at INTEGER NOT NULL,
+            UNIQUE(user_id, admin_id, period)
+        )
+    ''')
+    add_column_if_missing(cursor, 'payment_periods', 'amount', 'REAL NOT NULL DEFAULT 0')
+    add_column_if_missing(cursor, 'payment_periods', 'message_id', 'INTEGER')
+    add_column_if_missing(cursor, 'payment_periods', 'admin_message_id', 'INTEGER')
+    add_column_if_missing(cursor, 'payment_periods', 'reminded_at', 'INTEGER')
+    add_column_if_missing(cursor, 'payment_periods', 'due_at', 'INTEGER')
+
+    # Сводки админа: состояние по периодам и просрочки по сроку
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_payment_periods_admin ON payment_periods(admin_id, state, period)')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_payment_periods_due ON payment_periods(admin_id, due_at)
+        WHERE due_at IS NOT NULL
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS payment_ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            admin_id INTEGER NOT NULL,
+            period TEXT NOT NULL,
+            status INTEGER NOT NULL,
+            amount REAL NOT NULL DEFAULT 0,
+            created_at INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_payment_ledger_link ON payment_ledger(user_id, admin_id, period)')
+
+    # Журнал только дополняется
+    for action in ('UPDATE', 'DELETE'):
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS payment_ledger_no_{action.lower()}
+            BEFORE {action} ON payment_ledger
+            BEGIN SELECT RAISE(ABORT, 'payment_ledger is append-only'); END
+        ''')
+
+def _append(cursor: sqlite3.Cursor, user_id: int, admin_id: int, period: str,
+            status: PaymentState, now: int, amount: float = 0):
+    execute(cursor, 'payment_ledger_append', '''
+        INSERT INTO payment_ledger (user_id, admin_id, period, status, amount, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (user_id, admin_id, period, status, amount, now))
+
+def migrate_legacy(cursor: sqlite3.Cursor):
+    """Однократно переносит payments и pending_payments в payment_periods и журнал
+
+    Старые таблицы после переноса переименовываются в *_legacy. Даты в них —
+    строки: payment_date и created_at в UTC, due_date — в локальном времени.
+    """
+    if not table_exists(cursor, 'payments') or not table_exists(cursor, 'pending_payments'):
+        return
+
+    # Заявки и подтверждения: по одной строке на период, подтвержденная важнее
+    execute(cursor, 'migrate_payments_state', '''
+        INSERT OR IGNORE INTO payment_periods
+        (user_id, admin_id, period, state, amount, claimed_at, resolved_at, updated_at)
+        SELECT user_id, admin_id, strftime('%Y-%m', payment_date),
+               CASE WHEN confirmed THEN ? ELSE ? END, amount,
+               CAST(strftime('%s', created_at) AS INTEGER),
+               CASE WHEN confirmed THEN CAST(strftime('%s', created_at) AS INTEGER) END,
+               CAST(strftime('%s', created_at) AS INTEGER)
+        FROM payments
+        ORDER BY confirmed DESC, id DESC
+    ''', (PaymentState.CONFIRMED, PaymentState.CLAIMED))
+    execute(cursor, 'migrate_payments_claims', '''
+        INSERT INTO payment_ledger (user_id, admin_id, period, status, amount, created_at)
+        SELECT user_id, admin_id, strftime('%Y-%m', payment_date), ?, amount,
+               CAST(strftime('%s', created_at) AS INTEGER)
+        FROM payments ORDER BY id
+    ''', (PaymentState.CLAIMED,))
+    execute(cursor, 'migrate_payments_confirms', '''
+        INSERT INTO payment_ledger (user_id, admin_id, period, status, amount, created_at)
+        SELECT user_id, admin_id, strftime('%Y-%m', payment_date), ?, amount,
+               CAST(strftime('%s', created_at) AS INTEGER)
+        FROM payments WHERE confirmed ORDER BY id
+    ''', (PaymentState.CONFIRMED,))
+
+    # Висящие напоминания: message_id и срок переезжают в строку периода
+    execute(cursor, 'migrate_pending_state', '''
+        INSERT INTO payment_periods
+        (user_id, admin_id, period, state, message_id, reminded_at, due_at, updated_at)
+        SELECT user_id, admin_id, strftime('%Y-%m', created_at, 'localtime'), ?, message_id,
+               CAST(strftime('%s', created_at) AS INTEGER),
+               CAST(strftime('%s', due_date, 'utc') AS INTEGER),
+               CAST(strftime('%s', created_at) AS INTEGER)
+        FROM pending_payments WHERE TRUE
+        ORDER BY id
+        ON CONFLICT(user_id, admin_id, period) DO UPDATE
+        SET message_id = excluded.message_id, reminded_at = excluded.reminded_at,
+            due_at = CASE WHEN state = ? THEN NULL ELSE excluded.due_at END
+    ''', (PaymentState.REMINDED, PaymentState.CONFIRMED))
+    execute(cursor, 'migrate_pending_ledger', '''
+        INSERT INTO payment_ledger (user_id, admin_id, period, status, created_at)
+        SELECT user_id, admin_id, strftime('%Y-%m', created_at, 'localtime'), ?,
+               CAST(strftime('%s', created_at) AS INTEGER)
+        FROM pending_payments
+        ORDER BY id
+    ''', (PaymentState.REMINDED,))
+
+    # Неотправленные напоминания в outbox ссылались на pending_payments.id
+    execute(cursor, 'migrate_outbox_refs', '''
+        UPDATE outbox SET ref_id = (
+            SELECT pp.id FROM pending_payments p
+            JOIN payment_periods pp ON pp.user_id = p.user_id AND pp.admin_id = p.admin_id
+                 AND pp.period = strftime('%Y-%m', p.created_at, 'localtime')
+            WHERE p.id = outbox.ref_id
+        )
+        WHERE kind = 'reminder' AND ref_id IS NOT NULL
+    ''')
+
+    cursor.execute('ALTER TABLE payments RENAME TO payments_legacy')
+    cursor.execute('ALTER TABLE pending_payments RENAME TO pending_payments_legacy')
+
+def mark_reminded(cursor: sqlite3.Cursor, user_id: int, admin_id: int, period: str,
+                  due_at: int) -> int:
+    """Открывает период при постановке напоминания в очередь, возвращает id строки
+
+    message_id = 0 до фактической отправки. По уже подтвержденному периоду
+    срок оплаты не ставится.
+    """
+    now = int(time.time())
+    row_id = fetch_one(cursor, 'payment_period_remind', '''
+        INSERT INTO payment_periods
+        (user_id, admin_id, period, state, message_id, reminded_at, due_at, updated_at)
+        VALUES (?, ?, ?, ?, 0, ?, ?, ?)
+        ON CONFLICT(user_id, admin_id, period) DO UPDATE
+        SET message_id = 0, reminded_at = excluded.reminded_at, updated_at = excluded.updated_at,
+            due_at = CASE WHEN state = ? THEN NULL ELSE excluded.due_at END
+        RETURNING id
+    ''', (user_id, admin_id, period, PaymentState.REMINDED, now, due_at, now,
+          PaymentState.CONFIRMED))[0]
+    _append(cursor, user_id, admin_id, period, PaymentState.REMINDED, now)
+    return row_id
+
+def set_message(cursor: sqlite3.Cursor, row_id: int,
+                message_id: int) -> Optional[Tuple[int, int, Optional[int]]]:
+    """Запоминает отправленное напоминание; (user_id, admin_id, due_at) или None,
+    если напоминание уже снято (платеж подтвердили, пока оно ждало в очереди)"""
+    return fetch_one(cursor, 'payment_period_set_message', '''
+        UPDATE payment_periods SET message_id = ?, reminded_at = ?
+        WHERE id = ? AND message_id = 0
+        RETURNING user_id, admin_id, due_at
+    ''', (message_id, int(time.time()), row_id))
+
+def forget_message(cursor: sqlite3.Cursor, row_id: int) -> Optional[Tuple[int, int]]:
+    """Снимает недоставленное напоминание вместе со сроком оплаты"""
+    return fetch_one(cursor, 'payment_period_forget_message', '''
+        UPDATE payment_periods SET message_id = NULL, due_at = NULL
+        WHERE id = ? AND message_id IS NOT NULL
+        RETURNING user_id, admin_id
+    ''', (row_id,))
+
+def claim(cursor: sqlite3.Cursor, user_id: int, admin_id: int, period: str) -> Optional[int]:
+    """REMINDED/REJECTED -> CLAIMED одним условным UPSERT
+
+    Сумма заявки берется из ожидаемой суммы привязки (expected_amount),
+    пользователь может уточнить ее через set_amount, пока заявка ждет решения.
+    Возвращает id строки периода или None, если оплата за период уже заявлена
+    или подтверждена — повторные и одновременные нажатия ничего не меняют.
+    """
+    now = int(time.time())
+    row = fetch_one(cursor, 'payment_period_claim', '''
+        INSERT INTO payment_periods (user_id, admin_id, period, state, amount, claimed_at, updated_at)
+        VALUES (?, ?, ?, ?, COALESCE((
+            SELECT expected_amount FROM user_admin_links WHERE user_id = ? AND admin_id = ?
+        ), 0), ?, ?)
+        ON CONFLICT(user_id, admin_id, period) DO UPDATE
+        SET state = excluded.state, amount = excluded.amount,
+            claimed_at = excluded.claimed_at, updated_at = excluded.updated_at
+        WHERE payment_periods.state IN (?, ?)
+        RETURNING id, amount
+    ''', (user_id, admin_id, period, PaymentState.CLAIMED, user_id, admin_id, now, now,
+          PaymentState.REMINDED, PaymentState.REJECTED))
+    if row is None:
+        return None
+
+    row_id, amount = row
+    _append(cursor, user_id, admin_id, period, PaymentState.CLAIMED, now, amount)
+    return row_id
+
+def set_amount(cursor: sqlite3.Cursor, row_id: int, amount: float) -> bool:
+    """Фактическая сумма заявки; менять можно, только пока заявка ждет решения"""
+    row = fetch_one(cursor, 'payment_period_set_amount', '''
+        UPDATE payment_periods SET amount = ?, updated_at = ?
+        WHERE id = ? AND state = ?
+        RETURNING id
+    ''', (amount, int(time.time()), row_id, PaymentState.CLAIMED))
+    return row is not None
+
+def set_admin_message(cursor: sqlite3.Cursor, row_id: int, message_id: int):
+    """Запоминает уведомление админа о заявке (чтобы снять кнопки при массовом решении)"""
+    execute(cursor, 'payment_period_set_admin_message',
+            'UPDATE payment_periods SET admin_message_id = ? WHERE id = ? AND state = ?',
+            (message_id, row_id, PaymentState.CLAIMED))
+
+def resolve(cursor: sqlite3.Cursor, user_id: int, admin_id: int, period: Optional[str],
+            confirmed: bool) -> Optional[str]:
+    """CLAIMED -> CONFIRMED/REJECTED одним условным UPDATE
+
+    Без period (кнопки старого формата) берется последний заявленный период.
+    Возвращает период, если переход состоялся, иначе None.
+    """
+    now = int(time.time())
+    state = PaymentState.CONFIRMED if confirmed else PaymentState.REJECTED
+    if period is None:
+        row = fetch_one(cursor, 'payment_period_resolve_latest', '''
+            UPDATE payment_periods SET state = ?, resolved_at = ?, updated_at = ?
+            WHERE id = (
+                SELECT id FROM payment_periods
+                WHERE user_id = ? AND admin_id = ? AND state = ?
+                ORDER BY period DESC LIMIT 1
+            )
+            RETURNING period, amount
+        ''', (state, now, now, user_id, admin_id, PaymentState.CLAIMED))
+    else:
+        row = fetch_one(cursor, 'payment_period_resolve', '''
+            UPDATE payment_periods SET state = ?, resolved_at = ?, updated_at = ?
+            WHERE user_id = ? AND admin_id = ? AND period = ? AND state = ?
+            RETURNING period, amount
+        ''', (state, now, now, user_id, admin_id, period, PaymentState.CLAIMED))
+    if row is None:
+        return None
+
+    resolved_period, amount = row
+    _append(cursor, user_id, admin_id, resolved_period, state, now, amount)
+    return resolved_period
+
+def resolve_all(cursor: sqlite3.Cursor, admin_id: int, until: int,
+                period: Optional[str] = None) -> List[Tuple[int, str, Optional[int]]]:
+    """Подтверждает заявки админа (или только за period), поданные не позже until, одним UPDATE
+
+    Возвращает (user_id, period, admin_message_id) подтвержденных заявок.
+    """
+    now = int(time.time())
+    rows = fetch_all(cursor, 'payment_period_resolve_all', '''
+        UPDATE payment_periods SET state = ?, resolved_at = ?, updated_at = ?
+        WHERE admin_id = ? AND state = ? AND claimed_at <= ? AND (? IS NULL OR period = ?)
+        RETURNING user_id, period, admin_message_id, amount
+    ''', (PaymentState.CONFIRMED, now, now, admin_id, PaymentState.CLAIMED, until, period, period))
+
+    execute_many(cursor, 'payment_ledger_append_many', '''
+        INSERT INTO payment_ledger (user_id, admin_id, period, status, amount, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(user_id, admin_id, row_period, PaymentState.CONFIRMED, amount, now)
+          for user_id, row_period, _, amount in rows])
+    return [row[:3] for row in rows]
@@ -0,0 +1,138 @@
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import signal
+import tracemalloc
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+import tracing
+
+# Ограничение длительности профилирования
+PROFILE_MAX_SECONDS = int(os.getenv("PROFILE_MAX_SECONDS", "300"))
+# Длительность профилирования по сигналу SIGUSR1
+PROFILE_SIGNAL_SECONDS = int(os.getenv("PROFILE_SIGNAL_SECONDS", "30"))
+
+_profile_lock = asyncio.Lock()
+_profile_task: Optional[asyncio.Task] = None
+_last_snapshot: Optional[tracemalloc.Snapshot] = None
+_last_counts: Dict[str, int] = {}
+
+def is_profiling() -> bool:
+    return _profile_lock.locked() or (_profile_task is not None and not _profile_task.done())
+
+def start_profile(seconds: int, handler: Callable[[str], Awaitable[None]]) -> bool:
+    """Запускает профилирование в фоне, отчет получает корутина handler(report)
+
+    Проверка и запуск без await между ними — два одновременных запроса не
+    запустят два профиля. False, если профилирование уже идет.
+    """
+    global _profile_task
+
+    if is_profiling():
+        return False
+    _profile_task = asyncio.get_running_loop().create_task(tracing.detached(_profile(seconds, handler)))
+    return True
+
+async def _profile(seconds: int, handler: Callable[[str], Awaitable[None]]):
+    try:
+        await handler(await run_profile(seconds))
+    except Exception as e:
+        logging.error(f"Ошибка профилирования: {e}")
+
+async def run_profile(seconds: int, sort: str = 'cumulative', limit: int = 60) -> str:
+    """Профилирует цикл событий заданное время и возвращает отчет pstats"""
+    seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+
+    async with _profile_lock:
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+
+    stream = io.StringIO()
+    stream.write(f"Профиль за {seconds} с, снят {datetime.now():%d.%m.%Y %H:%M:%S}\n\n")
+    stats = pstats.Stats(profile, stream=stream)
+    stats.sort_stats(sort).print_stats(limit)
+    stats.sort_stats('tottime').print_stats(limit)
+    return stream.getvalue()
+
+def take_memory_snapshot(counts: Dict[str, int], limit: int = 25) -> str:
+    """Снимает снимок tracemalloc и сравнивает его с предыдущим
+
+    counts — размеры отслеживаемых структур (состояния FSM, задачи планировщика).
+    При первом вызове включает tracemalloc и запоминает базовый снимок.
+    """
+    global _last_snapshot, _last_counts
+
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(10)
+
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    current, peak = tracemalloc.get_traced_memory()
+
+    lines = [
+        f"Снимок памяти {datetime.now():%d.%m.%Y %H:%M:%S}",
+        f"Отслеживается: {current / 1024:.1f} КБ (пик {peak / 1024:.1f} КБ)",
+        "",
+        "Структуры:"
+    ]
+    for name, value in counts.items():
+        delta = value - _last_counts[name] if name in _last_counts else 0
+        lines.append(f"  {name}: {value} ({delta:+d})")
+
+    lines.append("")
+    if _last_snapshot is None:
+        lines.append("Базовый снимок сохранен. Повторите команду, чтобы увидеть прирост.")
+    else:
+        lines.append(f"Наибольший прирост (топ {limit}):")
+        for stat in snapshot.compare_to(_last_snapshot, 'lineno')[:limit]:
+            lines.append(f"  {stat}")
+
+    _last_snapshot = snapshot
+    _last_counts = dict(counts)
+    return '\n'.join(lines)
+
+def reset_memory_tracking():
+    """Останавливает tracemalloc и забывает базовый снимок"""
+    global _last_snapshot, _last_counts
+
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _last_snapshot = None
+    _last_counts = {}
+
+async def _save_report(report: str):
+    """Профилирование по сигналу: отчет пишется в файл рядом с ботом"""
+    path = f"profile_{datetime.now():%Y%m%d_%H%M%S}.txt"
+    await asyncio.to_thread(_write_file, path, report)
+    logging.info(f"Профиль сохранен в {path}")
+
+def _write_file(path: str, content: str):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+def install_signal_handler():
+    """Запускает профилирование по SIGUSR1 (только для Unix)"""
+    if not hasattr(signal, 'SIGUSR1'):
+        return
+
+    loop = asyncio.get_running_loop()
+
+    def handler():
+        logging.info(f"Получен SIGUSR1: профилирование на {PROFILE_SIGNAL_SECONDS} с")
+        if not start_profile(PROFILE_SIGNAL_SECONDS, _save_report):
+            logging.warning("Профилирование уже запущено, сигнал проигнорирован")
+
+    try:
+        loop.add_signal_handler(signal.SIGUSR1, handler)
+    except (NotImplementedError, RuntimeError):
+        pass
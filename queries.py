@@ -0,0 +1,130 @@
+import logging
+import os
+import sqlite3
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Путь к базе данных
+DB_PATH = 'payment_bot.db'
+
+# Порог медленного запроса в миллисекундах
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "50"))
+
+# Статистика по именованным запросам: имя -> счетчики
+_query_stats: Dict[str, Dict] = {}
+
+# Слушатели выполненных запросов: func(name, elapsed)
+_query_listeners: List[Callable[[str, float], None]] = []
+
+def get_db_connection() -> sqlite3.Connection:
+    return sqlite3.connect(DB_PATH)
+
+def _record_query(name: str, sql: str, elapsed: float, rows: int):
+    """Обновляет статистику выполнения запроса"""
+    stats = _query_stats.get(name)
+    if stats is None:
+        stats = _query_stats[name] = {
+            'sql': ' '.join(sql.split()),
+            'count': 0,
+            'total': 0.0,
+            'max': 0.0,
+            'rows': 0
+        }
+    stats['count'] += 1
+    stats['total'] += elapsed
+    stats['rows'] += rows
+    if elapsed > stats['max']:
+        stats['max'] = elapsed
+
+def _log_slow_query(cursor: sqlite3.Cursor, name: str, sql: str, params, elapsed: float):
+    """Пишет в лог медленный запрос вместе с планом выполнения"""
+    try:
+        plan = cursor.connection.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+        plan_text = '; '.join(row[-1] for row in plan)
+    except sqlite3.Error as e:
+        plan_text = f"план недоступен: {e}"
+
+    logging.warning(
+        f"Медленный запрос {name}: {elapsed * 1000:.1f} мс "
+        f"(порог {SLOW_QUERY_MS:.0f} мс). План: {plan_text}"
+    )
+
+def _run_query(cursor: sqlite3.Cursor, name: str, sql: str, params, fetch: Optional[str]):
+    """Выполняет запрос, замеряет время и обновляет статистику"""
+    started = time.perf_counter()
+    cursor.execute(sql, params)
+
+    if fetch == 'one':
+        result = cursor.fetchone()
+        rows = 1 if result is not None else 0
+    elif fetch == 'all':
+        result = cursor.fetchall()
+        rows = len(result)
+    else:
+        result = cursor
+        rows = max(cursor.rowcount, 0)
+
+    elapsed = time.perf_counter() - started
+    _record_query(name, sql, elapsed, rows)
+
+    for listener in _query_listeners:
+        listener(name, elapsed)
+
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        _log_slow_query(cursor, name, sql, params, elapsed)
+
+    return result
+
+def execute(cursor: sqlite3.Cursor, name: str, sql: str, params=()) -> sqlite3.Cursor:
+    """Выполняет именованный запрос без выборки (INSERT/UPDATE/DELETE)"""
+    return _run_query(cursor, name, sql, params, None)
+
+def execute_many(cursor: sqlite3.Cursor, name: str, sql: str, seq_of_params) -> sqlite3.Cursor:
+    """Выполняет именованный запрос для набора параметров одним вызовом executemany"""
+    started = time.perf_counter()
+    cursor.executemany(sql, seq_of_params)
+    elapsed = time.perf_counter() - started
+    _record_query(name, sql, elapsed, max(cursor.rowcount, 0))
+
+    for listener in _query_listeners:
+        listener(name, elapsed)
+
+    return cursor
+
+def fetch_one(cursor: sqlite3.Cursor, name: str, sql: str, params=()) -> Optional[tuple]:
+    """Выполняет именованный запрос и возвращает первую строку"""
+    return _run_query(cursor, name, sql, params, 'one')
+
+def fetch_all(cursor: sqlite3.Cursor, name: str, sql: str, params=()) -> List[tuple]:
+    """Выполняет именованный запрос и возвращает все строки"""
+    return _run_query(cursor, name, sql, params, 'all')
+
+def table_exists(cursor: sqlite3.Cursor, table: str) -> bool:
+    """Есть ли в базе таблица с таким именем"""
+    return cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone() is not None
+
+def add_column_if_missing(cursor: sqlite3.Cursor, table: str, column: str, definition: str):
+    """Добавляет столбец в существующую таблицу, если его еще нет"""
+    columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+def add_query_listener(listener: Callable[[str, float], None]):
+    """Регистрирует функцию, вызываемую после каждого запроса"""
+    if listener not in _query_listeners:
+        _query_listeners.append(listener)
+
+def get_query_stats() -> Dict[str, Dict]:
+    """Возвращает копию накопленной статистики запросов"""
+    return {name: dict(stats) for name, stats in _query_stats.items()}
+
+def get_top_queries(limit: int = 10) -> List[Tuple[str, Dict]]:
+    """Возвращает самые затратные запросы по суммарному времени"""
+    ranked = sorted(_query_stats.items(), key=lambda item: item[1]['total'], reverse=True)
+    return [(name, dict(stats)) for name, stats in ranked[:limit]]
+
+def reset_query_stats():
+    """Сбрасывает накопленную статистику"""
+    _query_stats.clear()
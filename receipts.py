@@ -0,0 +1,97 @@
+import sqlite3
+import time
+from typing import Optional, Tuple
+
+from payment_periods import PaymentState
+from queries import execute, fetch_one
+
+RECEIPT_PHOTO = 'photo'
+RECEIPT_DOCUMENT = 'document'
+
+def create_tables(cursor: sqlite3.Cursor):
+    """Создает таблицу чеков об оплате
+
+    Хранится только file_id из Telegram — сам файл повторно не загружается.
+    По file_unique_id (одинаков для одного и того же файла у всех ботов и
+    пользователей) повторно присланный скриншот находится одним поиском по индексу.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS receipts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            period_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            admin_id INTEGER NOT NULL,
+            period TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            file_unique_id TEXT NOT NULL,
+            duplicate_of INTEGER,
+            created_at INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_receipts_file ON receipts(file_unique_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_receipts_admin ON receipts(admin_id, id)')
+
+def find_claim(cursor: sqlite3.Cursor, user_id: int) -> Optional[Tuple[int, int, str]]:
+    """Последняя заявка пользователя, ожидающая решения: (period_id, admin_id, period)"""
+    return fetch_one(cursor, 'receipt_find_claim', '''
+        SELECT id, admin_id, period FROM payment_periods
+        WHERE user_id = ? AND state = ?
+        ORDER BY claimed_at DESC LIMIT 1
+    ''', (user_id, PaymentState.CLAIMED))
+
+def attach(cursor: sqlite3.Cursor, period_id: int, user_id: int, admin_id: int, period: str,
+           kind: str, file_id: str, file_unique_id: str) -> Optional[Tuple[Optional[int], Optional[tuple]]]:
+    """Прикрепляет чек к заявке в транзакции вызывающего кода
+
+    Возвращает (id чека, первое появление этого файла: (receipt_id, user_id, period))
+    или None, если заявка уже не ждет решения. id равен None, если этот файл
+    уже приложен к той же заявке.
+    """
+    pending = fetch_one(cursor, 'receipt_claim_pending', '''
+        SELECT 1 FROM payment_periods WHERE id = ? AND state = ?
+    ''', (period_id, PaymentState.CLAIMED))
+    if pending is None:
+        return None
+
+    earlier = fetch_one(cursor, 'receipt_by_file', '''
+        SELECT id, user_id, period, period_id FROM receipts
+        WHERE file_unique_id = ? ORDER BY id LIMIT 1
+    ''', (file_unique_id,))
+    if earlier is not None and earlier[3] == period_id:
+        return None, earlier[:3]
+
+    execute(cursor, 'receipt_insert', '''
+        INSERT INTO receipts
+        (period_id, user_id, admin_id, period, kind, file_id, file_unique_id, duplicate_of, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (period_id, user_id, admin_id, period, kind, file_id, file_unique_id,
+          earlier[0] if earlier else None, int(time.time())))
+    return cursor.lastrowid, earlier[:3] if earlier else None
+
+def get_review_item(cursor: sqlite3.Cursor, admin_id: int, receipt_id: int = 0,
+                    backwards: bool = False) -> Optional[tuple]:
+    """Соседний чек в очереди проверки (после receipt_id или перед ним)
+
+    В очереди — чеки заявок, ожидающих решения, присланные после самой заявки.
+    Возвращает (id, user_id, period, kind, file_id, created_at,
+    дубликат: user_id, дубликат: period) или None.
+    """
+    comparison, order = ('<', 'DESC') if backwards else ('>', 'ASC')
+    return fetch_one(cursor, f'receipt_review_{order.lower()}', f'''
+        SELECT r.id, r.user_id, r.period, r.kind, r.file_id, r.created_at, d.user_id, d.period
+        FROM receipts r
+        JOIN payment_periods p ON p.id = r.period_id
+        LEFT JOIN receipts d ON d.id = r.duplicate_of
+        WHERE r.admin_id = ? AND r.id {comparison} ? AND p.state = ? AND r.created_at >= p.claimed_at
+        ORDER BY r.id {order} LIMIT 1
+    ''', (admin_id, receipt_id, PaymentState.CLAIMED))
+
+def get_review_position(cursor: sqlite3.Cursor, admin_id: int, receipt_id: int) -> Tuple[int, int]:
+    """(номер чека в очереди, всего в очереди)"""
+    return fetch_one(cursor, 'receipt_review_position', '''
+        SELECT COUNT(*) FILTER (WHERE r.id <= ?), COUNT(*)
+        FROM receipts r
+        JOIN payment_periods p ON p.id = r.period_id
+        WHERE r.admin_id = ? AND p.state = ? AND r.created_at >= p.claimed_at
+    ''', (receipt_id, admin_id, PaymentState.CLAIMED))
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import os
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+import tracing
+
+# Части альбома приходят отдельными обновлениями с разницей в миллисекунды
+RELAY_ALBUM_WINDOW = float(os.getenv("RELAY_ALBUM_WINDOW", "0.5"))
+# Тексты, отправленные подряд быстрее этого интервала, уходят одним сообщением
+RELAY_TEXT_WINDOW = float(os.getenv("RELAY_TEXT_WINDOW", "1.0"))
+# Дольше этого пачка не задерживается, даже если сообщения продолжают приходить
+RELAY_MAX_DELAY = float(os.getenv("RELAY_MAX_DELAY", "3.0"))
+# Больше элементов Telegram не принимает в одном альбоме
+RELAY_MAX_ITEMS = 10
+
+FlushHandler = Callable[[List[Any]], Awaitable[None]]
+
+class _Batch:
+    __slots__ = ('items', 'flush', 'tag', 'started', 'timer')
+
+    def __init__(self, flush: FlushHandler, tag: Hashable, started: float):
+        self.items: List[Any] = []
+        self.flush = flush
+        self.tag = tag
+        self.started = started
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+class Coalescer:
+    """Копит элементы по ключу и отдает их пачкой после паузы в window секунд
+
+    Каждый новый элемент откладывает отправку, но не дальше max_delay от
+    первого элемента пачки. Полная пачка (max_items) уходит сразу, элемент с
+    другим tag закрывает текущую пачку. Пачки одного ключа отправляются строго
+    по очереди — следующая ждет завершения предыдущей.
+    """
+
+    def __init__(self, max_delay: float = RELAY_MAX_DELAY, max_items: int = RELAY_MAX_ITEMS):
+        self.max_delay = max_delay
+        self.max_items = max_items
+        self._batches: Dict[Hashable, _Batch] = {}
+        self._running: Dict[Hashable, asyncio.Task] = {}
+        self._stats = {'items': 0, 'batches': 0}
+
+    def add(self, key: Hashable, item: Any, flush: FlushHandler, window: float, tag: Hashable = None):
+        """Добавляет элемент; flush(items) первого элемента вызывается для всей пачки
+
+        window=0 — элемент уходит сразу, но после уже отложенных по этому ключу.
+        """
+        loop = asyncio.get_running_loop()
+        batch = self._batches.get(key)
+        if batch is not None and batch.tag != tag:
+            self._fire(key)
+            batch = None
+        if batch is None:
+            batch = self._batches[key] = _Batch(flush, tag, loop.time())
+        batch.items.append(item)
+        self._stats['items'] += 1
+
+        if batch.timer is not None:
+            batch.timer.cancel()
+        if window <= 0 or len(batch.items) >= self.max_items:
+            self._fire(key)
+            return
+        delay = min(window, max(batch.started + self.max_delay - loop.time(), 0))
+        batch.timer = loop.call_later(delay, self._fire, key)
+
+    async def flush(self, key: Hashable):
+        """Отправляет отложенную пачку ключа сейчас и дожидается всех его отправок"""
+        self._fire(key)
+        task = self._running.get(key)
+        if task is not None:
+            await asyncio.wait([task])
+
+    def _fire(self, key: Hashable):
+        batch = self._batches.pop(key, None)
+        if batch is None:
+            return
+        if batch.timer is not None:
+            batch.timer.cancel()
+        self._stats['batches'] += 1
+        task = asyncio.get_running_loop().create_task(
+            tracing.detached(self._run(batch, self._running.get(key)))
+        )
+        self._running[key] = task
+        task.add_done_callback(partial(self._done, key))
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        if self._running.get(key) is task:
+            del self._running[key]
+
+    async def _run(self, batch: _Batch, previous: Optional[asyncio.Task]):
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await batch.flush(batch.items)
+        except Exception as e:
+            logging.error(f"Ошибка отправки пачки сообщений: {e}")
+
+    def get_stats(self) -> Dict[str, int]:
+        stats = dict(self._stats)
+        stats['pending'] = len(self._batches) + len(self._running)
+        return stats
+
+# Одна очередь на чат: тексты, альбомы и одиночные вложения уходят в порядке получения
+chats = Coalescer()
@@ -0,0 +1,70 @@
+import sqlite3
+from typing import List, Tuple
+
+from payment_periods import PaymentState
+from queries import fetch_all, fetch_one, table_exists
+
+def create_tables(cursor: sqlite3.Cursor):
+    """Создает помесячные итоги выручки по администраторам
+
+    revenue_rollups пополняется триггером на каждое подтверждение в
+    payment_ledger — в той же транзакции, что и сам переход, поэтому итоги не
+    расходятся с журналом. Экраны выручки и отчеты за годы читают готовые
+    строки вместо суммирования платежей. Вызывать после payment_periods.create_tables.
+    """
+    backfill = not table_exists(cursor, 'revenue_rollups')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS revenue_rollups (
+            admin_id INTEGER NOT NULL,
+            period TEXT NOT NULL,
+            payments INTEGER NOT NULL DEFAULT 0,
+            amount REAL NOT NULL DEFAULT 0,
+            updated_at INTEGER NOT NULL,
+            PRIMARY KEY (admin_id, period)
+        ) WITHOUT ROWID
+    ''')
+
+    # Подтверждения, записанные в журнал до появления итогов
+    if backfill:
+        cursor.execute('''
+            INSERT INTO revenue_rollups (admin_id, period, payments, amount, updated_at)
+            SELECT admin_id, period, COUNT(*), TOTAL(amount), MAX(created_at)
+            FROM payment_ledger WHERE status = ?
+            GROUP BY admin_id, period
+        ''', (PaymentState.CONFIRMED,))
+
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS revenue_rollups_confirmed
+        AFTER INSERT ON payment_ledger
+        WHEN NEW.status = {int(PaymentState.CONFIRMED)}
+        BEGIN
+            INSERT INTO revenue_rollups (admin_id, period, payments, amount, updated_at)
+            VALUES (NEW.admin_id, NEW.period, 1, NEW.amount, NEW.created_at)
+            ON CONFLICT(admin_id, period) DO UPDATE
+            SET payments = payments + 1, amount = amount + excluded.amount,
+                updated_at = excluded.updated_at;
+        END
+    ''')
+
+def get_month(cursor: sqlite3.Cursor, admin_id: int, period: str) -> Tuple[int, float]:
+    """(подтвержденных платежей, сумма) за период"""
+    row = fetch_one(cursor, 'revenue_month', '''
+        SELECT payments, amount FROM revenue_rollups WHERE admin_id = ? AND period = ?
+    ''', (admin_id, period))
+    return row if row else (0, 0.0)
+
+def get_trend(cursor: sqlite3.Cursor, admin_id: int, months: int) -> List[Tuple[str, int, float]]:
+    """Последние months периодов с платежами: (период, платежей, сумма), от старых к новым"""
+    rows = fetch_all(cursor, 'revenue_trend', '''
+        SELECT period, payments, amount FROM revenue_rollups
+        WHERE admin_id = ?
+        ORDER BY period DESC LIMIT ?
+    ''', (admin_id, months))
+    return rows[::-1]
+
+def get_expected(cursor: sqlite3.Cursor, admin_id: int) -> Tuple[int, float]:
+    """(привязок с заданной суммой, ожидаемая сумма в месяц)"""
+    return fetch_one(cursor, 'revenue_expected', '''
+        SELECT COUNT(*) FILTER (WHERE expected_amount > 0), TOTAL(expected_amount)
+        FROM user_admin_links WHERE admin_id = ?
+    ''', (admin_id,))
@@ -0,0 +1,66 @@
+import os
+import sqlite3
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+from queries import fetch_all
+
+# Сколько напоминаний в одну минуту считается нормой; больше — слот «горячий»
+SLOT_HOT_THRESHOLD = int(os.getenv("SLOT_HOT_THRESHOLD", "50"))
+# Окно, на которое растягиваются отправки горячего слота (сек)
+SLOT_SPREAD_WINDOW = int(os.getenv("SLOT_SPREAD_WINDOW", "600"))
+# За сколько до горячего слота готовить его напоминания (сек)
+SLOT_PRERENDER_LEAD = int(os.getenv("SLOT_PRERENDER_LEAD", "300"))
+
+Slot = Tuple[int, str]
+
+def normalize_time(time_str: str) -> str:
+    """'9:00' -> '09:00'"""
+    hour, minute = map(int, time_str.split(':'))
+    return f"{hour:02d}:{minute:02d}"
+
+def get_slot_load(cursor: sqlite3.Cursor) -> Dict[Slot, int]:
+    """Число напоминаний в каждом слоте (день, ЧЧ:ММ)"""
+    load: Dict[Slot, int] = {}
+    rows = fetch_all(cursor, 'slot_load', '''
+        SELECT payment_day, payment_time, COUNT(*) FROM user_admin_links
+        WHERE delivery_status = 'active'
+        GROUP BY payment_day, payment_time
+    ''')
+    for day, time_str, count in rows:
+        slot = (day, normalize_time(time_str))
+        load[slot] = load.get(slot, 0) + count
+    return load
+
+def is_hot(count: int) -> bool:
+    return count > SLOT_HOT_THRESHOLD
+
+def jitter(user_id: int, admin_id: int, window: int = SLOT_SPREAD_WINDOW) -> int:
+    """Детерминированный сдвиг отправки (сек): один и тот же для пользователя каждый месяц"""
+    if window <= 0:
+        return 0
+    return zlib.crc32(f"{user_id}:{admin_id}".encode()) % window
+
+def upcoming_slots(now: datetime, lead: int = SLOT_PRERENDER_LEAD) -> List[Tuple[datetime, Slot]]:
+    """Слоты, которые наступят в ближайшие lead секунд, с моментом наступления"""
+    result = []
+    moment = now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    until = now + timedelta(seconds=lead)
+    while moment <= until:
+        result.append((moment, (moment.day, moment.strftime('%H:%M'))))
+        moment += timedelta(minutes=1)
+    return result
+
+def render_load_histogram(load: Dict[Slot, int], limit: int = 10, width: int = 20) -> List[str]:
+    """Строки отчета о самых загруженных слотах"""
+    if not load:
+        return []
+    ranked = sorted(load.items(), key=lambda item: item[1], reverse=True)[:limit]
+    peak = ranked[0][1]
+    lines = []
+    for (day, time_str), count in ranked:
+        bar = '█' * max(1, round(count / peak * width))
+        mark = ' 🔥' if is_hot(count) else ''
+        lines.append(f"{day:>2} число {time_str}  {bar} {count}{mark}")
+    return lines
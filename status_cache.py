@@ -0,0 +1,90 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+
+# Максимальное число карточек статуса в памяти
+STATUS_CACHE_SIZE = int(os.getenv("STATUS_CACHE_SIZE", "10000"))
+# Страховочное время жизни карточки (сек) на случай изменений в обход событий
+STATUS_CACHE_TTL = float(os.getenv("STATUS_CACHE_TTL", "600"))
+
+Key = Tuple[int, int]
+
+class StatusCache:
+    """Кэш отрисованных карточек статуса по ключу (user_id, admin_id)
+
+    Карточка администратора хранится под ключом (admin_id, admin_id).
+    Записи сбрасываются событиями (платеж, привязка, настройки), а TTL лишь
+    ограничивает устаревание при изменениях, о которых кэш не узнал.
+    """
+
+    def __init__(self, max_size: int = STATUS_CACHE_SIZE, ttl: float = STATUS_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: 'OrderedDict[Key, Tuple[float, Any]]' = OrderedDict()
+        self._by_admin: Dict[int, Set[Key]] = {}
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, user_id: int, admin_id: int) -> Optional[Any]:
+        key = (user_id, admin_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            self._stats['misses'] += 1
+            return None
+
+        expires_at, card = entry
+        if expires_at <= time.time():
+            self._drop(key)
+            self._stats['misses'] += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self._stats['hits'] += 1
+        return card
+
+    def set(self, user_id: int, admin_id: int, card: Any, expires_at: Optional[float] = None):
+        """Сохраняет карточку; expires_at — момент, когда она устареет сама (epoch)"""
+        key = (user_id, admin_id)
+        deadline = time.time() + self.ttl
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+
+        self._entries[key] = (deadline, card)
+        self._entries.move_to_end(key)
+        self._by_admin.setdefault(admin_id, set()).add(key)
+
+        while len(self._entries) > self.max_size:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+
+    def invalidate(self, user_id: int, admin_id: int):
+        """Сбрасывает карточку пользователя и сводную карточку его администратора"""
+        self._drop((user_id, admin_id))
+        self._drop((admin_id, admin_id))
+        self._stats['invalidations'] += 1
+
+    def invalidate_admin(self, admin_id: int):
+        """Сбрасывает все карточки администратора и его пользователей"""
+        for key in self._by_admin.pop(admin_id, set()):
+            self._entries.pop(key, None)
+        self._stats['invalidations'] += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._by_admin.clear()
+
+    def get_stats(self) -> Dict[str, int]:
+        stats = dict(self._stats)
+        stats['size'] = len(self._entries)
+        return stats
+
+    def _drop(self, key: Key):
+        if self._entries.pop(key, None) is None:
+            return
+        keys = self._by_admin.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_admin[key[1]]
+
+status_cache = StatusCache()
@@ -0,0 +1,222 @@
+import html
+import re
+from typing import Iterable, List, Tuple
+
+from keyboards import EMOJI
+
+# Ограничение Telegram на длину текста сообщения
+MESSAGE_LIMIT = 4096
+
+# Разделительная линия
+DIVIDER = f"{'━' * 20}\n\n"
+
+# Фрагменты, подставляемые один раз при создании шаблона
+STATIC_FRAGMENTS = {'divider': DIVIDER}
+STATIC_FRAGMENTS.update({f"e.{name}": value for name, value in EMOJI.items()})
+
+_STATIC_FIELD = re.compile(r'\{(divider|e\.\w+)\}')
+# Поле с преобразованием !h: {alias!h}
+_HTML_FIELD = re.compile(r'\{(\w+)!h\}')
+
+def _static(match: re.Match) -> str:
+    return STATIC_FRAGMENTS[match.group(1)].replace('{', '{{').replace('}', '}}')
+
+class Template:
+    """Шаблон сообщения в синтаксисе str.format
+
+    {divider} и эмодзи {e.имя} подставляются при создании шаблона.
+    Преобразование !h экранирует значение для HTML.
+    """
+    __slots__ = ('source', 'escaped')
+
+    def __init__(self, source: str):
+        self.escaped = tuple(_HTML_FIELD.findall(source))
+        self.source = _STATIC_FIELD.sub(_static, _HTML_FIELD.sub(r'{\1}', source))
+
+    def render(self, **values) -> str:
+        for name in self.escaped:
+            values[name] = html.escape(str(values[name]))
+        return self.source.format_map(values)
+
+_TAG_PATTERN = re.compile(r'<(/?)([a-zA-Z]+)[^>]*>')
+
+def _open_tags(text: str) -> List[Tuple[str, str]]:
+    """Стек незакрытых тегов в фрагменте (полные открывающие теги)"""
+    stack = []
+    for match in _TAG_PATTERN.finditer(text):
+        closing, name = match.group(1), match.group(2).lower()
+        if closing:
+            for i in range(len(stack) - 1, -1, -1):
+                if stack[i][0] == name:
+                    del stack[i]
+                    break
+        else:
+            stack.append((name, match.group(0)))
+    return stack
+
+def _safe_cut(text: str, limit: int) -> int:
+    """Позиция разреза не длиннее limit, не попадающая внутрь тега или сущности"""
+    cut = text.rfind('\n', 0, limit)
+    if cut <= 0:
+        cut = limit
+
+    tag_start = text.rfind('<', 0, cut)
+    if tag_start != -1 and text.rfind('>', tag_start, cut) == -1:
+        cut = tag_start
+
+    entity_start = text.rfind('&', max(cut - 10, 0), cut)
+    if entity_start != -1 and text.find(';', entity_start, cut) == -1:
+        cut = entity_start
+
+    return max(cut, 1)
+
+def _split_block(block: str, limit: int) -> List[str]:
+    """Делит слишком длинный фрагмент, закрывая и заново открывая теги"""
+    chunks = []
+    prefix = ''
+
+    while len(prefix) + len(block) > limit:
+        # Запас под закрывающие теги
+        room = limit - len(prefix) - 64
+        cut = _safe_cut(block, room)
+        chunk = prefix + block[:cut]
+        stack = _open_tags(chunk)
+        chunks.append(chunk + ''.join(f"</{name}>" for name, _ in reversed(stack)))
+        prefix = ''.join(tag for _, tag in stack)
+        block = block[cut:].lstrip('\n')
+
+    chunks.append(prefix + block)
+    return chunks
+
+def split_messages(blocks: Iterable[str], limit: int = MESSAGE_LIMIT) -> List[str]:
+    """Собирает фрагменты в минимальное число сообщений не длиннее limit
+
+    Каждый фрагмент должен быть HTML с закрытыми тегами; фрагменты не разрываются,
+    пока помещаются в одно сообщение целиком.
+    """
+    messages = []
+    current = []
+    size = 0
+
+    for block in blocks:
+        if len(block) > limit:
+            pieces = _split_block(block, limit)
+        else:
+            pieces = [block]
+
+        for piece in pieces:
+            if size + len(piece) > limit and current:
+                messages.append(''.join(current))
+                current = []
+                size = 0
+            current.append(piece)
+            size += len(piece)
+
+    if current:
+        messages.append(''.join(current))
+
+    return messages
+
+# Статус администратора
+ADMIN_STATUS = Template(
+    "{e.admin} <b>Ваш статус: Администратор</b>\n"
+    "{divider}"
+    "{e.user} <b>Профиль:</b>\n"
+    "• Псевдоним: <b>{alias!h}</b>\n"
+    "• Уведомления: <b>{notifications}</b>\n\n"
+    "{e.stats} <b>Статистика:</b>\n"
+    "• Пользователей: <b>{total_users}</b>\n"
+    "• Всего платежей: <b>{confirmed}</b>\n"
+    "• За текущий месяц: <b>{month_payments}</b>\n"
+)
+MONTH_AMOUNT = Template("• Сумма за месяц: <b>{amount:.2f} ₽</b>\n")
+EXPECTED_AMOUNT = Template("• Ожидается в месяц: <b>{amount:.2f} ₽</b> ({links} польз.)\n")
+ADMIN_STATUS_PENDING = Template("{divider}\n{e.loading} Ожидают подтверждения: <b>{pending}</b>\n")
+ADMIN_STATUS_OVERDUE = Template("{divider}{e.alert} Просроченных: <b>{overdue}</b>\n")
+ADMIN_STATUS_SUCCESS_RATE = Template("{divider}{e.success} Успешность платежей: <b>{rate:.1f}%</b>")
+
+# Статус пользователя
+USER_STATUS = Template(
+    "{e.user} <b>Ваш статус</b>\n"
+    "{divider}"
+    "{e.success} <b>Активный пользователь</b>\n"
+    "{e.admin} Администратор: <b>{alias!h}</b>\n\n"
+    "{e.bell} <b>График напоминаний:</b>\n"
+    "• День: <b>{day} число</b> каждого месяца\n"
+    "• Время: <b>{time}</b> (+5 МСК)\n\n"
+    "{e.money} <b>История платежей:</b>\n"
+    "• Подтверждено: <b>{confirmed}</b>\n"
+)
+USER_STATUS_PENDING = Template("• Ожидают: <b>{pending}</b>\n")
+USER_STATUS_AMOUNT = Template("• Сумма к оплате: <b>{amount:.2f} ₽</b>\n")
+USER_STATUS_LAST_PAYMENT = Template("{divider}{e.calendar} Последний платеж: <b>{days_ago} дн. назад</b>\n\n")
+USER_STATUS_NEXT_REMINDER = Template("{divider}{e.rocket} <b>Первое напоминание:</b> {next_reminder}\n\n")
+USER_STATUS_FOOTER = Template("{divider}{e.info} Используйте /start для просмотра вашего статуса.")
+USER_STATUS_UNLINKED = Template(
+    "{e.user} <b>Ваш статус</b>\n"
+    "{divider}"
+    "{e.warning} <b>Не привязан к администратору</b>\n\n"
+    "Передайте ваш ID администратору:\n"
+    "<code>{user_id}</code>"
+)
+
+# Статистика оплат
+PAYMENT_STATS = Template(
+    "{e.stats} <b>Статистика оплат</b>\n"
+    "{divider}"
+    "{e.user} <b>Пользователи:</b>\n"
+    "• Всего в системе: <b>{total_users}</b>\n\n"
+    "{e.money} <b>Платежи:</b>\n"
+    "• Всего подтверждено: <b>{confirmed}</b>\n"
+    "• Ожидают подтверждения: <b>{pending}</b>\n"
+    "• За текущий месяц: <b>{month_payments}</b>\n"
+)
+PAYMENT_STATS_OVERDUE = Template("{divider}\n{e.alert} Просроченных: <b>{overdue}</b>\n")
+PAYMENT_STATS_ANALYTICS = Template("{divider}\n{e.stats} <b>Аналитика:</b>\n")
+PAYMENT_STATS_MONTH_RATE = Template("{divider}• Оплатили в этом месяце: <b>{rate:.1f}%</b>\n")
+PAYMENT_STATS_SUCCESS_RATE = Template("{divider}• Успешность платежей: <b>{rate:.1f}%</b>\n")
+
+# Прогресс рассылки
+BROADCAST_PROGRESS = Template(
+    "{e.broadcast} <b>Рассылка: {title}</b>\n"
+    "{divider}"
+    "<code>{bar}</code> {percent:.0f}%\n\n"
+    "• Статус: <b>{status}</b>\n"
+    "• Обработано: <b>{done}</b> из {total}\n"
+    "• Доставлено: <b>{sent}</b>\n"
+    "• Не доставлено: <b>{failed}</b>\n"
+)
+
+# Выручка по месяцам
+REVENUE_HEADER = Template("{e.money} <b>Выручка по месяцам</b>\n{divider}")
+REVENUE_ROW = Template("<code>{period}</code> {bar} <b>{amount:.2f} ₽</b> ({payments})\n")
+REVENUE_YEAR = Template("<b>{year}:</b> {amount:.2f} ₽ ({payments} плат.)\n")
+REVENUE_FOOTER = Template(
+    "\n{divider}"
+    "{e.stats} Всего за {months} мес.: <b>{amount:.2f} ₽</b>\n"
+    "• В среднем за месяц: <b>{average:.2f} ₽</b>\n"
+)
+
+# Список пользователей
+USER_LIST_HEADER = Template("{e.list} <b>Ваши пользователи ({count}):</b>\n{divider}")
+USER_LIST_ITEM = Template(
+    "<b>{index}. {full_name!h}</b>\n"
+    "   @{username!h} | ID: <code>{user_id}</code>\n"
+    "   {e.calendar} {day} число, {e.clock} {time}\n\n"
+)
+
+# Напоминания
+PAYMENT_REMINDER = Template(
+    "{e.money} <b>Напоминание об оплате!</b>\n"
+    "{divider}"
+    "{message!h}\n\n"
+    "{e.admin} От: <b>{alias!h}</b>\n"
+    "{e.clock} Время: <b>{sent_at}</b> (+5 МСК)"
+)
+OVERDUE_ALERT = Template(
+    "{e.alert} <b>ПРОСРОЧКА ПЛАТЕЖА!</b>\n"
+    "{divider}"
+    "{user_info}\n\n"
+    "{e.clock} Просрочено на: <b>{days} дн.</b>\n\n"
+    "{e.info} Свяжитесь с пользователем для уточнения."
+)
@@ -0,0 +1,33 @@
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+class TextRouter:
+    """Маршрутизация нажатий reply-кнопок: текст кнопки -> обработчик
+
+    Вместо цепочки фильтров F.text == ..., которые проверяются по очереди,
+    обработчик находится одним обращением к словарю.
+    """
+
+    def __init__(self):
+        self._handlers: Dict[str, Callable[..., Awaitable[Any]]] = {}
+
+    def route(self, text: str):
+        """Декоратор: регистрирует обработчик для текста кнопки"""
+        def decorator(handler):
+            if text in self._handlers:
+                raise ValueError(f"Для кнопки '{text}' уже зарегистрирован обработчик")
+            self._handlers[text] = handler
+            return handler
+        return decorator
+
+    def can_handle(self, text: Optional[str]) -> bool:
+        return text in self._handlers
+
+    def __contains__(self, text: Optional[str]) -> bool:
+        return text in self._handlers
+
+    async def dispatch(self, message, **kwargs):
+        handler = self._handlers.get(message.text)
+        if handler is not None:
+            return await handler(message, **kwargs)
+
+text_router = TextRouter()
@@ -0,0 +1,218 @@
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Доля трассируемых обновлений (0..1)
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+# Сколько последних трасс держать в памяти
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "500"))
+# Файл для экспорта трасс в формате JSON Lines (пусто — только память)
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+
+_span_ids = itertools.count(1)
+
+class Span:
+    """Отрезок времени внутри трассы"""
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'kind', 'start', 'end', 'attrs')
+
+    def __init__(self, trace: 'Trace', name: str, kind: str, parent_id: Optional[int], attrs: Dict):
+        self.trace = trace
+        self.span_id = next(_span_ids)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = time.perf_counter()
+        self.end = None
+        self.attrs = attrs
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def to_dict(self, origin: float) -> Dict:
+        return {
+            'id': self.span_id,
+            'parent': self.parent_id,
+            'name': self.name,
+            'kind': self.kind,
+            'start_ms': round((self.start - origin) * 1000, 3),
+            'duration_ms': round(self.duration * 1000, 3),
+            'attrs': self.attrs
+        }
+
+class Trace:
+    """Набор отрезков одного обновления"""
+    __slots__ = ('trace_id', 'started_at', 'spans', 'finished')
+
+    def __init__(self):
+        self.trace_id = f"{random.getrandbits(64):016x}"
+        self.started_at = time.time()
+        self.spans: List[Span] = []
+        # Трасса уже экспортирована — новые отрезки в нее не добавляются
+        self.finished = False
+
+    def to_dict(self) -> Dict:
+        root = self.spans[0]
+        return {
+            'trace_id': self.trace_id,
+            'started_at': self.started_at,
+            'duration_ms': round(root.duration * 1000, 3),
+            'spans': [span.to_dict(root.start) for span in self.spans]
+        }
+
+# Текущий отрезок; None — обновление не попало в выборку
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar('current_span', default=None)
+
+class InMemoryExporter:
+    """Хранит последние завершенные трассы в кольцевом буфере"""
+
+    def __init__(self, size: int = TRACE_BUFFER_SIZE):
+        self.traces = deque(maxlen=size)
+
+    def export(self, trace: Dict):
+        self.traces.append(trace)
+
+class JsonlFileExporter:
+    """Дописывает трассы в файл из фонового потока"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._writer, name="trace-writer", daemon=True)
+        self._thread.start()
+
+    def export(self, trace: Dict):
+        self._queue.put(trace)
+
+    def _writer(self):
+        while True:
+            batch = [self._queue.get()]
+            while not self._queue.empty() and len(batch) < 100:
+                batch.append(self._queue.get())
+
+            with open(self.path, 'a', encoding='utf-8') as f:
+                for trace in batch:
+                    f.write(json.dumps(trace, ensure_ascii=False, default=str) + '\n')
+
+memory_exporter = InMemoryExporter()
+_exporters = [memory_exporter]
+if TRACE_FILE:
+    _exporters.append(JsonlFileExporter(TRACE_FILE))
+
+@contextmanager
+def start_trace(name: str, sample_rate: Optional[float] = None, **attrs):
+    """Открывает корневой отрезок трассы с учетом доли выборки"""
+    rate = TRACE_SAMPLE_RATE if sample_rate is None else sample_rate
+    if rate <= 0 or random.random() >= rate:
+        token = _current_span.set(None)
+        try:
+            yield None
+        finally:
+            _current_span.reset(token)
+        return
+
+    trace = Trace()
+    root = Span(trace, name, 'update', None, attrs)
+    trace.spans.append(root)
+    token = _current_span.set(root)
+    try:
+        yield root
+    finally:
+        root.end = time.perf_counter()
+        trace.finished = True
+        _current_span.reset(token)
+        exported = trace.to_dict()
+        for exporter in _exporters:
+            exporter.export(exported)
+
+@contextmanager
+def span(name: str, kind: str = 'internal', **attrs):
+    """Открывает дочерний отрезок внутри текущей трассы"""
+    parent = _current_span.get()
+    if parent is None or parent.trace.finished:
+        yield None
+        return
+
+    child = Span(parent.trace, name, kind, parent.span_id, attrs)
+    parent.trace.spans.append(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    finally:
+        child.end = time.perf_counter()
+        _current_span.reset(token)
+
+def record_span(name: str, elapsed: float, kind: str = 'internal', **attrs):
+    """Добавляет уже завершившийся отрезок (например, синхронный запрос к БД)"""
+    parent = _current_span.get()
+    if parent is None or parent.trace.finished:
+        return
+
+    child = Span(parent.trace, name, kind, parent.span_id, attrs)
+    child.end = time.perf_counter()
+    child.start = child.end - elapsed
+    parent.trace.spans.append(child)
+
+async def detached(coro):
+    """Выполняет корутину вне текущей трассы
+
+    Задача копирует контекст создавшего ее обработчика вместе с текущим
+    отрезком; фоновая работа переживает обновление, и ее отрезки попали бы в
+    уже экспортированную трассу. Оборачивайте корутину при create_task.
+    """
+    _current_span.set(None)
+    return await coro
+
+def record_db_span(name: str, elapsed: float):
+    """Слушатель слоя запросов: каждый запрос становится отрезком 'db'"""
+    record_span(name, elapsed, kind='db')
+
+def get_slowest_traces(limit: int = 5, traces=None) -> List[Dict]:
+    """Возвращает самые долгие трассы"""
+    source = memory_exporter.traces if traces is None else traces
+    return heapq.nlargest(limit, source, key=lambda trace: trace['duration_ms'])
+
+def render_waterfall(trace: Dict, width: int = 40) -> str:
+    """Рисует трассу в виде текстового водопада"""
+    total = trace['duration_ms'] or 1
+    spans = trace['spans']
+
+    depth = {}
+    for item in spans:
+        depth[item['id']] = depth.get(item['parent'], -1) + 1
+
+    lines = [f"trace {trace['trace_id']} — {trace['duration_ms']:.1f} мс"]
+    for item in sorted(spans, key=lambda s: s['start_ms']):
+        offset = min(int(item['start_ms'] / total * width), width - 1)
+        length = max(1, round(item['duration_ms'] / total * width))
+        bar = ' ' * offset + '█' * min(length, width - offset)
+        label = '  ' * depth[item['id']] + f"[{item['kind']}] {item['name']}"
+        lines.append(f"{label[:38]:<38} |{bar:<{width}}| {item['duration_ms']:8.2f} мс")
+
+    return '\n'.join(lines)
+
+def load_traces(path: str) -> List[Dict]:
+    """Читает трассы из файла JSON Lines"""
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+if __name__ == "__main__":
+    # python tracing.py traces.jsonl [N] — самые долгие трассы из файла
+    if len(sys.argv) < 2:
+        print("Использование: python tracing.py traces.jsonl [N]")
+        sys.exit(1)
+
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    for item in get_slowest_traces(count, load_traces(sys.argv[1])):
+        print(render_waterfall(item))
+        print()